@@ -1 +1,3 @@
 import test_js
+import bench_json
+import build_assets
@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+import gc
+import optparse
+import random
+import time
+
+import simplejson
+
+import openerp
+from openerp.addons.web import json_codecs
+
+def search_read_result(records):
+    """ response of a partners list view """
+    rnd = random.Random(42)
+    return {"jsonrpc": "2.0", "id": 1, "result": {"length": records, "records": [{
+        "id": i,
+        "name": u"Partner %d été %s" % (i, "x" * rnd.randint(0, 20)),
+        "display_name": u"Company, Partner %d" % i,
+        "email": "partner%d@example.com" % i,
+        "phone": "+32 81 81 37 %02d" % (i % 100),
+        "street": u"%d Chaussée de Namur" % i,
+        "city": u"Grand-Rosière",
+        "zip": "1367",
+        "country_id": [21, "Belgium"],
+        "parent_id": [1, "Company"] if i % 3 else False,
+        "category_id": range(i % 5),
+        "credit": rnd.random() * 10000,
+        "is_company": not i % 3,
+        "active": True,
+        "comment": False,
+        "write_date": "2014-01-%02d 12:34:56" % (i % 28 + 1),
+    } for i in range(records)]}}
+
+def load_request(records):
+    """ import of partners """
+    return {"jsonrpc": "2.0", "method": "call", "id": 2, "params": {
+        "model": "res.partner", "method": "load", "kwargs": {},
+        "args": [["name", "email", "city", "category_id/id"], [
+            [u"Partner %d été" % i, "partner%d@example.com" % i,
+             "Namur", "base.res_partner_category_%d" % (i % 10)]
+            for i in range(records)]],
+        "context": {"lang": "fr_FR", "tz": "Europe/Brussels", "uid": 1},
+    }}
+
+def fields_view_get_result(records):
+    """ response of a large form view """
+    fields = records // 10 or 1
+    return {"jsonrpc": "2.0", "id": 3, "result": {
+        "arch": "<form string=\"Partner\">%s</form>" % "".join(
+            "<field name=\"field_%d\" on_change=\"onchange_%d(field_%d, context)\" "
+            "attrs=\"{'invisible': [('is_company', '=', True)]}\"/>" % (i, i, i)
+            for i in range(fields)),
+        "fields": dict(("field_%d" % i, {
+            "type": "many2one", "string": u"Field %d" % i, "relation": "res.partner",
+            "selectable": True, "required": False, "readonly": False,
+            "context": {}, "domain": [["active", "=", True]], "views": {},
+        }) for i in range(fields)),
+    }}
+
+class LegacyCodec(object):
+    """ decoding as done before codecs, with a hook called for every object """
+    name = 'legacy'
+    def loads(self, payload):
+        return simplejson.loads(payload, object_hook=json_codecs.reject_nonliteral)
+    def dumps(self, obj):
+        return simplejson.dumps(obj)
+
+def best(repeat, f, *args):
+    times = []
+    # as timeit does
+    gc.disable()
+    try:
+        for _ in range(repeat):
+            start = time.time()
+            f(*args)
+            times.append(time.time() - start)
+    finally:
+        gc.enable()
+    return min(times)
+
+def bench(records, repeat):
+    codecs = [LegacyCodec()] + [
+        codec() for name, codec in sorted(json_codecs.backends.iteritems())
+        if codec.available]
+    rows = []
+    for payload in [search_read_result, load_request, fields_view_get_result]:
+        data = payload(records)
+        # as sent by browsers
+        encoded = simplejson.dumps(data, ensure_ascii=False).encode('utf-8')
+        size = len(encoded) / 1024.0 / 1024.0
+        for codec in codecs:
+            decode = best(repeat, json_codecs.loads, encoded, codec)
+            encode = best(repeat, json_codecs.dumps, data, codec)
+            rows.append((payload.__name__, size, codec.name, size / decode, size / encode))
+    return rows
+
+class BenchJson(openerp.cli.Command):
+    """ Measures the throughput of the JSON-RPC codecs on realistic payloads """
+    def run(self, args):
+        parser = optparse.OptionParser()
+        parser.add_option("-n", "--records", dest="records", type="int", default=10000,
+                          help="number of records of the payloads")
+        parser.add_option("-r", "--repeat", dest="repeat", type="int", default=5,
+                          help="number of runs, the best one is kept")
+        options, _ = parser.parse_args(args)
+
+        print "%-24s %8s %-12s %12s %12s" % ("payload", "MB", "codec", "decode MB/s", "encode MB/s")
+        for name, size, codec, decode, encode in bench(options.records, options.repeat):
+            print "%-24s %8.2f %-12s %12.1f %12.1f" % (name, size, codec, decode, encode)
+
+# vim:et:ts=4:sw=4:
@@ -0,0 +1,49 @@
+import logging
+import optparse
+
+import openerp
+from openerp.addons.web import http
+from openerp.addons.web.controllers import main
+
+_logger = logging.getLogger(__name__)
+
+class BuildAssets(openerp.cli.Command):
+    """ Builds the js, css and qweb bundles of the modules installed in a
+    database (or of a list of modules) ahead of time, so they are served as
+    is when their directory is set as the ``assets_path`` option
+    """
+    def run(self, args):
+        parser = optparse.OptionParser()
+        parser.add_option("-c", "--config", dest="config", help="specify alternate config file")
+        parser.add_option("--addons-path", dest="addons_path", help="specify additional addons paths")
+        parser.add_option("-d", "--database", dest="db_name", default=False,
+                          help="build the bundles of the modules installed in this database")
+        parser.add_option("--modules", dest="modules",
+                          help="comma separated list of modules to build the bundles of")
+        parser.add_option("-o", "--output", dest="output",
+                          help="directory of the bundles, defaults to the assets_path option")
+        options, _ = parser.parse_args(args)
+
+        server_args = []
+        if options.config:
+            server_args += ['--config', options.config]
+        if options.addons_path:
+            server_args += ['--addons-path', options.addons_path]
+        config = openerp.tools.config
+        config.parse_config(server_args)
+        output = options.output or config.get('assets_path')
+        if not output:
+            parser.error("the output directory is required, use --output or the assets_path option")
+
+        openerp.netsvc.init_alternative_logger()
+        # loads the manifests of the addons
+        http.Root()
+        if options.modules:
+            # in the order the bundles of a database list them
+            addons = main.module_boot_sort(options.modules.split(','))
+        else:
+            addons = main.module_boot(db=options.db_name)
+        for bundle in main.build_bundles(output, addons):
+            _logger.info("Built %s bundle %s (%d bytes)", bundle.type, bundle.checksum, len(bundle.content))
+
+# vim:et:ts=4:sw=4:
@@ -2,6 +2,8 @@
 
 import ast
 import base64
+import collections
+import contextlib
 import csv
 import glob
 import itertools
@@ -12,10 +14,12 @@ import hashlib
 import os
 import re
 import simplejson
+import threading
 import time
 import urllib
 import urllib2
 import urlparse
+import weakref
 import xmlrpclib
 import zlib
 from xml.etree import ElementTree
@@ -35,9 +39,12 @@ from openerp.tools.translate import _
 from openerp.tools import config
 
 from .. import http
+from .. import qweb_compiler
 
 from openerp.addons.web.http import request
 
+_logger = logging.getLogger(__name__)
+
 #----------------------------------------------------------
 # OpenERP Web helpers
 #----------------------------------------------------------
@@ -144,47 +151,69 @@ def module_topological_sort(modules):
         visit(n)
     return L
 
-def module_installed():
-    # Candidates module the current heuristic is the /static dir
-    loadable = http.addons_manifest.keys()
-    modules = {}
+def installed_modules_graph(cr, loadable):
+    """ Returns the dependencies of the installed modules among ``loadable``,
+    read in a single query
 
-    # Retrieve database installed modules
+    :rtype: dict
+    """
+    if not loadable:
+        return {}
     # TODO The following code should move to ir.module.module.list_installed_modules()
-    Modules = request.session.model('ir.module.module')
-    domain = [('state','=','installed'), ('name','in', loadable)]
-    for module in Modules.search_read(domain, ['name', 'dependencies_id']):
-        modules[module['name']] = []
-        deps = module.get('dependencies_id')
-        if deps:
-            deps_read = request.session.model('ir.module.module.dependency').read(deps, ['name'])
-            dependencies = [i['name'] for i in deps_read]
-            modules[module['name']] = dependencies
-
-    sorted_modules = module_topological_sort(modules)
-    return sorted_modules
-
-def module_installed_bypass_session(dbname):
-    loadable = http.addons_manifest.keys()
+    cr.execute("""
+        SELECT m.name, d.name
+          FROM ir_module_module m
+     LEFT JOIN ir_module_module_dependency d ON (d.module_id = m.id)
+         WHERE m.state = 'installed' AND m.name IN %s
+      ORDER BY m.id, d.id
+    """, (tuple(loadable),))
     modules = {}
-    try:
+    for module, dependency in cr.fetchall():
+        dependencies = modules.setdefault(module, [])
+        if dependency:
+            dependencies.append(dependency)
+    return modules
+
+class InstalledModulesCache(object):
+    """ The sorted web modules installed in each database.
+
+    They are kept as long as the registry of the database is not replaced,
+    which it is when modules are installed, upgraded or uninstalled (by an
+    other process too, through registry signaling).
+    """
+    def __init__(self):
+        self._cache = {}
+        self._lock = threading.Lock()
+
+    def get(self, dbname):
         registry = openerp.modules.registry.RegistryManager.get(dbname)
+        entry = self._cache.get(dbname)
+        if entry is not None and entry[0]() is registry:
+            return list(entry[1])
         with registry.cursor() as cr:
-            m = registry.get('ir.module.module')
-            # TODO The following code should move to ir.module.module.list_installed_modules()
-            domain = [('state','=','installed'), ('name','in', loadable)]
-            ids = m.search(cr, 1, [('state','=','installed'), ('name','in', loadable)])
-            for module in m.read(cr, 1, ids, ['name', 'dependencies_id']):
-                modules[module['name']] = []
-                deps = module.get('dependencies_id')
-                if deps:
-                    deps_read = registry.get('ir.module.module.dependency').read(cr, 1, deps, ['name'])
-                    dependencies = [i['name'] for i in deps_read]
-                    modules[module['name']] = dependencies
+            modules = module_topological_sort(
+                installed_modules_graph(cr, http.addons_manifest.keys()))
+        with self._lock:
+            self._cache[dbname] = (weakref.ref(registry), modules)
+        return list(modules)
+
+    def invalidate(self, dbname=None):
+        with self._lock:
+            if dbname is None:
+                self._cache.clear()
+            else:
+                self._cache.pop(dbname, None)
+
+installed_modules = InstalledModulesCache()
+
+def module_installed():
+    return installed_modules.get(request.session.db)
+
+def module_installed_bypass_session(dbname):
+    try:
+        return installed_modules.get(dbname)
     except Exception,e:
-        pass
-    sorted_modules = module_topological_sort(modules)
-    return sorted_modules
+        return []
 
 def module_boot(db=None):
     server_wide_modules = openerp.conf.server_wide_modules or ['web']
@@ -200,33 +229,23 @@ def module_boot(db=None):
     addons = serverside + dbside
     return addons
 
-def concat_xml(file_list):
-    """Concatenate xml files
-
-    :param list(str) file_list: list of files to check
-    :returns: (concatenation_result, checksum)
-    :rtype: (str, str)
+def module_boot_sort(addons):
+    """ Sorts ``addons`` as :func:`module_boot` sorts the modules of a
+    database: the server wide modules first, then the other ones after their
+    dependencies
     """
-    checksum = hashlib.new('sha1')
-    if not file_list:
-        return '', checksum.hexdigest()
-
-    root = None
-    for fname in file_list:
-        with open(fname, 'rb') as fp:
-            contents = fp.read()
-            checksum.update(contents)
-            fp.seek(0)
-            xml = ElementTree.parse(fp).getroot()
-
-        if root is None:
-            root = ElementTree.Element(xml.tag)
-        #elif root.tag != xml.tag:
-        #    raise ValueError("Root tags missmatch: %r != %r" % (root.tag, xml.tag))
-
-        for child in xml.getchildren():
-            root.append(child)
-    return ElementTree.tostring(root, 'utf-8'), checksum.hexdigest()
+    server_wide_modules = openerp.conf.server_wide_modules or ['web']
+    serverside = [i for i in server_wide_modules if i in addons]
+    dbside = module_topological_sort(dict(
+        (i, http.addons_manifest.get(i, {}).get('depends', []))
+        for i in addons if i not in serverside))
+    return serverside + dbside
+
+def read_utf8(f):
+    """ Reads a text file, without its BOM if any, as utf-8 """
+    import codecs
+    with codecs.open(f, 'rb', "utf-8-sig") as fp:
+        return fp.read().encode("utf-8")
 
 def concat_files(file_list, reader=None, intersperse=""):
     """ Concatenates contents of all provided files
@@ -242,10 +261,7 @@ def concat_files(file_list, reader=None, intersperse=""):
         return '', checksum.hexdigest()
 
     if reader is None:
-        def reader(f):
-            import codecs
-            with codecs.open(f, 'rb', "utf-8-sig") as fp:
-                return fp.read().encode("utf-8")
+        reader = read_utf8
 
     files_content = []
     for fname in file_list:
@@ -256,16 +272,59 @@ def concat_files(file_list, reader=None, intersperse=""):
     files_concat = intersperse.join(files_content)
     return files_concat, checksum.hexdigest()
 
-concat_js_cache = {}
+class MinifyCache(object):
+    """ LRU cache of minified sources, keyed by the checksum of the sources
+    and bounded to ``max_size`` bytes of minified content
+    """
+    def __init__(self, minifier, max_size=32 * 1024 * 1024, sizeof=len):
+        self.minifier = minifier
+        self.max_size = max_size
+        self.sizeof = sizeof
+        self._cache = collections.OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0}
+
+    def minify(self, source, checksum=None, *args):
+        """ Returns ``minifier(source, *args)``, ``checksum`` identifying
+        the source and the arguments if some are given
+        """
+        key = checksum or hashlib.sha1(source).hexdigest()
+        with self._lock:
+            minified = self._cache.pop(key, None)
+            if minified is not None:
+                self._cache[key] = minified
+                self.stats['hits'] += 1
+                return minified
+        minified = self.minifier(source, *args)
+        size = self.sizeof(minified)
+        with self._lock:
+            self.stats['misses'] += 1
+            if key not in self._cache and size <= self.max_size:
+                self._cache[key] = minified
+                self._size += size
+                while self._size > self.max_size:
+                    _, evicted = self._cache.popitem(last=False)
+                    self._size -= self.sizeof(evicted)
+        return minified
+
+js_minify_cache = MinifyCache(rjsmin, int(config.get('assets_minify_cache_size', 32 * 1024 * 1024)))
 
 def concat_js(file_list):
-    content, checksum = concat_files(file_list, intersperse=';')
-    if checksum in concat_js_cache:
-        content = concat_js_cache[checksum]
-    else:
-        content = rjsmin(content)
-        concat_js_cache[checksum] = content
-    return content, checksum
+    """ Concatenates and minifies js files, file by file so changing one only
+    requires minifying it again
+
+    :param list(str) file_list: list of files to check
+    :returns: (concatenation_result, checksum)
+    :rtype: (str, str)
+    """
+    checksum = hashlib.new('sha1')
+    files_content = []
+    for fname in file_list:
+        contents = read_utf8(fname)
+        checksum.update(contents)
+        files_content.append(js_minify_cache.minify(contents))
+    return ';'.join(files_content), checksum.hexdigest()
 
 def fs2web(path):
     """convert FS path into web path"""
@@ -298,14 +357,9 @@ def manifest_list(extension, mods=None, db=None, debug=False):
     mods: a comma separated string listing modules
     db: a database name (return all installed modules in that database)
     """
-    files = manifest_glob(extension, addons=mods, db=db, include_remotes=True)
+    files = manifest_glob(BUNDLE_SOURCES[extension], addons=mods, db=db, include_remotes=True)
     if not debug:
-        path = '/web/webclient/' + extension
-        if mods is not None:
-            path += '?' + urllib.urlencode({'mods': mods})
-        elif db:
-            path += '?' + urllib.urlencode({'db': db})
-
+        path = bundle_url(bundles.get(extension, mods, db), mods, db)
         remotes = [wp for fp, wp in files if fp is None]
         return [path] + remotes
     return [wp for _fp, wp in files]
@@ -346,6 +400,459 @@ def make_conditional(response, last_modified=None, etag=None):
         response.set_etag(etag)
     return response.make_conditional(request.httprequest)
 
+rx_css_import = re.compile(r"""@import\s+('|")(?!'|"|/|https?://)""", re.U)
+rx_css_url = re.compile(r"""url\s*\(\s*('|"|)(?!'|"|/|https?://|data:)""", re.U)
+rx_css_charset = re.compile("(@charset.+;$)", re.M)
+rx_css_import_rule = re.compile("(@import.+;$)", re.M)
+rx_css_strings = re.compile(r"""("(?:[^"\\\n]|\\.)*"|'(?:[^'\\\n]|\\.)*')""")
+# strings are matched too, to leave the "/*" they may contain alone
+rx_css_comment = re.compile(rx_css_strings.pattern + r"|/\*.*?\*/", re.S)
+
+def cssmin(style):
+    """ Removes the comments and the needless whitespace of a stylesheet,
+    strings excepted. Spaces before colons are kept, ``a :hover`` and
+    ``a:hover`` being different selectors.
+    """
+    style = rx_css_comment.sub(lambda m: m.group(1) or ' ', style)
+    parts = rx_css_strings.split(style)
+    for index in range(0, len(parts), 2):
+        part = re.sub(r'\s+', ' ', parts[index])
+        part = re.sub(r' ?([{};,>]) ?', r'\1', part)
+        part = re.sub(r': ', ':', part)
+        parts[index] = part.replace(';}', '}')
+    return ''.join(parts).strip()
+
+def css_rewrite(source, web_dir, minify=False):
+    """ Makes the relative uris of a stylesheet absolute and splits out its
+    @charset and @import rules, to be moved to the top of the bundle
+
+    :param str source: utf-8 content of the stylesheet
+    :param str web_dir: web path of the directory of the stylesheet
+    :param bool minify: minifies the stylesheet too
+    :returns: (charset_rules, import_rules, content)
+    :rtype: (list(str), list(str), str)
+    """
+    data = source.decode('utf-8')
+    data = rx_css_import.sub(r"""@import \1%s/""" % (web_dir,), data)
+    data = rx_css_url.sub(r"url(\1%s/" % (web_dir,), data)
+
+    charsets, imports = [], []
+    data = rx_css_charset.sub(lambda m: charsets.append(m.group(0)) or '', data)
+    data = rx_css_import_rule.sub(lambda m: imports.append(m.group(0)) or '', data)
+    if minify:
+        data = cssmin(data)
+    return ([r.encode('utf-8') for r in charsets],
+            [r.encode('utf-8') for r in imports],
+            data.encode('utf-8'))
+
+css_rewrite_cache = MinifyCache(
+    css_rewrite, int(config.get('assets_minify_cache_size', 32 * 1024 * 1024)),
+    sizeof=lambda rewritten: len(rewritten[2]))
+css_minify = config.get('assets_minify_css', True)
+
+def concat_css(files):
+    """ Concatenates css files, making their relative uris absolute and
+    moving up all their @import and @charset rules to the top.
+
+    Files are rewritten, and minified unless the ``assets_minify_css`` option
+    is disabled, one at a time so changing one only requires rewriting it
+    again.
+
+    :param list((str, str)) files: paths and web paths of the files
+    :returns: (concatenation_result, checksum)
+    :rtype: (str, str)
+    """
+    charsets, imports, contents = [], [], []
+    for path, web_path in files:
+        source = read_utf8(path)
+        web_dir = os.path.dirname(web_path)
+        key = hashlib.sha1('%s\0%s\0%s' % (web_dir, css_minify, source)).hexdigest()
+        file_charsets, file_imports, content = css_rewrite_cache.minify(
+            source, key, web_dir, css_minify)
+        charsets.extend(file_charsets)
+        imports.extend(file_imports)
+        contents.append(content)
+    # of the whole bundle, the rules moved up included
+    content = '\n'.join(charsets + imports + [''.join(contents)])
+    return content, hashlib.sha1(content).hexdigest()
+
+QWEB_PRESERVED_TAGS = frozenset(['pre', 'textarea', 'script', 'style'])
+XML_SPACE = '{http://www.w3.org/XML/1998/namespace}space'
+rx_xml_whitespace = re.compile(r'[ \t\r\n]+')
+
+def qweb_preserves_whitespace(element):
+    """ Whether the whitespace of ``element`` matters: in preformatted
+    elements, in the javascript of t-js and t-jquery directives and in the
+    values given by the body of t-set directives
+    """
+    attrib = element.attrib
+    return element.tag in QWEB_PRESERVED_TAGS \
+        or attrib.get(XML_SPACE) == 'preserve' \
+        or 't-js' in attrib \
+        or ('t-set' in attrib and 't-value' not in attrib) \
+        or ('t-jquery' in attrib and 't-operation' not in attrib)
+
+def qweb_collapse_whitespace(element):
+    """ Collapses the whitespace runs of a template to single spaces, which
+    renders the same in html. Whitespace-only text is kept as a space as it
+    still keeps elements from being rendered as self-closing tags.
+    """
+    stack = [element]
+    while stack:
+        node = stack.pop()
+        if qweb_preserves_whitespace(node):
+            continue
+        if node.text:
+            node.text = rx_xml_whitespace.sub(' ', node.text)
+        for child in node:
+            if child.tail:
+                child.tail = rx_xml_whitespace.sub(' ', child.tail)
+            stack.append(child)
+
+def qweb_templates(source, minify=False):
+    """ Parses a templates file and serializes its templates
+
+    :param str source: content of the file
+    :param bool minify: collapses the whitespace of the templates
+    :returns: (root_tag, templates)
+    :rtype: (str, str)
+    """
+    xml = ElementTree.fromstring(source)
+    # the templates inherit the xml:space of their root
+    minify = minify and not qweb_preserves_whitespace(xml)
+    templates = []
+    for child in xml:
+        if minify:
+            qweb_collapse_whitespace(child)
+            if child.tail and not child.tail.strip():
+                child.tail = None
+        templates.append(ElementTree.tostring(child, 'utf-8'))
+    return xml.tag, ''.join(templates)
+
+qweb_templates_cache = MinifyCache(
+    qweb_templates, int(config.get('assets_minify_cache_size', 32 * 1024 * 1024)),
+    sizeof=lambda parsed: len(parsed[1]))
+qweb_minify = config.get('assets_minify_qweb', True)
+# the web client is given the templates compiled, see qweb_compiler
+qweb_precompile = config.get('assets_precompile_qweb', True)
+
+def concat_xml(file_list):
+    """ Concatenates the templates of xml files, parsing them one at a time so
+    changing one only requires parsing it again. Their whitespace is
+    collapsed unless the ``assets_minify_qweb`` option is disabled, or their
+    file's root sets ``xml:space="preserve"``.
+
+    :param list(str) file_list: list of files to check
+    :returns: (concatenation_result, checksum)
+    :rtype: (str, str)
+    """
+    checksum = hashlib.new('sha1')
+    if not file_list:
+        return '', checksum.hexdigest()
+
+    root = None
+    contents = []
+    for fname in file_list:
+        with open(fname, 'rb') as fp:
+            source = fp.read()
+        key = hashlib.sha1('%s\0%s' % (qweb_minify, source)).hexdigest()
+        tag, templates = qweb_templates_cache.minify(source, key, qweb_minify)
+        checksum.update(templates)
+        if root is None:
+            root = tag
+        contents.append(templates)
+    return '<%s>%s</%s>' % (root, ''.join(contents), root), checksum.hexdigest()
+
+class Bundle(object):
+    """ The concatenated js, css or qweb files of a set of addons
+
+    .. attribute:: files
+
+        the ``(path, web path)`` of the files of the bundle, as returned by
+        :func:`manifest_glob`
+
+    .. attribute:: mtimes
+
+        the modification time of each file when the bundle was built
+    """
+    def __init__(self, type, addons, files, mtimes, content, checksum):
+        self.type = type
+        self.addons = addons
+        self.files = files
+        self.mtimes = mtimes
+        self.content = content
+        self.checksum = checksum
+        if mtimes:
+            self.last_modified = datetime.datetime.fromtimestamp(max(mtimes.itervalues()))
+        else:
+            self.last_modified = datetime.datetime(1970, 1, 1)
+        self.checked = time.time()
+        # built by the build_assets command, served as is
+        self.prebuilt = False
+        # compressed contents by encoding
+        self.precompressed = {}
+
+    def compress(self):
+        """ Compresses the content once with each of the available
+        ``BUNDLE_ENCODINGS``, at the best level, so it is never compressed
+        when served
+        """
+        compressor = http.ResponseCompressor()
+        for encoding in BUNDLE_ENCODINGS:
+            if encoding == 'br' and http.brotli is None:
+                continue
+            compress, flush = compressor.compressor(encoding, best=True)
+            self.precompressed[encoding] = compress(self.content) + flush()
+
+# the manifest entries listing the files of each type of bundle
+BUNDLE_SOURCES = {'js': 'js', 'css': 'css', 'qweb': 'qweb', 'qwebjs': 'qweb'}
+BUNDLE_EXTENSIONS = {'js': 'js', 'css': 'css', 'qweb': 'xml', 'qwebjs': 'js'}
+BUNDLE_ENCODINGS = {'gzip': '.gz', 'br': '.br'}
+
+def prebuilt_bundle_path(path, type, checksum):
+    """ Path of the bundle written by the build_assets command in ``path``,
+    the compressed versions are next to it with the suffixes of
+    ``BUNDLE_ENCODINGS``
+    """
+    return os.path.join(path, type, '%s.%s' % (checksum, BUNDLE_EXTENSIONS[type]))
+
+class BundleManager(object):
+    """ Builds the asset bundles of the web client once and keeps them in
+    memory, so serving a bundle does no file I/O.
+
+    A bundle is checked for changes (files added, removed or modified) at most
+    every ``check_interval`` seconds, by globbing the manifests of its addons
+    again and comparing the modification times of its files. A negative
+    interval disables the checks.
+
+    Up to ``max_entries`` bundles are kept, the least recently built or
+    checked ones are dropped first.
+
+    A bundle is built or checked holding a lock of its own, so other bundles
+    can be served, checked or built meanwhile. At most ``max_builds`` bundles
+    are built at once, the addons of a bundle coming from unauthenticated
+    requests.
+
+    Bundles are compressed once built (see :meth:`Bundle.compress`). The
+    bundles prebuilt in ``prebuilt_path`` by the ``build_assets`` command
+    (listed in its ``bundles.json`` index) are loaded along with their
+    compressed versions rather than built, and never checked. They are
+    looked up by type and set of addons, whatever the order of the addons.
+    """
+    def __init__(self, check_interval=2, max_entries=64, prebuilt_path=None, max_builds=2):
+        self.check_interval = check_interval
+        self.max_entries = max_entries
+        self._bundles = collections.OrderedDict()
+        self._lock = threading.Lock()
+        # bundle key: [lock, number of threads using it]
+        self._key_locks = {}
+        self._builds = threading.Semaphore(max_builds)
+        self.stats = {'hits': 0, 'checks': 0, 'builds': 0}
+        self.prebuilt_path = prebuilt_path
+        self.prebuilt = {}
+        index = prebuilt_path and os.path.join(prebuilt_path, 'bundles.json')
+        if index and os.path.isfile(index):
+            with open(index, 'rb') as f:
+                for entry in simplejson.load(f):
+                    self.prebuilt[self._prebuilt_key(entry['type'], entry['addons'])] = entry['checksum']
+
+    @staticmethod
+    def _prebuilt_key(type, addons):
+        # the order of the addons depends on how they were listed
+        return type, tuple(sorted(addons))
+
+    def get(self, type, mods=None, db=None):
+        """ Returns the ``type`` bundle of the addons ``mods`` (comma
+        separated), or of the addons installed in ``db``
+        """
+        addons = mods.split(',') if mods is not None else module_boot(db=db)
+        # unknown and repeated addons would only make different keys
+        seen = set()
+        addons = [addon for addon in addons if addon in http.addons_manifest
+                  and not (addon in seen or seen.add(addon))]
+        key = (type, tuple(addons))
+        bundle = self._bundles.get(key)
+        if bundle is not None and not self._expired(bundle):
+            self.stats['hits'] += 1
+            return bundle
+
+        with self._locked(key):
+            bundle = self._bundles.get(key)
+            if bundle is not None and not self._expired(bundle):
+                # built or checked by an other thread meanwhile
+                return bundle
+            if bundle is not None:
+                self.stats['checks'] += 1
+                if self._changed(bundle):
+                    bundle = None
+                else:
+                    bundle.checked = time.time()
+            if bundle is None:
+                bundle = self.load_prebuilt(*key)
+            if bundle is None and self.prebuilt:
+                _logger.warning("No bundle prebuilt in %s for the %s bundle of %s, building it",
+                                self.prebuilt_path, type, ','.join(addons))
+            if bundle is None:
+                with self._builds:
+                    self.stats['builds'] += 1
+                    bundle = self.build(*key)
+            with self._lock:
+                self._bundles.pop(key, None)
+                self._bundles[key] = bundle
+                while len(self._bundles) > self.max_entries:
+                    self._bundles.popitem(last=False)
+        return bundle
+
+    @contextlib.contextmanager
+    def _locked(self, key):
+        """ Holds the lock of the bundle ``key`` """
+        with self._lock:
+            entry = self._key_locks.get(key)
+            if entry is None:
+                entry = self._key_locks[key] = [threading.Lock(), 0]
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._lock:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._key_locks[key]
+
+    def _expired(self, bundle):
+        return not bundle.prebuilt and self.check_interval >= 0 and \
+            time.time() - bundle.checked >= self.check_interval
+
+    def _changed(self, bundle):
+        if manifest_glob(BUNDLE_SOURCES[bundle.type], addons=','.join(bundle.addons)) != bundle.files:
+            return True
+        try:
+            return any(os.path.getmtime(path) != mtime
+                       for path, mtime in bundle.mtimes.iteritems())
+        except OSError:
+            return True
+
+    def build(self, type, addons):
+        files = manifest_glob(BUNDLE_SOURCES[type], addons=','.join(addons))
+        # before reading the files, so changes made meanwhile are detected
+        mtimes = dict((path, os.path.getmtime(path)) for path, _ in files)
+        if type == 'css':
+            content, checksum = concat_css(files)
+        elif type == 'js':
+            content, checksum = concat_js([path for path, _ in files])
+        elif type == 'qwebjs':
+            content = qweb_compiler.compile_templates(concat_xml([path for path, _ in files])[0])
+            checksum = hashlib.sha1(content).hexdigest()
+        else:
+            content, checksum = concat_xml([path for path, _ in files])
+        bundle = Bundle(type, addons, files, mtimes, content, checksum)
+        bundle.compress()
+        return bundle
+
+    def load_prebuilt(self, type, addons):
+        checksum = self.prebuilt.get(self._prebuilt_key(type, addons))
+        if checksum is None:
+            return None
+        path = prebuilt_bundle_path(self.prebuilt_path, type, checksum)
+        try:
+            with open(path, 'rb') as f:
+                bundle = Bundle(type, addons, [], {}, f.read(), checksum)
+            for encoding, suffix in BUNDLE_ENCODINGS.iteritems():
+                if os.path.isfile(path + suffix):
+                    with open(path + suffix, 'rb') as f:
+                        bundle.precompressed[encoding] = f.read()
+        except IOError:
+            _logger.warning("Could not load prebuilt bundle %s", path, exc_info=True)
+            return None
+        bundle.prebuilt = True
+        return bundle
+
+    def clear(self):
+        with self._lock:
+            self._bundles.clear()
+
+bundles = BundleManager(check_interval=float(config.get('assets_check_interval', 2)),
+                        prebuilt_path=config.get('assets_path'),
+                        max_builds=int(config.get('assets_max_builds', 2)))
+
+def warmup_bundles(db):
+    """ Builds the bundles the web client of ``db`` loads first """
+    for type in ('css', 'js', 'qwebjs' if qweb_precompile else 'qweb'):
+        bundles.get(type, db=db)
+
+http.warmup_tasks.append(warmup_bundles)
+
+def build_bundles(path, addons, types=('js', 'css', 'qweb', 'qwebjs')):
+    """ Builds the bundles of ``addons`` and writes them, compressed with all
+    the available encodings too, in ``path`` to be served by a
+    :class:`BundleManager` using it as ``prebuilt_path``
+
+    :returns: the bundles
+    """
+    addons = tuple(addon for addon in addons if addon in http.addons_manifest)
+    index_path = os.path.join(path, 'bundles.json')
+    index = []
+    if os.path.isfile(index_path):
+        with open(index_path, 'rb') as f:
+            index = simplejson.load(f)
+
+    manager = BundleManager()
+    built = []
+    for type in types:
+        bundle = manager.build(type, addons)
+        bundle_path = prebuilt_bundle_path(path, type, bundle.checksum)
+        if not os.path.isdir(os.path.dirname(bundle_path)):
+            os.makedirs(os.path.dirname(bundle_path))
+        with open(bundle_path, 'wb') as f:
+            f.write(bundle.content)
+        for encoding, content in bundle.precompressed.iteritems():
+            with open(bundle_path + BUNDLE_ENCODINGS[encoding], 'wb') as f:
+                f.write(content)
+        key = BundleManager._prebuilt_key(type, addons)
+        index = [entry for entry in index
+                 if BundleManager._prebuilt_key(entry['type'], entry['addons']) != key]
+        index.append({'type': type, 'addons': list(addons), 'checksum': bundle.checksum})
+        built.append(bundle)
+
+    with open(index_path + '.tmp', 'wb') as f:
+        simplejson.dump(index, f, indent=1)
+    os.rename(index_path + '.tmp', index_path)
+    return built
+
+def bundle_url(bundle, mods=None, db=None):
+    """ Returns the fingerprinted url of ``bundle``, which changes along
+    with its content
+    """
+    path = '/web/webclient/%s/%s' % (bundle.type, bundle.checksum)
+    if mods is not None:
+        path += '?' + urllib.urlencode({'mods': mods})
+    elif db:
+        path += '?' + urllib.urlencode({'db': db})
+    return path
+
+def bundle_response(bundle, mimetype, checksum=None, mods=None, db=None):
+    """ Serves ``bundle`` if it is requested through its current fingerprinted
+    url (``checksum`` matches its content), as it never changes it can then be
+    cached for good. Otherwise redirects to that url.
+    """
+    if checksum != bundle.checksum:
+        return werkzeug.utils.redirect(bundle_url(bundle, mods, db), 302)
+
+    response = request.make_response(bundle.content, [
+        ('Content-Type', mimetype),
+        ('Cache-Control', 'public, max-age=%d, immutable' % (365 * 24 * 60 * 60)),
+    ])
+    compressor = request.httprequest.app.compressor
+    if bundle.precompressed and mimetype in compressor.types:
+        response.vary.add('Accept-Encoding')
+        encoding = compressor.negotiate(request.httprequest)
+        if encoding in bundle.precompressed:
+            response.set_data(bundle.precompressed[encoding])
+            response.headers['Content-Encoding'] = encoding
+    response.set_etag(bundle.checksum)
+    return response.make_conditional(request.httprequest)
+
 def login_and_redirect(db, login, key, redirect_url='/'):
     request.session.authenticate(db, login, key)
     return set_cookie_and_redirect(redirect_url)
@@ -583,84 +1090,70 @@ class WebClient(http.Controller):
 
     @http.route('/web/webclient/qweblist', type='json', auth="none")
     def qweblist(self, mods=None):
-        return manifest_list('qweb', mods=mods)
-
-    @http.route('/web/webclient/css', type='http', auth="none")
-    def css(self, mods=None, db=None):
-        files = list(manifest_glob('css', addons=mods, db=db))
-        last_modified = get_last_modified(f[0] for f in files)
-        if request.httprequest.if_modified_since and request.httprequest.if_modified_since >= last_modified:
-            return werkzeug.wrappers.Response(status=304)
-
-        file_map = dict(files)
-
-        rx_import = re.compile(r"""@import\s+('|")(?!'|"|/|https?://)""", re.U)
-        rx_url = re.compile(r"""url\s*\(\s*('|"|)(?!'|"|/|https?://|data:)""", re.U)
-
-        def reader(f):
-            """read the a css file and absolutify all relative uris"""
-            with open(f, 'rb') as fp:
-                data = fp.read().decode('utf-8')
-
-            path = file_map[f]
-            web_dir = os.path.dirname(path)
-
-            data = re.sub(
-                rx_import,
-                r"""@import \1%s/""" % (web_dir,),
-                data,
-            )
-
-            data = re.sub(
-                rx_url,
-                r"url(\1%s/" % (web_dir,),
-                data,
-            )
-            return data.encode('utf-8')
-
-        content, checksum = concat_files((f[0] for f in files), reader)
-
-        # move up all @import and @charset rules to the top
-        matches = []
-        def push(matchobj):
-            matches.append(matchobj.group(0))
-            return ''
-
-        content = re.sub(re.compile("(@charset.+;$)", re.M), push, content)
-        content = re.sub(re.compile("(@import.+;$)", re.M), push, content)
-
-        matches.append(content)
-        content = '\n'.join(matches)
-
-        return make_conditional(
-            request.make_response(content, [('Content-Type', 'text/css')]),
-            last_modified, checksum)
-
-    @http.route('/web/webclient/js', type='http', auth="none")
-    def js(self, mods=None, db=None):
-        files = [f[0] for f in manifest_glob('js', addons=mods, db=db)]
-        last_modified = get_last_modified(files)
-        if request.httprequest.if_modified_since and request.httprequest.if_modified_since >= last_modified:
-            return werkzeug.wrappers.Response(status=304)
-
-        content, checksum = concat_js(files)
+        return manifest_list('qwebjs' if qweb_precompile else 'qweb', mods=mods)
+
+    @http.route('/web/webclient/bootstrap', type='json', auth="none")
+    def bootstrap(self, mods, db=None, translations=None):
+        """ Returns what the web client loads when starting, in a single
+        request:
+
+        * ``session``: the session info, as ``/web/session/get_session_info``
+        * ``qweb``: the templates of ``mods``, the modules the client was
+          served with
+        * ``modules``: the installed modules, if the session is valid (for
+          ``db`` if provided), else ``None``
+        * ``assets``: the ``css``, ``qweb`` and ``js`` files of the installed
+          modules not in ``mods``
+        * ``translations``: the translations of the modules in the language
+          of the user, or of the bootstrap modules in the language of the
+          browser if the session is not valid, with their ``digest``. Only
+          the digest is returned if it is ``translations``, the digest of the
+          translations the client kept.
+        """
+        session = Session().get_session_info()
+        result = {
+            'session': session,
+            'qweb': self.qweblist(','.join(mods)),
+            'modules': None,
+            'assets': {},
+        }
+        if session['uid'] and (not db or db == session['db']):
+            result['modules'] = installed = module_installed()
+            to_load = ','.join(module for module in installed if module not in mods)
+            if to_load:
+                result['assets'] = {
+                    'css': self.csslist(to_load),
+                    'qweb': self.qweblist(to_load),
+                    'js': self.jslist(to_load),
+                }
+            request.uid = openerp.SUPERUSER_ID
+            bundle = self.translations(mods=list(set(mods) | set(installed)),
+                                       lang=session['user_context'].get('lang'))
+        else:
+            bundle = self.bootstrap_translations(mods)
+        digest = hashlib.sha1(simplejson.dumps(bundle, sort_keys=True)).hexdigest()
+        if translations == digest:
+            result['translations'] = {'digest': digest}
+        else:
+            result['translations'] = dict(bundle, digest=digest)
+        return result
 
-        return make_conditional(
-            request.make_response(content, [('Content-Type', 'application/javascript')]),
-            last_modified, checksum)
+    # the urls without checksum redirect to the current fingerprinted ones
+    @http.route(['/web/webclient/css', '/web/webclient/css/<string:checksum>'], type='http', auth="none")
+    def css(self, mods=None, db=None, checksum=None):
+        return bundle_response(bundles.get('css', mods, db), 'text/css', checksum, mods, db)
 
-    @http.route('/web/webclient/qweb', type='http', auth="none")
-    def qweb(self, mods=None, db=None):
-        files = [f[0] for f in manifest_glob('qweb', addons=mods, db=db)]
-        last_modified = get_last_modified(files)
-        if request.httprequest.if_modified_since and request.httprequest.if_modified_since >= last_modified:
-            return werkzeug.wrappers.Response(status=304)
+    @http.route(['/web/webclient/js', '/web/webclient/js/<string:checksum>'], type='http', auth="none")
+    def js(self, mods=None, db=None, checksum=None):
+        return bundle_response(bundles.get('js', mods, db), 'application/javascript', checksum, mods, db)
 
-        content, checksum = concat_xml(files)
+    @http.route(['/web/webclient/qweb', '/web/webclient/qweb/<string:checksum>'], type='http', auth="none")
+    def qweb(self, mods=None, db=None, checksum=None):
+        return bundle_response(bundles.get('qweb', mods, db), 'text/xml', checksum, mods, db)
 
-        return make_conditional(
-            request.make_response(content, [('Content-Type', 'text/xml')]),
-            last_modified, checksum)
+    @http.route(['/web/webclient/qwebjs', '/web/webclient/qwebjs/<string:checksum>'], type='http', auth="none")
+    def qwebjs(self, mods=None, db=None, checksum=None):
+        return bundle_response(bundles.get('qwebjs', mods, db), 'application/javascript', checksum, mods, db)
 
     @http.route('/web/webclient/bootstrap_translations', type='json', auth="none")
     def bootstrap_translations(self, mods):
@@ -753,12 +1246,15 @@ class Database(http.Controller):
     @http.route('/web/database/create', type='json', auth="none")
     def create(self, fields):
         params = dict(map(operator.itemgetter('name', 'value'), fields))
-        return request.session.proxy("db").create_database(
-            params['super_admin_pwd'],
-            params['db_name'],
-            bool(params.get('demo_data')),
-            params['db_lang'],
-            params['create_admin_pwd'])
+        try:
+            return request.session.proxy("db").create_database(
+                params['super_admin_pwd'],
+                params['db_name'],
+                bool(params.get('demo_data')),
+                params['db_lang'],
+                params['create_admin_pwd'])
+        finally:
+            http.db_list_cache.clear()
 
     @http.route('/web/database/duplicate', type='json', auth="none")
     def duplicate(self, fields):
@@ -769,7 +1265,10 @@ class Database(http.Controller):
             params['db_name'],
         )
 
-        return request.session.proxy("db").duplicate_database(*duplicate_attrs)
+        try:
+            return request.session.proxy("db").duplicate_database(*duplicate_attrs)
+        finally:
+            http.db_list_cache.clear()
 
     @http.route('/web/database/drop', type='json', auth="none")
     def drop(self, fields):
@@ -786,6 +1285,9 @@ class Database(http.Controller):
             return {'error': 'AccessDenied', 'title': 'Drop Database'}
         except Exception:
             return {'error': _('Could not drop database !'), 'title': _('Drop Database')}
+        finally:
+            http.db_list_cache.clear()
+            installed_modules.invalidate(db)
 
     @http.route('/web/database/backup', type='http', auth="none")
     def backup(self, backup_db, backup_pwd, token):
@@ -813,6 +1315,8 @@ class Database(http.Controller):
             return ''
         except openerp.exceptions.AccessDenied, e:
             raise Exception("AccessDenied")
+        finally:
+            http.db_list_cache.clear()
 
     @http.route('/web/database/change_password', type='json', auth="none")
     def change_password(self, fields):
@@ -861,6 +1365,8 @@ class Session(http.Controller):
         try:
             if request.session.model('res.users').change_password(
                 old_password, new_password):
+                # other sessions of the user are not valid anymore
+                http.auth_cache.invalidate(db=request.session.db, uid=request.session.uid)
                 return {'new_password':new_password}
         except Exception:
             return {'error': _('The old password you provided is incorrect, your password was not changed.'), 'title': _('Change Password')}
@@ -918,6 +1424,21 @@ class Session(http.Controller):
             return None
         return saved_actions["actions"].get(key)
 
+    @http.route('/web/session/size_info', type='json', auth="user")
+    def size_info(self):
+        """ Size of the current session when stored, and of each of its keys,
+        along with the sizes of the sessions stored by this server process
+
+        :returns: a dict with ``total`` and ``keys`` sizes for the current
+                  session and the ``stored`` sessions statistics
+        """
+        codec = http.session_stores.codec
+        return {
+            'total': len(codec.encode(request.session)),
+            'keys': codec.sizes(request.session),
+            'stored': codec.stats,
+        }
+
     @http.route('/web/session/check', type='json', auth="user")
     def check(self):
         request.session.assert_valid()
@@ -1082,7 +1603,15 @@ class DataSet(http.Controller):
         if method.startswith('_'):
             raise Exception("Access Denied: Underscore prefixed methods cannot be remotely called")
 
-        return getattr(request.registry.get(model), method)(request.cr, request.uid, *args, **kwargs)
+        result = getattr(request.registry.get(model), method)(request.cr, request.uid, *args, **kwargs)
+        if model == 'res.users' and method in ('write', 'unlink') and args:
+            values = args[1] if len(args) > 1 else kwargs.get('vals', {})
+            if method == 'unlink' or 'password' in values or 'active' in values:
+                # the cached authentications of these users are not valid anymore
+                ids = args[0] if isinstance(args[0], list) else [args[0]]
+                for uid in ids:
+                    http.auth_cache.invalidate(db=request.session.db, uid=uid)
+        return result
 
     @http.route('/web/dataset/call', type='json', auth="user")
     def call(self, model, method, args, domain_id=None, context_id=None):
@@ -4,14 +4,17 @@
 #----------------------------------------------------------
 import ast
 import cgi
+import collections
 import contextlib
 import functools
 import getpass
+import hashlib
+import itertools
 import logging
 import mimetypes
+import multiprocessing.pool
 import os
 import pprint
-import random
 import sys
 import tempfile
 import threading
@@ -22,6 +25,8 @@ import uuid
 import errno
 import re
 import warnings
+import weakref
+import zlib
 
 import babel.core
 import simplejson
@@ -35,14 +40,23 @@ import werkzeug.routing as routing
 import urllib
 import urllib2
 
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
 import openerp
 from openerp.service import security, model as service_model
 from openerp.tools import config
 
+import json_codecs
+import session_stores
+
 import inspect
 import functools
 
 _logger = logging.getLogger(__name__)
+_timing_logger = logging.getLogger(__name__ + '.timing')
 
 #----------------------------------------------------------
 # RequestHandler
@@ -99,33 +113,68 @@ class WebRequest(object):
     def __init__(self, httprequest):
         self.httprequest = httprequest
         self.httpresponse = None
-        self.httpsession = httprequest.session
-        self.session = httprequest.session
-        self.session_id = httprequest.session.sid
         self.disable_db = False
         self.uid = None
         self.func = None
         self.auth_method = None
         self._cr_cm = None
         self._cr = None
+        self._context = None
+        self._lang = None
         self.func_request_type = None
-        # set db/uid trackers - they're cleaned up at the WSGI
-        # dispatching phase in openerp.service.wsgi_server.application
-        if self.db:
-            threading.current_thread().dbname = self.db
-        if self.session.uid:
-            threading.current_thread().uid = self.session.uid
-        self.context = dict(self.session.context)
-        self.lang = self.context["lang"]
+        # the JSON-RPC2 batch this call is part of, if any
+        self.batch = None
+
+    # The session is only loaded (see ``Root.load_session``) when one of the
+    # following is first used
+    @property
+    def session(self):
+        return self.httprequest.session
+
+    @property
+    def httpsession(self):
+        return self.httprequest.session
+
+    @property
+    def session_id(self):
+        return self.httprequest.session.sid
+
+    @property
+    def context(self):
+        if self._context is None:
+            self._context = dict(self.session.context)
+        return self._context
+    @context.setter
+    def context(self, value):
+        self._context = value
+
+    @property
+    def lang(self):
+        if self._lang is None:
+            self._lang = self.session.context["lang"]
+        return self._lang
+    @lang.setter
+    def lang(self, value):
+        self._lang = value
 
     def _authenticate(self):
-        if self.session.uid:
+        # routes without authentication don't need the session to be loaded
+        # just to check it
+        if (self.auth_method != "none" or self.httprequest.session_loaded) \
+                and self.session.uid:
             try:
                 self.session.check_security()
             except SessionExpiredException, e:
                 self.session.logout()
                 raise SessionExpiredException("Session expired for request %s" % self.httprequest)
         auth_methods[self.auth_method]()
+
+    def signal_caches_change(self):
+        """ Signals the changes of the caches of the request's database to
+        the other processes once the request is done, even if signaling is
+        throttled. For changes the registry does not track itself.
+        """
+        self.httprequest.force_signaling = True
     @property
     def registry(self):
         """
@@ -148,6 +197,9 @@ class WebRequest(object):
         The cursor initialized for the current method call. If the current request uses the ``none`` authentication
         trying to access this property will raise an exception.
         """
+        if self.batch is not None and self.batch.transactional:
+            # the calls of a transactional batch share its cursor
+            return self.batch.cr
         # some magic to lazy create the cr
         if not self._cr_cm:
             self._cr_cm = self.registry.cursor()
@@ -155,7 +207,9 @@ class WebRequest(object):
         return self._cr
 
     def _call_function(self, *args, **kwargs):
-        self._authenticate()
+        timer = self.httprequest.timer
+        with timer.phase('auth'):
+            self._authenticate()
         try:
             # ugly syntax only to get the __exit__ arguments to pass to self._cr
             request = self
@@ -164,7 +218,8 @@ class WebRequest(object):
                     pass
                 def __exit__(self, *args):
                     if request._cr_cm:
-                        request._cr_cm.__exit__(*args)
+                        with timer.phase('commit'):
+                            request._cr_cm.__exit__(*args)
                         request._cr_cm = None
                         request._cr = None
 
@@ -172,7 +227,8 @@ class WebRequest(object):
                 if self.func_request_type != self._request_type:
                     raise Exception("%s, %s: Function declared as capable of handling request of type '%s' but called with a request of type '%s'" \
                         % (self.func, self.httprequest.path, self.func_request_type, self._request_type))
-                return self.func(*args, **kwargs)
+                with timer.phase('handler'):
+                    return self.func(*args, **kwargs)
         finally:
             # just to be sure no one tries to re-use the request
             self.disable_db = True
@@ -238,11 +294,7 @@ def route(route, type="http", auth="user"):
         return f
     return decorator
 
-def reject_nonliteral(dct):
-    if '__ref' in dct:
-        raise ValueError(
-            "Non literal contexts can not be sent to the server anymore (%r)" % (dct,))
-    return dct
+reject_nonliteral = json_codecs.reject_nonliteral
 
 class JsonRequest(WebRequest):
     """ JSON-RPC2 over HTTP.
@@ -277,8 +329,8 @@ class JsonRequest(WebRequest):
     """
     _request_type = "json"
 
-    def __init__(self, *args):
-        super(JsonRequest, self).__init__(*args)
+    def __init__(self, httprequest, jsonrequest=None):
+        super(JsonRequest, self).__init__(httprequest)
 
         self.jsonp_handler = None
 
@@ -287,11 +339,15 @@ class JsonRequest(WebRequest):
         self.jsonp = jsonp
         request = None
         request_id = args.get('id')
-        
-        if jsonp and self.httprequest.method == 'POST':
+
+        if jsonrequest is not None:
+            # already decoded, e.g. a call of a batch
+            pass
+        elif jsonp and self.httprequest.method == 'POST':
             # jsonp 2 steps step1 POST: save call
             def handler():
-                self.session.jsonp_requests[request_id] = self.httprequest.form['r']
+                # timestamped, expired by the session store's codec
+                self.session.jsonp_requests[request_id] = [time.time(), self.httprequest.form['r']]
                 self.session.modified = True
                 headers=[('Content-Type', 'text/plain; charset=utf-8')]
                 r = werkzeug.wrappers.Response(request_id, headers=headers)
@@ -304,20 +360,46 @@ class JsonRequest(WebRequest):
         elif jsonp and request_id:
             # jsonp 2 steps step2 GET: run and return result
             request = self.session.jsonp_requests.pop(request_id, "")
+            if isinstance(request, list):
+                request = request[1]
         else:
             # regular jsonrpc2
             request = self.httprequest.stream.read()
 
-        # Read POST content or POST Form Data named "request"
-        self.jsonrequest = simplejson.loads(request, object_hook=reject_nonliteral)
+        if jsonrequest is None:
+            # Read POST content or POST Form Data named "request"
+            with self.httprequest.timer.phase('json'):
+                jsonrequest = json_codecs.loads(request)
+        self.jsonrequest = jsonrequest
         self.params = dict(self.jsonrequest.get("params", {}))
-        self.context = self.params.pop('context', self.session.context)
+        if 'context' in self.params:
+            self.context = self.params.pop('context')
 
     def dispatch(self):
         """ Calls the method asked for by the JSON-RPC2 or JSONP request
         """
         if self.jsonp_handler:
             return self.jsonp_handler()
+        response = self.dispatch_call()
+
+        if self.jsonp:
+            # If we use jsonp, that's mean we are called from another host
+            # Some browser (IE and Safari) do no allow third party cookies
+            # We need then to manage http sessions manually.
+            response['session_id'] = self.session_id
+            mime = 'application/javascript'
+            with self.httprequest.timer.phase('json'):
+                body = "%s(%s);" % (self.jsonp, json_codecs.dumps(response),)
+        else:
+            with self.httprequest.timer.phase('json'):
+                return json_response(response, self.httprequest.app.json_stream_threshold)
+
+        r = werkzeug.wrappers.Response(body, headers=[('Content-Type', mime), ('Content-Length', len(body))])
+        return r
+
+    def dispatch_call(self):
+        """ Calls the method and returns the JSON-RPC2 response object
+        """
         response = {"jsonrpc": "2.0" }
         error = None
 
@@ -342,20 +424,151 @@ class JsonRequest(WebRequest):
             }
         if error:
             response["error"] = error
+        return response
 
-        if self.jsonp:
-            # If we use jsonp, that's mean we are called from another host
-            # Some browser (IE and Safari) do no allow third party cookies
-            # We need then to manage http sessions manually.
-            response['session_id'] = self.session_id
-            mime = 'application/javascript'
-            body = "%s(%s);" % (self.jsonp, simplejson.dumps(response),)
+INVALID_REQUEST = {'code': -32600, 'message': "Invalid Request"}
+INVALID_PARAMS = {'code': -32602, 'message': "Invalid params"}
+
+class BatchRollback(Exception):
+    """ A call of a transactional batch was rolled back as an other call of
+    the batch failed
+    """
+
+class JsonBatchRequest(WebRequest):
+    """ JSON-RPC2 batch: several calls sent in a single HTTP request, sharing
+    the session which is only loaded and stored once. The ``method`` of each
+    call is its route, the batch itself can be posted to any url (the web
+    client uses ``/web/batch``)::
+
+      --> [{"jsonrpc": "2.0",
+            "method": "/web/dataset/call_kw",
+            "params": {"model": "res.partner", "method": "read", ...},
+            "id": 1},
+           {"jsonrpc": "2.0",
+            "method": "/web/action/load",
+            "params": {"action_id": 42},
+            "id": 2}]
+
+      <-- [{"jsonrpc": "2.0", "result": [...], "id": 1},
+           {"jsonrpc": "2.0", "error": {"code": 200, ...}, "id": 2}]
+
+    Each call gets its own result or error, calls without ``id``
+    (notifications) get no response.
+
+    Calls are independent unless the batch is posted with a ``transactional``
+    query parameter: all the calls then share a single cursor, committed if
+    every call succeeded, otherwise rolled back, the calls following the
+    failing one not being run and all of them reporting an error.
+    """
+    _request_type = "json"
+
+    def __init__(self, httprequest, jsonrequests):
+        super(JsonBatchRequest, self).__init__(httprequest)
+        self.jsonrequests = jsonrequests
+        self.transactional = bool(httprequest.args.get('transactional'))
+
+    def dispatch(self):
+        if not self.jsonrequests:
+            data = {"jsonrpc": "2.0", "id": None, "error": INVALID_REQUEST}
         else:
-            mime = 'application/json'
-            body = simplejson.dumps(response)
+            responses = self.dispatch_calls()
+            # notifications get no response
+            data = [response for jsonrequest, response in zip(self.jsonrequests, responses)
+                    if not isinstance(jsonrequest, dict) or 'id' in jsonrequest]
+        with self.httprequest.timer.phase('json'):
+            return json_response(data, self.httprequest.app.json_stream_threshold)
+
+    def dispatch_calls(self):
+        """ Runs the calls of the batch in order and returns their responses
+        """
+        responses = [None] * len(self.jsonrequests)
+        error = None
+        try:
+            for index, jsonrequest in enumerate(self.jsonrequests):
+                responses[index] = self._dispatch_call(jsonrequest)
+                if self.transactional and 'error' in responses[index]:
+                    error = {
+                        'code': 200,
+                        'message': "OpenERP Server Error",
+                        'data': serialize_exception(BatchRollback(
+                            "Rolled back as call %d of the batch failed" % index))
+                    }
+                    break
+            else:
+                if self._cr_cm:
+                    try:
+                        with self.httprequest.timer.phase('commit'):
+                            self._cr.commit()
+                    except Exception, e:
+                        _logger.exception("Exception during JSON batch commit.")
+                        error = {
+                            'code': 200,
+                            'message': "OpenERP Server Error",
+                            'data': serialize_exception(e)
+                        }
+        finally:
+            if self._cr_cm:
+                # no-op if committed
+                self._cr.rollback()
+                self._cr_cm.__exit__(None, None, None)
+                self._cr_cm = None
+                self._cr = None
 
-        r = werkzeug.wrappers.Response(body, headers=[('Content-Type', mime), ('Content-Length', len(body))])
-        return r
+        if error:
+            # the calls which succeeded or were not run share the error
+            for index, jsonrequest in enumerate(self.jsonrequests):
+                if responses[index] is None or 'error' not in responses[index]:
+                    responses[index] = {"jsonrpc": "2.0", "error": error, "id":
+                        jsonrequest.get('id') if isinstance(jsonrequest, dict) else None}
+        return responses
+
+    def _dispatch_call(self, jsonrequest):
+        if not isinstance(jsonrequest, dict) or \
+                not isinstance(jsonrequest.get('method'), basestring):
+            return {"jsonrpc": "2.0", "id": None, "error": INVALID_REQUEST}
+        if not isinstance(jsonrequest.get('params', {}), dict):
+            # parameters by position are not supported
+            return {"jsonrpc": "2.0", "id": jsonrequest.get('id'), "error": INVALID_PARAMS}
+        try:
+            call = JsonRequest(self.httprequest, jsonrequest)
+        except Exception:
+            _logger.exception("Invalid call of a JSON batch.")
+            return {"jsonrpc": "2.0", "id": jsonrequest.get('id'), "error": INVALID_REQUEST}
+        call.batch = self
+        with set_request(call):
+            try:
+                with self.httprequest.timer.phase('route'):
+                    self.httprequest.app.find_handler(jsonrequest['method'])
+            except werkzeug.exceptions.NotFound, e:
+                return {"jsonrpc": "2.0", "id": jsonrequest.get('id'), "error": {
+                    'code': 404,
+                    'message': "Not Found",
+                    'data': serialize_exception(e)
+                }}
+            return call.dispatch_call()
+
+def json_response(data, threshold=None):
+    """ Builds the response with the JSON encoding of ``data``.
+
+    Encodings larger than ``threshold`` bytes are streamed, sent as they are
+    produced (chunked by HTTP/1.1 servers as there is no ``Content-Length``)
+    rather than built whole in memory first.
+    """
+    headers = [('Content-Type', 'application/json')]
+    if not threshold:
+        body = json_codecs.dumps(data)
+        return werkzeug.wrappers.Response(body, headers=headers + [('Content-Length', len(body))])
+
+    chunks = json_codecs.iterencode(data, chunk_size=min(threshold, 64 * 1024))
+    head = []
+    size = 0
+    for chunk in chunks:
+        head.append(chunk)
+        size += len(chunk)
+        if size > threshold:
+            return werkzeug.wrappers.Response(itertools.chain(head, chunks), headers=headers)
+    body = ''.join(head)
+    return werkzeug.wrappers.Response(body, headers=headers + [('Content-Length', len(body))])
 
 def serialize_exception(e):
     tmp = {
@@ -584,6 +797,63 @@ class Model(object):
             return result
         return proxy
 
+class AuthCache(object):
+    """ Short-lived cache of the successful checks of the sessions'
+    authentication parameters (``OpenERPSession.check_security``), so they
+    are not verified for each RPC.
+
+    Entries are keyed by session id, database, user id and a digest of the
+    password, and are dropped after ``ttl`` seconds, on logout, when the
+    user's password or active flag is changed, and when caches of the
+    database's registry are cleared, in this process or (through registry
+    signaling) in an other one. A ``ttl`` of ``0`` disables caching.
+    """
+    max_entries = 100000
+
+    def __init__(self, ttl=30):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        # sid -> ((db, uid, password digest), expiration time)
+        self._entries = {}
+
+    def _key(self, session):
+        password = session.password or ''
+        if isinstance(password, unicode):
+            password = password.encode('utf-8')
+        return session.db, session.uid, hashlib.sha1(password).digest()
+
+    def is_valid(self, session):
+        entry = self._entries.get(session.sid)
+        return entry is not None and entry[1] > time.time() \
+            and entry[0] == self._key(session)
+
+    def add(self, session):
+        if self.ttl <= 0:
+            return
+        now = time.time()
+        with self._lock:
+            if len(self._entries) >= self.max_entries:
+                for sid, (_, expiration) in self._entries.items():
+                    if expiration <= now:
+                        del self._entries[sid]
+                if len(self._entries) >= self.max_entries:
+                    self._entries.clear()
+            self._entries[session.sid] = (self._key(session), now + self.ttl)
+
+    def invalidate(self, sid=None, db=None, uid=None):
+        """ Drops the entry of session ``sid``, or the entries for database
+        ``db`` (and user ``uid``)
+        """
+        with self._lock:
+            if sid is not None:
+                self._entries.pop(sid, None)
+                return
+            for sid, ((entry_db, entry_uid, _), _) in self._entries.items():
+                if entry_db == db and (uid is None or entry_uid == uid):
+                    del self._entries[sid]
+
+auth_cache = AuthCache()
+
 class OpenERPSession(werkzeug.contrib.sessions.Session):
     def __init__(self, *args, **kwargs):
         self.inited = False
@@ -628,7 +898,9 @@ class OpenERPSession(werkzeug.contrib.sessions.Session):
         request.uid = uid
         request.disable_db = False
 
-        if uid: self.get_context()
+        if uid:
+            auth_cache.add(self)
+            self.get_context()
         return uid
 
     def check_security(self):
@@ -639,9 +911,13 @@ class OpenERPSession(werkzeug.contrib.sessions.Session):
         """
         if not self.db or not self.uid:
             raise SessionExpiredException("Session expired")
+        if auth_cache.is_valid(self):
+            return
         security.check(self.db, self.uid, self.password)
+        auth_cache.add(self)
 
     def logout(self):
+        auth_cache.invalidate(self.sid)
         for k in self.keys():
             del self[k]
         self._default_values()
@@ -791,16 +1067,12 @@ class OpenERPSession(werkzeug.contrib.sessions.Session):
         return Model(self, model)
 
 def session_gc(session_store):
-    if random.random() < 0.001:
-        # we keep session one week
-        last_week = time.time() - 60*60*24*7
-        for fname in os.listdir(session_store.path):
-            path = os.path.join(session_store.path, fname)
-            try:
-                if os.path.getmtime(path) < last_week:
-                    os.unlink(path)
-            except OSError:
-                pass
+    """ Removes all the expired sessions at once, expired sessions are
+    otherwise removed in the background by ``Root.session_sweeper``.
+    """
+    # we keep session one week
+    last_week = time.time() - 60*60*24*7
+    return session_store.vacuum(last_week)
 
 #----------------------------------------------------------
 # WSGI Application
@@ -810,6 +1082,200 @@ mimetypes.add_type('application/font-woff', '.woff')
 mimetypes.add_type('application/vnd.ms-fontobject', '.eot')
 mimetypes.add_type('application/x-font-ttf', '.ttf')
 
+class RequestTimer(object):
+    """ Measures the time spent by a request in its phases: ``session``
+    loading and storing, ``db`` selection and registry signaling, ``route``
+    lookup, authentication (``auth``), ``handler``, cursor ``commit`` and
+    ``json`` decoding and encoding.
+
+    Phases are exclusive, the time of a phase started within an other one
+    (e.g. the session loaded while authenticating) is not counted in the
+    outer phase. The time of the calls of a batch is summed. Streamed
+    responses are mostly encoded after the request is timed.
+    """
+    def __init__(self):
+        self.start = time.time()
+        self.phases = collections.OrderedDict()
+        self._current = None
+        self._since = None
+
+    def phase(self, name):
+        """ Returns a context manager timing its block as the phase ``name`` """
+        return _TimerPhase(self, name)
+
+    def _switch(self, name):
+        """ Stops timing the current phase and starts timing ``name``, returns
+        the previous phase
+        """
+        now = time.time()
+        previous = self._current
+        if previous is not None:
+            self.phases[previous] += now - self._since
+        if name is not None and name not in self.phases:
+            self.phases[name] = 0
+        self._current = name
+        self._since = now
+        return previous
+
+    def total(self):
+        return time.time() - self.start
+
+    def server_timing(self):
+        """ Returns the phases as a ``Server-Timing`` header value, durations
+        in milliseconds
+        """
+        return ', '.join('%s;dur=%.1f' % (name, duration * 1000) for name, duration in
+                         self.phases.items() + [('total', self.total())])
+
+class _TimerPhase(object):
+    __slots__ = ['timer', 'name', 'outer']
+
+    def __init__(self, timer, name):
+        self.timer = timer
+        self.name = name
+
+    def __enter__(self):
+        self.outer = self.timer._switch(self.name)
+
+    def __exit__(self, *args):
+        self.timer._switch(self.outer)
+
+class Request(werkzeug.wrappers.Request):
+    """ werkzeug request whose ``session`` is only loaded when first used,
+    through ``Root.load_session``
+    """
+    parameter_storage_class = werkzeug.datastructures.ImmutableDict
+
+    #: the session id provided by the client, if any
+    session_sid = None
+
+    #: the session's database when it was loaded, its registry signaling is
+    #: checked then and its caches changes are signaled after the request
+    signaling_db = None
+
+    #: whether the changes of the caches of ``signaling_db`` are signaled
+    #: even if signaling is throttled, see :class:`RegistrySignaling`
+    force_signaling = False
+
+    @werkzeug.utils.cached_property
+    def session(self):
+        return self.app.load_session(self)
+
+    @werkzeug.utils.cached_property
+    def timer(self):
+        return RequestTimer()
+
+    @property
+    def session_loaded(self):
+        return 'session' in self.__dict__
+
+class ResponseCompressor(object):
+    """ Compresses the responses of :class:`Root` for the clients accepting
+    it, with brotli (if installed) or gzip.
+
+    Only the responses of the ``types`` allowlist are compressed, if they are
+    at least ``min_size`` bytes long or streamed. The bodies of responses
+    with a strong ETag, likely to be sent again, are compressed at the best
+    level once and kept in a LRU cache of ``cache_size`` bytes, keyed by
+    their digest as ETags are not always digests of the bodies. The web
+    client's bundles are not compressed here but once built, see
+    ``controllers.main.Bundle.compress``.
+    """
+    def __init__(self, min_size=1024, types=(
+            'text/html', 'text/css', 'text/plain', 'text/xml', 'application/json',
+            'application/javascript', 'image/svg+xml'),
+                 level=6, cache_size=32 * 1024 * 1024):
+        self.min_size = min_size
+        self.types = frozenset(types)
+        self.level = level
+        self.cache_size = cache_size
+        self._cache = collections.OrderedDict()
+        self._cache_bytes = 0
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0}
+
+    def negotiate(self, httprequest):
+        """ Returns the best encoding accepted by ``httprequest``, if any """
+        best, best_quality = None, 0
+        for encoding in ['br', 'gzip']:
+            if encoding == 'br' and brotli is None:
+                continue
+            quality = httprequest.accept_encodings[encoding]
+            if quality > best_quality:
+                best, best_quality = encoding, quality
+        return best
+
+    def compressor(self, encoding, best=False):
+        """ Returns the ``(compress, flush)`` functions of a new compressor """
+        if encoding == 'br':
+            compressor = brotli.Compressor(quality=9 if best else self.level)
+            return compressor.process, compressor.finish
+        # a gzip container
+        compressor = zlib.compressobj(9 if best else self.level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        return compressor.compress, compressor.flush
+
+    def _compress(self, encoding, data, best=False):
+        compress, flush = self.compressor(encoding, best)
+        return compress(data) + flush()
+
+    def _compress_cached(self, encoding, data):
+        key = (encoding, hashlib.sha1(data).digest())
+        with self._lock:
+            compressed = self._cache.pop(key, None)
+            if compressed is not None:
+                self._cache[key] = compressed
+                self.stats['hits'] += 1
+                return compressed
+        compressed = self._compress(encoding, data, best=True)
+        with self._lock:
+            self.stats['misses'] += 1
+            if key not in self._cache and len(compressed) <= self.cache_size:
+                self._cache[key] = compressed
+                self._cache_bytes += len(compressed)
+                while self._cache_bytes > self.cache_size:
+                    _, evicted = self._cache.popitem(last=False)
+                    self._cache_bytes -= len(evicted)
+        return compressed
+
+    def _compress_stream(self, encoding, chunks):
+        compress, flush = self.compressor(encoding)
+        for chunk in chunks:
+            data = compress(chunk)
+            if data:
+                yield data
+        yield flush()
+
+    def compress(self, httprequest, response):
+        """ Compresses ``response`` if it is worth it and accepted by
+        ``httprequest``
+
+        :returns: the response
+        """
+        if not isinstance(response, werkzeug.wrappers.Response) \
+                or response.status_code != 200 or response.direct_passthrough \
+                or 'Content-Encoding' in response.headers \
+                or response.mimetype not in self.types:
+            return response
+        response.vary.add('Accept-Encoding')
+        encoding = self.negotiate(httprequest)
+        if encoding is None:
+            return response
+
+        if response.is_sequence:
+            data = response.get_data()
+            if len(data) < self.min_size:
+                return response
+            etag, weak = response.get_etag()
+            if etag and not weak:
+                response.set_data(self._compress_cached(encoding, data))
+            else:
+                response.set_data(self._compress(encoding, data))
+        else:
+            response.response = self._compress_stream(encoding, response.response)
+            response.headers.pop('Content-Length', None)
+        response.headers['Content-Encoding'] = encoding
+        return response
+
 class DisableCacheMiddleware(object):
     def __init__(self, app):
         self.app = app
@@ -832,16 +1298,18 @@ class DisableCacheMiddleware(object):
             start_response(status, new_headers)
         return self.app(environ, start_wrapped)
 
-def session_path():
+def system_username():
     try:
         import pwd
-        username = pwd.getpwuid(os.geteuid()).pw_name
+        return pwd.getpwuid(os.geteuid()).pw_name
     except ImportError:
         try:
-            username = getpass.getuser()
+            return getpass.getuser()
         except Exception:
-            username = "unknown"
-    path = os.path.join(tempfile.gettempdir(), "oe-sessions-" + username)
+            return "unknown"
+
+def session_path():
+    path = os.path.join(tempfile.gettempdir(), "oe-sessions-" + system_username())
     try:
         os.mkdir(path, 0700)
     except OSError as exc:
@@ -853,6 +1321,274 @@ def session_path():
             raise
     return path
 
+def registry_token(db):
+    """ Identifies the state of the loaded registry of ``db``, changes when the
+    registry is reloaded or its caches are cleared through registry signaling
+    """
+    registry = getattr(openerp.modules.registry.RegistryManager, 'registries', {}).get(db)
+    if registry is None:
+        return None
+    return id(registry), getattr(registry, 'base_cache_signaling_sequence', None)
+
+def _encode_strings(value):
+    """ Encodes the unicode strings of ``value`` as decoded from JSON to utf-8,
+    as the manifests read from their files mostly contain ``str``
+    """
+    if isinstance(value, unicode):
+        return value.encode('utf-8')
+    if isinstance(value, list):
+        return [_encode_strings(v) for v in value]
+    if isinstance(value, dict):
+        return dict((_encode_strings(k), _encode_strings(v)) for k, v in value.iteritems())
+    return value
+
+class ManifestIndex(object):
+    """ Index of the addons (modules with a manifest and a ``static``
+    directory) of addons paths and of their manifests, persisted in the JSON
+    file ``path`` across server starts.
+
+    The modules of an addons path are listed again when its modification time
+    changes, and the manifest of a module read again when the modification
+    time of its directory or of its manifest changes. Manifests are thus only
+    read and evaluated on the first start and when they are modified.
+
+    .. attribute:: stats
+
+        number of manifests ``reads``
+    """
+    def __init__(self, path=None):
+        self.path = path
+        self.stats = {'reads': 0}
+        self.entries = {}
+        self.changed = False
+        if path and os.path.isfile(path):
+            try:
+                with open(path, 'rb') as f:
+                    entries = simplejson.load(f)
+                if isinstance(entries, dict):
+                    self.entries = entries
+            except (IOError, ValueError):
+                _logger.warning("Could not load the addons index %s", path, exc_info=True)
+
+    def addons(self, addons_path):
+        """ Returns the sorted ``(module, manifest)`` of the addons of
+        ``addons_path``
+        """
+        try:
+            mtime = os.path.getmtime(addons_path)
+        except OSError:
+            return []
+        entry = self.entries.get(addons_path)
+        cached = entry['modules'] if entry else {}
+        if entry and entry['mtime'] == mtime:
+            names = sorted(cached)
+        else:
+            names = sorted(os.listdir(addons_path))
+
+        modules = {}
+        addons = []
+        for module in names:
+            info = modules[module] = self._module(addons_path, module, cached.get(module))
+            if info['manifest'] is not None:
+                addons.append((module, _encode_strings(info['manifest'])))
+
+        if entry != {'mtime': mtime, 'modules': modules}:
+            self.entries[addons_path] = {'mtime': mtime, 'modules': modules}
+            self.changed = True
+        return addons
+
+    def _module(self, addons_path, module, cached):
+        module_path = os.path.join(addons_path, module)
+        manifest_path = os.path.join(module_path, '__openerp__.py')
+        try:
+            key = [os.path.getmtime(module_path), os.path.getmtime(manifest_path)]
+        except OSError:
+            return {'mtime': None, 'manifest': None}
+        if cached and cached['mtime'] == key:
+            return cached
+        manifest = None
+        if os.path.isdir(os.path.join(module_path, 'static')):
+            self.stats['reads'] += 1
+            with open(manifest_path) as f:
+                manifest = ast.literal_eval(f.read())
+        return {'mtime': key, 'manifest': manifest}
+
+    def save(self):
+        """ Writes the index to its file if it changed """
+        if not self.path or not self.changed:
+            return
+        tmp_path = None
+        try:
+            fd, tmp_path = tempfile.mkstemp(
+                prefix=os.path.basename(self.path) + '.', dir=os.path.dirname(self.path))
+            with os.fdopen(fd, 'wb') as f:
+                simplejson.dump(self.entries, f)
+            os.rename(tmp_path, self.path)
+            self.changed = False
+        except (IOError, OSError, TypeError, ValueError):
+            _logger.warning("Could not save the addons index %s", self.path, exc_info=True)
+            if tmp_path and os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+
+#: the :class:`ManifestIndex` of ``Root.load_addons``, created along with the
+#: first :class:`Root`
+manifest_index = None
+
+class RegistrySignaling(object):
+    """ Throttles the registry signaling of the databases, which may query
+    the database's signaling sequences for each request.
+
+    The signaling of a database is checked at most every ``interval``
+    seconds by each process, the registries and caches changed by other
+    processes are thus reloaded up to ``interval`` seconds late. Cache
+    changes are still signaled right after the requests which cleared caches
+    of the registry, or called :meth:`WebRequest.signal_caches_change`, and
+    not signaled at all otherwise. An ``interval`` of ``0`` checks and
+    signals for each request.
+
+    .. attribute:: stats
+
+        number of signaling ``checks`` and ``signals`` made, and of the
+        checks ``saved`` by throttling
+    """
+    def __init__(self, interval=0):
+        self.interval = interval
+        self.stats = dict.fromkeys(['checks', 'signals', 'saved'], 0)
+        self._checked = {}
+        self._pid = os.getpid()
+
+    def check(self, db):
+        """ Checks the registry signaling of ``db`` unless it was checked less
+        than ``interval`` seconds ago
+        """
+        now = time.time()
+        if self._pid != os.getpid():
+            # forked workers don't share the registries of their parent
+            self._pid = os.getpid()
+            self._checked = {}
+        if self.interval > 0 and now - self._checked.get(db, 0) < self.interval:
+            self.stats['saved'] += 1
+            return
+        self.stats['checks'] += 1
+        openerp.modules.registry.RegistryManager.check_registry_signaling(db)
+        self._checked[db] = now
+
+    def signal(self, db, force=False):
+        """ Signals the changes of the caches of ``db`` if any were cleared,
+        or if ``force``, and drops the cached authentications of ``db`` along
+        with them (e.g. users may have been deactivated)
+        """
+        registry = getattr(openerp.modules.registry.RegistryManager, 'registries', {}).get(db)
+        if registry is None:
+            # nothing to signal, the registry is not loaded
+            return
+        any_cache_cleared = getattr(registry, 'any_cache_cleared', None)
+        cleared = force or (any_cache_cleared is not None and any_cache_cleared())
+        if cleared:
+            auth_cache.invalidate(db=db)
+        if force:
+            # the registry only signals the changes of the caches it cleared
+            registry._any_cache_cleared = True
+        elif self.interval > 0 and not cleared:
+            return
+        self.stats['signals'] += 1
+        openerp.modules.registry.RegistryManager.signal_caches_change(db)
+        if cleared and any_cache_cleared is not None and not openerp.multi_process:
+            # only reset when signaling other processes, the cached
+            # authentications would otherwise be dropped for each request
+            registry.reset_any_cache_cleared()
+
+registry_signaling = RegistrySignaling()
+
+#: callables ``task(db)`` run by :class:`Warmup` for each database once its
+#: routing map is built, e.g. to build its assets
+warmup_tasks = []
+
+class Warmup(object):
+    """ Prepares what the first requests to the databases ``dbs`` would
+    otherwise wait for: the routing map without database, then the registry
+    and routing map of each database and the :data:`warmup_tasks`, on a pool
+    of ``threads`` background threads.
+
+    ``dbs`` is a list of database names, ``*`` standing for all the databases
+    of the server the ``dbfilter`` lets through for some host. Warm-up is
+    started by :meth:`ensure_started` once per serving process: at start by
+    a threaded server, on their first request by the workers of a prefork
+    server, never by its master which would otherwise fork workers while
+    warm-up holds database connections and locks. Only the worker elected
+    by the root's :class:`session_stores.SessionSweeper` warms up, other
+    workers (and the ones replacing recycled workers) load the registries
+    they serve on demand, rather than all loading all of them at once.
+
+    .. attribute:: stats
+
+        ``duration`` of the whole warm-up and of each database in
+        ``databases``, in seconds, and the ``failed`` databases
+    """
+    def __init__(self, root, dbs=(), threads=4):
+        self.root = root
+        self.dbs = list(dbs)
+        self.threads = threads
+        self.stats = {'duration': None, 'databases': {}, 'failed': []}
+        self._lock = threading.Lock()
+        self._pid = None
+
+    def ensure_started(self):
+        if not self.dbs or self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+        if openerp.multi_process and not self.root.session_sweeper.elected():
+            return
+        t = threading.Thread(target=self.run, name="openerp.web.warmup")
+        t.daemon = True
+        t.start()
+
+    def databases(self):
+        if '*' not in self.dbs:
+            return self.dbs
+        dbs = openerp.netsvc.dispatch_rpc("db", "list", [True])
+        # the databases which may be served, whatever the host
+        rx = re.compile((config.get('dbfilter') or '.*').replace('%h', '.*').replace('%d', '.*'))
+        dbs = [db for db in dbs if rx.match(db)]
+        return dbs + [db for db in self.dbs if db != '*' and db not in dbs]
+
+    def warm(self, db):
+        start = time.time()
+        try:
+            self.root.get_db_router(db)
+            if db is not None:
+                for task in warmup_tasks:
+                    task(db)
+        except Exception:
+            _logger.exception("Warm-up of database %s failed", db)
+            self.stats['failed'].append(db)
+            return
+        duration = time.time() - start
+        self.stats['databases'][db] = duration
+        _logger.debug("Warm-up of database %s done in %.3fs", db, duration)
+
+    def run(self):
+        """ Warms up all the databases, returns when they are done """
+        start = time.time()
+        self.warm(None)
+        try:
+            dbs = self.databases()
+        except Exception:
+            _logger.exception("Warm-up failed, could not list the databases")
+            return
+        pool = multiprocessing.pool.ThreadPool(max(1, min(self.threads, len(dbs))))
+        try:
+            pool.map(self.warm, dbs)
+        finally:
+            pool.close()
+            pool.join()
+        self.stats['duration'] = time.time() - start
+        _logger.info("Warm-up of %d databases done in %.3fs (%d failed)",
+                     len(dbs), self.stats['duration'], len(self.stats['failed']))
+
 class Root(object):
     """Root WSGI application for the OpenERP Web Client.
     """
@@ -861,13 +1597,54 @@ class Root(object):
         self.statics = {}
 
         self.no_db_router = None
+        # routing maps of the databases by installed modules, dropped along
+        # with the registries of the databases using them
+        self.routers = weakref.WeakValueDictionary()
+        self.routers_lock = threading.Lock()
+        self.addons_lock = threading.Lock()
 
         self.load_addons()
 
+        db_list_cache.ttl = float(config.get('db_list_cache_ttl', db_list_cache.ttl))
+        auth_cache.ttl = float(config.get('auth_cache_ttl', auth_cache.ttl))
+        registry_signaling.interval = float(config.get('registry_signaling_interval', registry_signaling.interval))
+
+        if config.get('json_codec'):
+            json_codecs.codec = json_codecs.select(config['json_codec'])
+        _logger.debug('JSON-RPC codec: %s', json_codecs.codec.name)
+
         # Setup http sessions
         path = session_path()
-        self.session_store = werkzeug.contrib.sessions.FilesystemSessionStore(path, session_class=OpenERPSession)
-        _logger.debug('HTTP sessions stored in: %s', path)
+        backend = config.get('session_store') or 'filesystem'
+        if backend not in session_stores.backends:
+            raise ValueError("Unknown session store %r, available stores: %s" % (
+                backend, ', '.join(sorted(session_stores.backends))))
+        self.session_store = session_stores.backends[backend](path, OpenERPSession)
+        _logger.debug('HTTP sessions stored in: %s (%s)', path, backend)
+        session_stores.codec.max_size = int(config.get('session_max_size', session_stores.codec.max_size))
+        session_stores.codec.jsonp_ttl = int(config.get('session_jsonp_ttl', session_stores.codec.jsonp_ttl))
+        self.session_touch_interval = int(config.get('session_touch_interval', 60*60))
+        self.json_stream_threshold = int(config.get('json_stream_threshold', 1024*1024))
+        # time spent by requests in their phases, see RequestTimer
+        # not sent by default, they tell clients about the server's internals
+        self.server_timing = config.get('server_timing', False)
+        self.timing_log = config.get('timing_log', False)
+        self.compressor = ResponseCompressor(
+            min_size=int(config.get('compression_min_size', 1024)),
+            level=int(config.get('compression_level', 6)),
+            cache_size=int(config.get('compression_cache_size', 32*1024*1024)))
+        if config.get('compression_types') is not None:
+            # an empty list disables compression
+            self.compressor.types = frozenset(filter(None, config['compression_types'].split(',')))
+        self.session_sweeper = session_stores.SessionSweeper(
+            self.session_store,
+            lifetime=int(config.get('session_lifetime', 60*60*24*7)),
+            interval=float(config.get('session_gc_interval', 60)),
+            batch=int(config.get('session_gc_batch', 1000)),
+            lock_path=os.path.join(path, 'sweeper.lock') if self.session_store.shared else None)
+        self.warmup = Warmup(self,
+            dbs=filter(None, (config.get('warmup_dbs') or '').split(',')),
+            threads=int(config.get('warmup_threads', 4)))
 
 
     def __call__(self, environ, start_response):
@@ -879,12 +1656,14 @@ class Root(object):
         """
         Performs the actual WSGI dispatching for the application.
         """
+        httprequest = None
         try:
-            httprequest = werkzeug.wrappers.Request(environ)
-            httprequest.parameter_storage_class = werkzeug.datastructures.ImmutableDict
+            httprequest = Request(environ)
             httprequest.app = self
+            timer = httprequest.timer
 
-            session_gc(self.session_store)
+            self.session_sweeper.ensure_started()
+            self.warmup.ensure_started()
 
             sid = httprequest.args.get('session_id')
             explicit_session = True
@@ -893,30 +1672,20 @@ class Root(object):
             if not sid:
                 sid = httprequest.cookies.get('session_id')
                 explicit_session = False
-            if sid is None:
-                httprequest.session = self.session_store.new()
-            else:
-                httprequest.session = self.session_store.get(sid)
-
-            self._find_db(httprequest)
-
-            if not "lang" in httprequest.session.context:
-                lang = httprequest.accept_languages.best or "en_US"
-                lang = babel.core.LOCALE_ALIASES.get(lang, lang).replace('-', '_')
-                httprequest.session.context["lang"] = lang
+            httprequest.session_sid = sid
 
             request = self._build_request(httprequest)
-            db = request.db
-
-            if db:
-                openerp.modules.registry.RegistryManager.check_registry_signaling(db)
 
             with set_request(request):
-                self.find_handler()
+                # the calls of a batch are looked up one by one
+                if not isinstance(request, JsonBatchRequest):
+                    with timer.phase('route'):
+                        self.find_handler()
                 result = request.dispatch()
 
-            if db:
-                openerp.modules.registry.RegistryManager.signal_caches_change(db)
+            if httprequest.session_loaded and httprequest.signaling_db:
+                with timer.phase('db'):
+                    registry_signaling.signal(httprequest.signaling_db, force=httprequest.force_signaling)
 
             if isinstance(result, basestring):
                 headers=[('Content-Type', 'text/html; charset=utf-8'), ('Content-Length', len(result))]
@@ -924,14 +1693,103 @@ class Root(object):
             else:
                 response = result
 
-            if httprequest.session.should_save:
-                self.session_store.save(httprequest.session)
-            if not explicit_session and hasattr(response, 'set_cookie'):
-                response.set_cookie('session_id', httprequest.session.sid, max_age=90 * 24 * 60 * 60)
+            if httprequest.session_loaded:
+                with timer.phase('session'):
+                    stored = self.save_session(httprequest)
+                # the cookie is refreshed along with the stored session
+                if not explicit_session and hasattr(response, 'set_cookie') and \
+                        (stored or httprequest.session.sid != sid):
+                    response.set_cookie('session_id', httprequest.session.sid, max_age=90 * 24 * 60 * 60)
 
+            response = self.compressor.compress(httprequest, response)
+            self.report_timing(httprequest, response)
             return response(environ, start_response)
         except werkzeug.exceptions.HTTPException, e:
-            return e(environ, start_response)
+            response = e.get_response(environ)
+            if httprequest is not None:
+                self.report_timing(httprequest, response)
+            return response(environ, start_response)
+
+    def report_timing(self, httprequest, response):
+        """ Adds the phases of ``httprequest`` to ``response`` as a
+        ``Server-Timing`` header and logs them, as enabled
+        """
+        if not (self.server_timing or self.timing_log):
+            return
+        timer = httprequest.timer
+        if self.server_timing and hasattr(response, 'headers'):
+            response.headers['Server-Timing'] = timer.server_timing()
+        if self.timing_log and _timing_logger.isEnabledFor(logging.INFO):
+            session = httprequest.session if httprequest.session_loaded else None
+            _timing_logger.info(simplejson.dumps({
+                'route': httprequest.path,
+                'db': session and session.db,
+                'uid': session and session.uid,
+                'status': getattr(response, 'status_code', None) or getattr(response, 'code', None),
+                'duration': round(timer.total() * 1000, 1),
+                'phases': dict((name, round(duration * 1000, 1))
+                               for name, duration in timer.phases.iteritems()),
+            }))
+
+    def load_session(self, httprequest):
+        """ Loads the session of ``httprequest``, called on first access to
+        ``httprequest.session``.
+
+        Also selects the session's database, checking its registry signaling,
+        and defaults its language, those are not considered changes to the
+        session, see :meth:`save_session`.
+        """
+        timer = httprequest.timer
+        sid = httprequest.session_sid
+        with timer.phase('session'):
+            if sid is None:
+                session = self.session_store.new()
+            else:
+                session = self.session_store.get(sid)
+        httprequest.session = session
+
+        with timer.phase('db'):
+            self._find_db(httprequest)
+
+        if not "lang" in session.context:
+            lang = httprequest.accept_languages.best or "en_US"
+            lang = babel.core.LOCALE_ALIASES.get(lang, lang).replace('-', '_')
+            session.context["lang"] = lang
+
+        # set db/uid trackers - they're cleaned up at the WSGI
+        # dispatching phase in openerp.service.wsgi_server.application
+        if session.db:
+            threading.current_thread().dbname = session.db
+            httprequest.signaling_db = session.db
+            token = registry_token(session.db)
+            with timer.phase('db'):
+                registry_signaling.check(session.db)
+            if registry_token(session.db) != token:
+                # the registry was reloaded or its caches cleared by an
+                # other process, e.g. users may have been changed
+                auth_cache.invalidate(db=session.db)
+        if session.uid:
+            threading.current_thread().uid = session.uid
+
+        httprequest.session_digest = session_stores.digest(session)
+        return session
+
+    def save_session(self, httprequest):
+        """ Stores the session of ``httprequest`` if its content changed since
+        it was loaded (including nested changes ``modified`` does not track),
+        otherwise only refreshes its modification time every
+        ``session_touch_interval`` seconds so it does not expire.
+
+        :returns: whether the session was stored or refreshed
+        """
+        session = httprequest.session
+        if session_stores.digest(session) != httprequest.session_digest:
+            self.session_store.save(session)
+            return True
+        if session.new:
+            # nothing worth storing yet
+            return False
+        return self.session_store.touch(session, self.session_touch_interval)
 
     def _find_db(self, httprequest):
         db = db_monodb(httprequest)
@@ -944,36 +1802,69 @@ class Root(object):
             return JsonRequest(httprequest)
 
         if httprequest.mimetype == "application/json":
-            return JsonRequest(httprequest)
+            with httprequest.timer.phase('json'):
+                jsonrequest = json_codecs.loads(httprequest.stream.read())
+            if isinstance(jsonrequest, list):
+                return JsonBatchRequest(httprequest, jsonrequest)
+            return JsonRequest(httprequest, jsonrequest)
         else:
             return HttpRequest(httprequest)
 
     def load_addons(self):
         """ Load all addons from addons patch containg static files and
-        controllers and configure them.  """
+        controllers and configure them.
 
+        Only the server wide addons are imported, the others are imported
+        once a database installing them is routed (see
+        :meth:`import_addons`).
+        """
+        global manifest_index
+        start = time.time()
+        if manifest_index is None:
+            # kept with the sessions, in a directory only the server's user
+            # can write to: manifests tell which files are served
+            manifest_index = ManifestIndex(config.get('addons_index') or
+                                           os.path.join(session_path(), 'addons_index.json'))
         for addons_path in openerp.modules.module.ad_paths:
-            for module in sorted(os.listdir(str(addons_path))):
-                if module not in addons_module:
-                    manifest_path = os.path.join(addons_path, module, '__openerp__.py')
-                    path_static = os.path.join(addons_path, module, 'static')
-                    if os.path.isfile(manifest_path) and os.path.isdir(path_static):
-                        manifest = ast.literal_eval(open(manifest_path).read())
-                        manifest['addons_path'] = addons_path
-                        _logger.debug("Loading %s", module)
-                        if 'openerp.addons' in sys.modules:
-                            m = __import__('openerp.addons.' + module)
-                        else:
-                            m = __import__(module)
-                        addons_module[module] = m
-                        addons_manifest[module] = manifest
-                        self.statics['/%s/static' % module] = path_static
+            for module, manifest in manifest_index.addons(str(addons_path)):
+                if module not in addons_manifest:
+                    manifest['addons_path'] = addons_path
+                    addons_manifest[module] = manifest
+                    self.statics['/%s/static' % module] = os.path.join(addons_path, module, 'static')
+        manifest_index.save()
+        self.import_addons(openerp.conf.server_wide_modules or ['web'])
+        _logger.info("Loaded %d addons in %.3fs (%d manifests read)", len(addons_manifest),
+                     time.time() - start, manifest_index.stats['reads'])
 
         app = werkzeug.wsgi.SharedDataMiddleware(self.dispatch, self.statics)
         self.dispatch = DisableCacheMiddleware(app)
 
-    def _build_router(self, db):
-        _logger.info("Generating routing configuration for database %s" % db)
+    def import_addons(self, modules):
+        """ Imports the addons of ``modules`` not imported yet, registering
+        their controllers
+        """
+        modules = [module for module in sorted(modules)
+                   if module in addons_manifest and module not in addons_module]
+        if not modules:
+            return
+        with self.addons_lock:
+            for module in modules:
+                if module in addons_module:
+                    continue
+                _logger.debug("Loading %s", module)
+                if 'openerp.addons' in sys.modules:
+                    m = __import__('openerp.addons.' + module)
+                else:
+                    m = __import__(module)
+                addons_module[module] = m
+            # rebuilt along with the routes without authentication of the
+            # imported addons
+            self.no_db_router = None
+
+    def _build_router(self, modules=None):
+        """ Builds the routing map of the routes without authentication of all
+        the modules, and of the other routes of ``modules`` if provided
+        """
         routing_map = routing.Map(strict_slashes=False)
 
         def gen(modules, nodb_only):
@@ -1003,41 +1894,66 @@ class Root(object):
         modules_set = set(controllers_per_module.keys()) - set(['web'])
         # building all none methods
         gen(["web"] + sorted(modules_set), True)
-        if not db:
+        if modules is None:
             return routing_map
 
+        # building all other methods
+        gen(["web"] + sorted(modules_set & modules), False)
+
+        return routing_map
+
+    def _router_modules(self, db):
+        """ Returns the installed modules of ``db`` having controllers, which
+        identify its routing map
+        """
         registry = openerp.modules.registry.RegistryManager.get(db)
         with registry.cursor() as cr:
             m = registry.get('ir.module.module')
             ids = m.search(cr, openerp.SUPERUSER_ID, [('state', '=', 'installed'), ('name', '!=', 'web')])
             installed = set(x['name'] for x in m.read(cr, 1, ids, ['name']))
-            modules_set = modules_set & installed
-
-        # building all other methods
-        gen(["web"] + sorted(modules_set), False)
-
-        return routing_map
+        self.import_addons(installed)
+        return frozenset(installed & set(controllers_per_module))
 
     def get_db_router(self, db):
+        """ Returns the routing map of ``db``, or of the routes without
+        authentication if ``db`` is ``None``.
+
+        The map of a database is kept on its registry, and shared with the
+        databases having the same modules with controllers installed.
+        """
         if db is None:
-            router = self.no_db_router
-        else:
-            router = getattr(openerp.modules.registry.RegistryManager.get(db), "werkzeug_http_router", None)
-        if not router:
-            router = self._build_router(db)
-            if db is None:
-                self.no_db_router = router
-            else:
-                openerp.modules.registry.RegistryManager.get(db).werkzeug_http_router = router
+            if self.no_db_router is None:
+                _logger.info("Generating routing configuration for database %s" % db)
+                self.no_db_router = self._build_router()
+            return self.no_db_router
+
+        registry = openerp.modules.registry.RegistryManager.get(db)
+        router = getattr(registry, "werkzeug_http_router", None)
+        if router is None:
+            modules = self._router_modules(db)
+            with self.routers_lock:
+                router = self.routers.get(modules)
+                if router is None:
+                    _logger.info("Generating routing configuration for database %s" % db)
+                    router = self.routers[modules] = self._build_router(modules)
+                else:
+                    _logger.debug("Sharing routing configuration of databases with the same modules for database %s", db)
+            registry.werkzeug_http_router = router
         return router
 
-    def find_handler(self):
+    def find_handler(self, path=None):
         """
-        Tries to discover the controller handling the request for the path specified in the request.
+        Tries to discover the controller handling the request for the path specified in the request,
+        or ``path`` if provided.
         """
-        path = request.httprequest.path
-        urls = self.get_db_router(request.db).bind("")
-        func, arguments = urls.match(path)
+        if path is None:
+            path = request.httprequest.path
+        try:
+            # routes without authentication are the same for all databases,
+            # matching them first avoids loading the session for its database
+            func, arguments = self.get_db_router(None).bind("").match(path)
+        except werkzeug.exceptions.NotFound:
+            func, arguments = self.get_db_router(request.db).bind("").match(path)
         arguments = dict([(k, v) for k, v in arguments.items() if not k.startswith("_ignored_")])
 
         @service_model.check
@@ -1059,14 +1975,61 @@ class Root(object):
 
 root = None
 
+class DbListCache(object):
+    """ Short-lived cache of the filtered database list.
+
+    ``db_monodb`` is called for every request, listing the databases means a
+    catalog query and the ``dbfilter`` has to be re-applied each time. Results
+    are kept ``ttl`` seconds, keyed by the host (the filter may depend on it)
+    and the ``force`` flag.
+
+    The cache is cleared whenever a database is created, duplicated, dropped
+    or restored through the web client, other workers will see the change
+    once their entries expire. A ``ttl`` of ``0`` disables caching.
+    """
+    max_entries = 1024
+
+    def __init__(self, ttl=10):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._generation = 0
+
+    def get(self, force, httprequest):
+        h = httprequest.environ['HTTP_HOST'].split(':')[0]
+        key = (h, bool(force))
+        now = time.time()
+        entry = self._entries.get(key)
+        if entry and entry[0] > now:
+            return list(entry[1])
+
+        generation = self._generation
+        dbs = openerp.netsvc.dispatch_rpc("db", "list", [force])
+        d = h.split('.')[0]
+        r = openerp.tools.config['dbfilter'].replace('%h', h).replace('%d', d)
+        # one regex per host with %h or %d, left to the bounded cache of re
+        rx = re.compile(r)
+        dbs = [i for i in dbs if rx.match(i)]
+
+        if self.ttl > 0:
+            with self._lock:
+                # don't store a list fetched before an invalidation
+                if generation == self._generation:
+                    if len(self._entries) >= self.max_entries:
+                        self._entries.clear()
+                    self._entries[key] = (now + self.ttl, dbs)
+        return list(dbs)
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+
+db_list_cache = DbListCache()
+
 def db_list(force=False, httprequest=None):
     httprequest = httprequest or request.httprequest
-    dbs = openerp.netsvc.dispatch_rpc("db", "list", [force])
-    h = httprequest.environ['HTTP_HOST'].split(':')[0]
-    d = h.split('.')[0]
-    r = openerp.tools.config['dbfilter'].replace('%h', h).replace('%d', d)
-    dbs = [i for i in dbs if re.match(r, i)]
-    return dbs
+    return db_list_cache.get(force, httprequest)
 
 def db_monodb(httprequest=None):
     """
@@ -1112,5 +2075,8 @@ def wsgi_postload():
     global root
     root = Root()
     openerp.wsgi.register_wsgi_handler(root)
+    if not openerp.multi_process:
+        # prefork workers are not forked yet, they warm up by themselves
+        root.warmup.ensure_started()
 
 # vim:et:ts=4:sw=4:
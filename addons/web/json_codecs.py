@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+""" JSON codecs of the JSON-RPC requests and responses.
+
+A codec provides ``loads(payload)`` and ``dumps(obj)``. Unless one is chosen
+with the ``json_codec`` option, the first C-accelerated codec of
+``preference`` is used, falling back on simplejson. Other codecs can be added
+to ``backends``.
+
+Values the selected codec raises on (e.g. ``Decimal``) are encoded by
+simplejson instead. ``ujson`` is only used if chosen: rather than raising, it
+silently changes some values, e.g. it encodes dates as timestamps, sets as
+lists, invalid utf-8 with replacement characters and small floats (below
+``1e-15``) as ``0.0``.
+
+Non literal contexts and domains (``__ref`` objects) are rejected by scanning
+the payload once it is decoded rather than through a python ``object_hook``
+called for every object, which would disable most of the decoder's speedups.
+"""
+import json
+import re
+
+import simplejson
+
+try:
+    from simplejson import _speedups as simplejson_speedups
+except ImportError:
+    simplejson_speedups = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+class SimplejsonCodec(object):
+    name = 'simplejson'
+    available = True
+    accelerated = simplejson_speedups is not None
+
+    def loads(self, payload):
+        return simplejson.loads(payload)
+
+    def dumps(self, obj):
+        return simplejson.dumps(obj)
+
+class StdlibCodec(object):
+    name = 'json'
+    available = True
+    accelerated = json.decoder.c_scanstring is not None \
+        and json.encoder.c_make_encoder is not None
+
+    def loads(self, payload):
+        return json.loads(payload)
+
+    def dumps(self, obj):
+        return json.dumps(obj)
+
+class UltraJsonCodec(object):
+    name = 'ujson'
+    available = ujson is not None
+    accelerated = True
+
+    def loads(self, payload):
+        return ujson.loads(payload, precise_float=True)
+
+    def dumps(self, obj):
+        return ujson.dumps(obj, double_precision=15)
+
+backends = dict((codec.name, codec) for codec in [
+    SimplejsonCodec, StdlibCodec, UltraJsonCodec])
+
+preference = ['simplejson', 'json']
+
+def select(name=None):
+    """ Returns an instance of the codec ``name``, or of the preferred
+    available one if ``name`` is not provided
+    """
+    if name:
+        if name not in backends or not backends[name].available:
+            raise ValueError("Unknown or unavailable JSON codec %r, available codecs: %s" % (
+                name, ', '.join(sorted(n for n, c in backends.iteritems() if c.available))))
+        return backends[name]()
+    for name in preference:
+        if backends[name].available and backends[name].accelerated:
+            return backends[name]()
+    return SimplejsonCodec()
+
+codec = select()
+
+def reject_nonliteral(dct):
+    if '__ref' in dct:
+        raise ValueError(
+            "Non literal contexts can not be sent to the server anymore (%r)" % (dct,))
+    return dct
+
+def check_literal(data):
+    """ Applies :func:`reject_nonliteral` to all the objects of ``data`` """
+    stack = [data]
+    while stack:
+        value = stack.pop()
+        if isinstance(value, dict):
+            reject_nonliteral(value)
+            stack.extend(value.itervalues())
+        elif isinstance(value, list):
+            stack.extend(value)
+
+# "__ref" as it may be written in a payload, \u escapes included
+NONLITERAL_RE = re.compile(r'(?:_|\\u005[fF]){2}(?:r|\\u0072)(?:e|\\u0065)(?:f|\\u0066)')
+
+def loads(payload, using=None):
+    data = (using or codec).loads(payload)
+    # escapes are rare in requests, browsers only escape control characters
+    if '__ref' in payload or ('\\u00' in payload and NONLITERAL_RE.search(payload)):
+        check_literal(data)
+    return data
+
+def dumps(obj, using=None):
+    using = using or codec
+    try:
+        return using.dumps(obj)
+    except (TypeError, ValueError, OverflowError):
+        if isinstance(using, SimplejsonCodec):
+            raise
+        return simplejson.dumps(obj)
+
+def _iterencode(obj, using, depth, batch):
+    if isinstance(obj, (list, tuple)) and len(obj) > batch:
+        # large lists (e.g. records) are encoded a slice at a time
+        yield '['
+        for index in xrange(0, len(obj), batch):
+            if index:
+                yield ','
+            yield dumps(list(obj[index:index + batch]), using)[1:-1]
+        yield ']'
+    elif depth and isinstance(obj, (list, tuple)):
+        yield '['
+        for index, value in enumerate(obj):
+            if index:
+                yield ','
+            for piece in _iterencode(value, using, depth - 1, batch):
+                yield piece
+        yield ']'
+    elif depth and isinstance(obj, dict) and \
+            all(isinstance(key, basestring) for key in obj):
+        yield '{'
+        for index, (key, value) in enumerate(obj.iteritems()):
+            if index:
+                yield ','
+            yield dumps(key, using)
+            yield ':'
+            for piece in _iterencode(value, using, depth - 1, batch):
+                yield piece
+        yield '}'
+    else:
+        yield dumps(obj, using)
+
+def iterencode(obj, using=None, chunk_size=64 * 1024, depth=4, batch=100):
+    """ Yields the JSON encoding of ``obj`` in chunks of about ``chunk_size``
+    bytes, so it is never built whole.
+
+    The lists and dicts of the first ``depth`` levels are walked, other values
+    being encoded at once, as are the lists of more than ``batch`` items
+    ``batch`` items at a time.
+    """
+    chunk = []
+    size = 0
+    for piece in _iterencode(obj, using, depth, batch):
+        chunk.append(piece)
+        size += len(piece)
+        if size >= chunk_size:
+            yield ''.join(chunk)
+            chunk = []
+            size = 0
+    if chunk:
+        yield ''.join(chunk)
@@ -0,0 +1,354 @@
+# -*- coding: utf-8 -*-
+""" Compiles QWeb templates to the javascript functions ``qweb2.js`` compiles
+them to in the browser, so the web client does not have to.
+
+The web client translates the text of the templates and their ``label``,
+``title``, ``alt`` and ``placeholder`` attributes when compiling them, which
+compiled templates do when rendering through the ``translate`` method of the
+engine instead.
+
+Templates extended (``t-extend``) by the compiled files are left to the web
+client, extensions being applied with jQuery. So are the templates extended
+later on, the engine compiling again the templates it extends.
+"""
+import collections
+import re
+from xml.etree import ElementTree
+from xml.sax.saxutils import escape
+
+import simplejson
+
+PREFIX = 't'
+RESERVED_WORDS = frozenset(
+    'true,false,NaN,null,undefined,debugger,console,window,in,instanceof,new,function,'
+    'return,this,typeof,eval,void,Math,RegExp,Array,Object,Date'.split(','))
+ACTIONS_PRECEDENCE = 'foreach,if,call,set,esc,escf,raw,rawf,js,debug,log'.split(',')
+WORD_REPLACEMENT = {
+    'and': '&&',
+    'or': '||',
+    'gt': '>',
+    'gte': '>=',
+    'lt': '<',
+    'lte': '<=',
+}
+TRANSLATED_ATTRIBUTES = frozenset(['label', 'title', 'alt', 'placeholder'])
+XML_NAMESPACE = '{http://www.w3.org/XML/1998/namespace}'
+
+rx_action = re.compile('^%s-(.+)' % PREFIX)
+rx_word_start = re.compile(r'[a-zA-Z_\$]')
+rx_non_word = re.compile(r'\W')
+rx_interpolation = re.compile(r'^{(.*)}(.*)')
+rx_string_line = re.compile(r'^(\s*)//@string=(.*)')
+rx_translatable = re.compile(r'^(\s*)([\s\S]+?)(\s*)$', re.U)
+
+def js_escape(s, noquotes=False):
+    quote = '' if noquotes else "'"
+    return quote + re.sub(r'\r?\n', r'\\n', s).replace("'", "\\'") + quote
+
+def html_escape(s, attribute=False):
+    s = s.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+    if attribute:
+        s = s.replace('"', '&quot;')
+    return s
+
+expressions_cache = {}
+
+def format_expression(e):
+    """ Replaces the reserved words and variables of an expression by their
+    javascript, ``dict[variable]`` for variables
+    """
+    if e in expressions_cache:
+        return expressions_cache[e]
+    chars = list(e) + [' ']
+    instring = ''
+    invar = ''
+    invar_pos = 0
+    r = []
+    for i, c in enumerate(chars):
+        if instring:
+            if c == instring and chars[i - 1] != '\\':
+                instring = ''
+        elif c in ('"', "'"):
+            instring = c
+        elif rx_word_start.match(c) and not invar:
+            invar = c
+            invar_pos = i
+            continue
+        elif rx_non_word.match(c) and invar:
+            if chars[invar_pos - 1] != '.' and invar not in RESERVED_WORDS:
+                invar = WORD_REPLACEMENT.get(invar) or "dict['%s']" % invar
+            r.append(invar)
+            invar = ''
+        elif invar:
+            invar += c
+            continue
+        r.append(c)
+    expressions_cache[e] = result = ''.join(r)[:-1]
+    return result
+
+def string_interpolation(s):
+    if not s:
+        return "''"
+    r = []
+    for i, val in enumerate(s.split('#')):
+        m = rx_interpolation.match(val)
+        if m:
+            r.append('(' + format_expression(m.group(1)) + ')')
+            if m.group(2):
+                r.append(js_escape(m.group(2)))
+        elif not (i == 0 and val == ''):
+            r.append(js_escape(('' if i == 0 else '#') + val))
+    return ' + '.join(r)
+
+class Element(object):
+    """ Port of ``QWeb2.Element``, compiling a node of a template.
+
+    Text nodes are given as their ``text`` and the element containing them.
+    """
+    def __init__(self, node, text=None):
+        self.node = node
+        self.text = text
+        self.actions = collections.OrderedDict()
+        self.attributes = []
+        self.children = []
+        self._top = []
+        self._bottom = []
+        self._indent = 1
+        self.process_children = True
+        if text is not None:
+            return
+
+        self.tag = node.tag
+        if node.text:
+            self.children.append(Element(node, node.text))
+        for child in node:
+            self.children.append(Element(child))
+            if child.tail:
+                self.children.append(Element(node, child.tail))
+        for name, value in node.attrib.items():
+            if name.startswith(XML_NAMESPACE):
+                name = 'xml:' + name[len(XML_NAMESPACE):]
+            m = rx_action.match(name)
+            if m:
+                if m.group(1) == 'name':
+                    continue
+                self.actions[m.group(1)] = value
+            else:
+                self.attributes.append((name, value))
+
+    def translation(self):
+        """ Returns the javascript translating the text of the node as the
+        ``preprocess_node`` of the web client does, if it is translated
+        """
+        m = rx_translatable.match(self.text)
+        if not m or not m.group(2).strip() or self.node.get('t-translation') == 'off':
+            return None
+        lead, text, trail = m.groups()
+        return ' + '.join(
+            ([js_escape(lead)] if lead else []) +
+            ['context.engine.translate(%s)' % js_escape(text)] +
+            ([js_escape(trail)] if trail else []))
+
+    def compile(self):
+        r = []
+        instring = False
+        for line in self._compile().split('\n'):
+            m = rx_string_line.match(line)
+            if m:
+                if instring:
+                    r.append(m.group(2))
+                else:
+                    r.append(m.group(1) + "r.push('" + m.group(2))
+                    instring = True
+            else:
+                if instring:
+                    r.append("');\n")
+                instring = False
+                r.append(line + '\n')
+        return ''.join(r)
+
+    def _compile(self):
+        if self.text is not None:
+            translation = self.translation()
+            if translation:
+                self.top("r.push(%s);" % translation)
+            else:
+                self.top_string(self.text)
+        else:
+            self.compile_element()
+        r = ''.join(self._top)
+        if self.process_children:
+            for child in self.children:
+                child._indent = self._indent
+                r += child._compile()
+        r += ''.join(self._bottom)
+        return r
+
+    def indent(self):
+        self._indent += 1
+
+    def get_indent(self):
+        return '\t' * self._indent
+
+    def top(self, s):
+        self._top.append(self.get_indent() + s + '\n')
+
+    def top_string(self, s):
+        self._top.append(self.get_indent() + '//@string=' + js_escape(s, True) + '\n')
+
+    def bottom(self, s):
+        self._bottom.insert(0, self.get_indent() + s + '\n')
+
+    def bottom_string(self, s):
+        self._bottom.insert(0, self.get_indent() + '//@string=' + js_escape(s, True) + '\n')
+
+    def compile_element(self):
+        for action in ACTIONS_PRECEDENCE:
+            if action in self.actions:
+                getattr(self, 'compile_action_' + action)(self.actions[action])
+        if self.tag.lower() == PREFIX:
+            return
+        tag = '<' + self.tag
+        for name, value in self.attributes:
+            if name in TRANSLATED_ATTRIBUTES and value:
+                self.top_string(tag)
+                self.top("r.push(context.engine.tools.gen_attribute([%s, context.engine.translate(%s)]));" % (
+                    js_escape(name), js_escape(value)))
+                tag = ''
+            else:
+                tag += ' %s="%s"' % (name, html_escape(value, True))
+        if tag:
+            self.top_string(tag)
+        if 'att' in self.actions:
+            self.top("r.push(context.engine.tools.gen_attribute(" + format_expression(self.actions['att']) + "));")
+        for action, value in self.actions.iteritems():
+            m = re.search('att-(.+)', action)
+            if m:
+                self.top("r.push(context.engine.tools.gen_attribute(['" + m.group(1) + "', (" + format_expression(value) + ")]));")
+            m = re.search('attf-(.+)', action)
+            if m:
+                self.top("r.push(context.engine.tools.gen_attribute(['" + m.group(1) + "', (" + string_interpolation(value) + ")]));")
+        if self.children or self.actions.get('opentag') == 'true':
+            self.top_string('>')
+            self.bottom_string('</' + self.tag + '>')
+        else:
+            self.top_string('/>')
+
+    def compile_action_if(self, value):
+        self.top("if (" + format_expression(value) + ") {")
+        self.bottom("}")
+        self.indent()
+
+    def compile_action_foreach(self, value):
+        as_ = self.actions.get('as') or re.sub('[^a-zA-Z0-9]', '_', value)
+        self.top("context.engine.tools.foreach(context, " + format_expression(value) + ", " + js_escape(as_) + ", dict, function(context, dict) {")
+        self.bottom("});")
+        self.indent()
+
+    def compile_action_call(self, value):
+        _import = self.actions.get('import') or ''
+        if not self.children:
+            self.top("r.push(context.engine.tools.call(context, " + js_escape(value) + ", dict, " + js_escape(_import) + "));")
+        else:
+            self.top("r.push(context.engine.tools.call(context, " + js_escape(value) + ", dict, " + js_escape(_import) + ", function(context, dict) {")
+            self.bottom("}));")
+            self.indent()
+            self.top("var r = [];")
+            self.bottom("return r.join('');")
+
+    def compile_action_set(self, value):
+        variable = format_expression(value)
+        if self.actions.get('value'):
+            self.top(variable + " = (" + format_expression(self.actions['value']) + ");")
+            self.process_children = False
+        elif not self.children:
+            self.top(variable + " = '';")
+        elif len(self.children) == 1 and self.children[0].text is not None:
+            text = self.children[0]
+            self.top(variable + " = " + (text.translation() or js_escape(text.text)) + ";")
+            self.process_children = False
+        else:
+            self.top(variable + " = (function(dict) {")
+            self.bottom("})(dict);")
+            self.indent()
+            self.top("var r = [];")
+            self.bottom("return r.join('');")
+
+    def compile_action_esc(self, value):
+        self.top("r.push(context.engine.tools.html_escape(" + format_expression(value) + "));")
+
+    def compile_action_escf(self, value):
+        self.top("r.push(context.engine.tools.html_escape(" + string_interpolation(value) + "));")
+
+    def compile_action_raw(self, value):
+        self.top("r.push(" + format_expression(value) + ");")
+
+    def compile_action_rawf(self, value):
+        self.top("r.push(" + string_interpolation(value) + ");")
+
+    def compile_action_js(self, value):
+        self.top("(function(" + value + ") {")
+        self.bottom("})(dict);")
+        self.indent()
+        source = escape(self.node.text or '') + ''.join(
+            ElementTree.tostring(child, 'utf-8').decode('utf-8') for child in self.node)
+        for line in re.split(r'\r?\n', source):
+            self.top(line)
+        self.process_children = False
+
+    def compile_action_debug(self, value):
+        self.top("debugger;")
+
+    def compile_action_log(self, value):
+        self.top("console.log(" + format_expression(value) + ");")
+
+def compile_template(node):
+    """ Returns the body of the function rendering the template ``node``, as
+    generated by ``QWeb2.Engine.compile`` out of debug mode
+    """
+    name = node.get('%s-name' % PREFIX)
+    return ("   /* 'this' refers to Qweb2.Engine instance */\n"
+            "   var context = { engine : this, template : " + js_escape(name) + " };\n"
+            "   dict = dict || {};\n"
+            "   dict['__template__'] = '" + name + "';\n"
+            "   var r = [];\n"
+            "   /* START TEMPLATE */ try {\n" +
+            Element(node).compile() + "\n"
+            "   /* END OF TEMPLATE */ } catch(error) {\n"
+            "       if (console && console.exception) console.exception(error);\n"
+            "       context.engine.tools.exception('Runtime Error: ' + error, context);\n"
+            "   }\n"
+            "   return r.join('');")
+
+def compile_templates(source):
+    """ Returns the javascript adding the templates of the xml document
+    ``source`` to the web client's QWeb engine along with their compiled
+    functions
+
+    :param str source: templates document, as bundled
+    :rtype: str
+    """
+    if not source:
+        return ''
+    templates = collections.OrderedDict()
+    extended = set()
+    for node in ElementTree.fromstring(source):
+        name = node.get('%s-name' % PREFIX)
+        extend = node.get('%s-extend' % PREFIX)
+        if extend and name:
+            # a copy of an other template, extended by its own body
+            templates.pop(name, None)
+        elif extend:
+            extended.add(extend)
+        elif name:
+            templates.pop(name, None)
+            templates[name] = node
+
+    functions = ',\n'.join(
+        '%s: function (dict) {\n%s\n}' % (simplejson.dumps(name), compile_template(node))
+        for name, node in templates.iteritems() if name not in extended)
+    script = ("openerp.web.qweb.add_template(%s);\n"
+              "openerp.web.qweb.add_compiled_templates({\n%s\n});\n") % (
+        simplejson.dumps(source), functions)
+    # not valid in javascript strings
+    return script.replace(u'\u2028', u'\\u2028').replace(u'\u2029', u'\\u2029').encode('utf-8')
@@ -0,0 +1,652 @@
+# -*- coding: utf-8 -*-
+#----------------------------------------------------------
+# OpenERP Web HTTP session stores
+#----------------------------------------------------------
+""" Storage backends for the HTTP sessions of the web client.
+
+All backends implement werkzeug's ``SessionStore`` protocol (``new``, ``get``,
+``save``, ``delete``) plus:
+
+* ``touch(session, min_age=0)``, refreshes the modification time of a stored
+  session if it is at least ``min_age`` seconds old, without storing it
+  again, and returns whether it did
+* ``list()``, the identifiers of all stored sessions
+* ``vacuum(threshold, limit=None)``, removes at most ``limit`` of the
+  sessions last saved before the ``threshold`` timestamp, oldest first, and
+  returns how many were removed
+* ``shared``, whether the sessions are shared by the processes of the
+  server, and only need to be swept by one of them
+
+The backend used by :class:`~openerp.addons.web.http.Root` is selected with
+the ``session_store`` server option, see :data:`backends`. Expired sessions
+are removed in the background by a :class:`SessionSweeper`.
+"""
+import collections
+import cPickle
+import errno
+import hashlib
+import heapq
+import logging
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+
+import simplejson
+import werkzeug.contrib.sessions
+from werkzeug.posixemulation import rename
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from openerp.tools import config
+
+_logger = logging.getLogger(__name__)
+
+#----------------------------------------------------------
+# Serialization
+#----------------------------------------------------------
+class SessionCodec(object):
+    """ Compact, versioned serialization of sessions.
+
+    Sessions are stored as ``OES<version>:`` followed by their compact JSON
+    encoding. Dictionaries with non-string keys (e.g. the saved actions) are
+    encoded as ``{"__items__": [[key, value], ...]}`` so they survive the
+    round trip. Sessions stored by previous versions (pickles) are still
+    loaded, sessions which can not be encoded in JSON are pickled.
+
+    Before being stored, a session's JSONP requests older than ``jsonp_ttl``
+    seconds are dropped, then if the session is larger than ``max_size``
+    bytes its transient data is evicted: pending JSONP requests, then the
+    oldest saved actions. The other keys are needed to authenticate the
+    session and are never evicted, a session still over the budget is stored
+    anyway and logged along with the size of its keys.
+
+    .. attribute:: stats
+
+        sizes of the stored sessions: number of ``saves``, ``total`` and
+        ``max`` size, and per key ``[total, max]`` sizes in ``keys``, see
+        :meth:`sizes` for a single session
+    """
+    version = 1
+    magic = 'OES%d:' % version
+
+    def __init__(self, max_size=64 * 1024, jsonp_ttl=300):
+        self.max_size = max_size
+        self.jsonp_ttl = jsonp_ttl
+        self._lock = threading.Lock()
+        self.stats = {'saves': 0, 'total': 0, 'max': 0, 'keys': {}}
+
+    def _pack(self, o):
+        if isinstance(o, dict):
+            if all(isinstance(k, basestring) for k in o):
+                return dict((k, self._pack(v)) for k, v in o.iteritems())
+            return {'__items__': [[self._pack(k), self._pack(v)] for k, v in o.iteritems()]}
+        if isinstance(o, (list, tuple)):
+            return [self._pack(v) for v in o]
+        return o
+
+    def _unpack_object(self, d):
+        if len(d) == 1 and '__items__' in d:
+            return dict((tuple(k) if isinstance(k, list) else k, v)
+                        for k, v in d['__items__'])
+        return d
+
+    def encode(self, data):
+        """ Encodes the ``data`` mapping, deterministically
+        """
+        try:
+            return self.magic + simplejson.dumps(
+                self._pack(data), separators=(',', ':'), sort_keys=True)
+        except TypeError:
+            return cPickle.dumps(dict(data), cPickle.HIGHEST_PROTOCOL)
+
+    def loads(self, payload):
+        if payload.startswith(self.magic):
+            return simplejson.loads(payload[len(self.magic):],
+                                    object_hook=self._unpack_object)
+        if payload.startswith('OES'):
+            raise ValueError("Unknown session format %r" % payload[:payload.find(':')])
+        return cPickle.loads(payload)
+
+    def sizes(self, data):
+        """ Returns the encoded size of each key of ``data``
+        """
+        return dict((k, len(self.encode({k: v}))) for k, v in data.iteritems())
+
+    def dumps(self, session):
+        data = dict(session)
+        jsonp_requests = data.get('jsonp_requests')
+        if jsonp_requests:
+            threshold = time.time() - self.jsonp_ttl
+            data['jsonp_requests'] = dict(
+                (k, v) for k, v in jsonp_requests.iteritems()
+                # requests stored by previous versions have no timestamp
+                if isinstance(v, list) and v[0] >= threshold)
+
+        payload = self.encode(data)
+        if len(payload) > self.max_size:
+            payload = self._evict(data, payload)
+
+        sizes = self.sizes(data)
+        with self._lock:
+            stats = self.stats
+            stats['saves'] += 1
+            stats['total'] += len(payload)
+            stats['max'] = max(stats['max'], len(payload))
+            for k, size in sizes.iteritems():
+                key_stats = stats['keys'].setdefault(k, [0, 0])
+                key_stats[0] += size
+                key_stats[1] = max(key_stats[1], size)
+        if len(payload) > self.max_size:
+            _logger.warning("Session %s is %d bytes, over the %d bytes budget: %s",
+                            session.sid, len(payload), self.max_size,
+                            ', '.join('%s=%d' % item for item in
+                                      sorted(sizes.iteritems(), key=lambda i: -i[1])))
+        return payload
+
+    def _evict(self, data, payload):
+        if data.get('jsonp_requests'):
+            data['jsonp_requests'] = {}
+            payload = self.encode(data)
+        saved_actions = data.get('saved_actions')
+        if len(payload) > self.max_size and saved_actions and saved_actions.get('actions'):
+            actions = dict(saved_actions['actions'])
+            data['saved_actions'] = dict(saved_actions, actions=actions)
+            while actions and len(payload) > self.max_size:
+                del actions[min(actions)]
+                payload = self.encode(data)
+        return payload
+
+codec = SessionCodec()
+
+def dumps(session):
+    return codec.dumps(session)
+
+def loads(payload):
+    return codec.loads(payload)
+
+def digest(session):
+    """ Digest of the session's content, to tell whether it changed
+    """
+    return hashlib.sha1(codec.encode(session)).digest()
+
+#----------------------------------------------------------
+# Stores
+#----------------------------------------------------------
+
+class FilesystemSessionStore(werkzeug.contrib.sessions.FilesystemSessionStore):
+    """ werkzeug's filesystem store, one file per session.
+
+    With a ``shard_depth`` of ``n``, session files are spread in ``n`` levels
+    of subdirectories named after the successive pairs of hexadecimal digits
+    of the (random) session id, i.e. 256 subdirectories per level instead of
+    a single directory holding all the sessions. Sessions saved with the flat
+    layout (``shard_depth`` of ``0``, werkzeug's) are moved into their
+    subdirectory when accessed, or by the next directory scan.
+
+    Keeps an expiry index (a heap of ``(mtime, sid)``) so expired sessions can
+    be found without listing the directory. The index is filled by the
+    sessions saved in this process and by a full scan of the directory, done
+    on the first vacuum and then every ``rescan_interval`` seconds to pick up
+    the sessions saved by other processes. Since other processes may also
+    have saved an indexed session since, a session's file is checked again
+    before removal. Processes which never vacuum the store keep no index.
+    """
+    rescan_interval = 60 * 60 * 24
+    shared = True
+
+    def __init__(self, *args, **kwargs):
+        self.shard_depth = kwargs.pop('shard_depth', 0)
+        super(FilesystemSessionStore, self).__init__(*args, **kwargs)
+        self._shards = set()
+        self._index_lock = threading.Lock()
+        # heap of (mtime, sid), entries not matching _mtimes are stale
+        self._index = []
+        self._mtimes = {}
+        self._scanned_at = None
+
+    def _index_push(self, sid, mtime):
+        if self._scanned_at is None:
+            # not sweeping the store, or its first scan will find the session
+            return
+        with self._index_lock:
+            self._mtimes[sid] = mtime
+            heapq.heappush(self._index, (mtime, sid))
+            # drop stale entries once they outnumber live ones
+            if len(self._index) > 2 * len(self._mtimes) + 1000:
+                self._index = [(m, s) for s, m in self._mtimes.iteritems()]
+                heapq.heapify(self._index)
+
+    def _flat_filename(self, sid):
+        return super(FilesystemSessionStore, self).get_session_filename(sid)
+
+    def get_session_filename(self, sid):
+        fn = self._flat_filename(sid)
+        if not self.shard_depth:
+            return fn
+        shard = [str(sid[i:i + 2]) for i in range(0, 2 * self.shard_depth, 2)]
+        return os.path.join(self.path, *(shard + [os.path.basename(fn)]))
+
+    def _make_shard(self, fn):
+        shard = os.path.dirname(fn)
+        if shard in self._shards:
+            return
+        try:
+            os.makedirs(shard, 0700)
+        except OSError as exc:
+            if exc.errno != errno.EEXIST:
+                raise
+        self._shards.add(shard)
+
+    def _migrate(self, sid):
+        """ Moves the session ``sid`` saved with the flat layout to its shard,
+        returns whether there was such a session
+        """
+        fn = self.get_session_filename(sid)
+        self._make_shard(fn)
+        try:
+            os.rename(self._flat_filename(sid), fn)
+        except OSError:
+            return False
+        return True
+
+    def _scan(self):
+        mtimes = {}
+        for sid in self.list():
+            fn = self.get_session_filename(sid)
+            try:
+                mtimes[sid] = os.path.getmtime(fn)
+            except OSError:
+                try:
+                    if self.shard_depth and self._migrate(sid):
+                        mtimes[sid] = os.path.getmtime(fn)
+                except OSError:
+                    pass
+        with self._index_lock:
+            # sessions saved during the scan are more recent
+            mtimes.update(self._mtimes)
+            self._mtimes = mtimes
+            self._index = [(m, s) for s, m in mtimes.iteritems()]
+            heapq.heapify(self._index)
+            self._scanned_at = time.time()
+
+    def save(self, session):
+        fn = self.get_session_filename(session.sid)
+        if self.shard_depth:
+            self._make_shard(fn)
+        fd, tmp = tempfile.mkstemp(suffix=werkzeug.contrib.sessions._fs_transaction_suffix,
+                                   dir=os.path.dirname(fn))
+        f = os.fdopen(fd, 'wb')
+        try:
+            f.write(dumps(session))
+        finally:
+            f.close()
+        try:
+            rename(tmp, fn)
+            os.chmod(fn, self.mode)
+        except (IOError, OSError):
+            pass
+        self._index_push(session.sid, time.time())
+
+    def get(self, sid):
+        if not self.is_valid_key(sid):
+            return self.new()
+        fn = self.get_session_filename(sid)
+        if self.shard_depth and not os.path.exists(fn):
+            self._migrate(sid)
+        try:
+            f = open(fn, 'rb')
+        except IOError:
+            if self.renew_missing:
+                return self.new()
+            data = {}
+        else:
+            try:
+                data = loads(f.read())
+            except Exception:
+                _logger.warning("Could not load session %s", sid, exc_info=True)
+                data = {}
+            finally:
+                f.close()
+        return self.session_class(data, sid, False)
+
+    def list(self):
+        if not self.shard_depth:
+            return super(FilesystemSessionStore, self).list()
+        before, after = self.filename_template.split('%s', 1)
+        filename_re = re.compile(r'%s(.{5,})%s$' % (re.escape(before), re.escape(after)))
+        result = []
+        # flat layout sessions are matched at the top level
+        for dirpath, dirnames, filenames in os.walk(self.path):
+            for filename in filenames:
+                match = filename_re.match(filename)
+                if match is not None:
+                    result.append(match.group(1))
+        return result
+
+    def delete(self, session):
+        super(FilesystemSessionStore, self).delete(session)
+        with self._index_lock:
+            self._mtimes.pop(session.sid, None)
+
+    def touch(self, session, min_age=0):
+        fn = self.get_session_filename(session.sid)
+        now = time.time()
+        try:
+            if now - os.path.getmtime(fn) < min_age:
+                return False
+            os.utime(fn, None)
+        except OSError:
+            return False
+        self._index_push(session.sid, now)
+        return True
+
+    def vacuum(self, threshold, limit=None):
+        if self._scanned_at is None or time.time() - self._scanned_at > self.rescan_interval:
+            self._scan()
+        removed = 0
+        while limit is None or removed < limit:
+            with self._index_lock:
+                if not self._index or self._index[0][0] >= threshold:
+                    break
+                mtime, sid = heapq.heappop(self._index)
+                if self._mtimes.get(sid) != mtime:
+                    continue
+                del self._mtimes[sid]
+            path = self.get_session_filename(sid)
+            try:
+                mtime = os.path.getmtime(path)
+                if mtime >= threshold:
+                    # saved by an other process in the meantime
+                    self._index_push(sid, mtime)
+                    continue
+                os.unlink(path)
+                removed += 1
+            except OSError:
+                pass
+        return removed
+
+class MemorySessionStore(werkzeug.contrib.sessions.SessionStore):
+    """ In-process store keeping the ``max_entries`` most recently used
+    sessions, the least recently used ones are dropped first.
+
+    Sessions are stored serialized so requests never share mutable state, as
+    with the filesystem store. Only suitable for single-process deployments
+    (threaded server), sessions are lost on restart.
+    """
+    shared = False
+
+    def __init__(self, session_class=None, max_entries=10000):
+        super(MemorySessionStore, self).__init__(session_class)
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        # sid -> (mtime, serialized data), in least recently used order
+        self._entries = collections.OrderedDict()
+
+    def save(self, session):
+        data = dumps(session)
+        with self._lock:
+            self._entries.pop(session.sid, None)
+            self._entries[session.sid] = (time.time(), data)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, session):
+        with self._lock:
+            self._entries.pop(session.sid, None)
+
+    def touch(self, session, min_age=0):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(session.sid)
+            if entry is None or now - entry[0] < min_age:
+                return False
+            self._entries[session.sid] = (now, entry[1])
+        return True
+
+    def get(self, sid):
+        if not self.is_valid_key(sid):
+            return self.new()
+        with self._lock:
+            entry = self._entries.pop(sid, None)
+            if entry is not None:
+                self._entries[sid] = entry
+        data = loads(entry[1]) if entry is not None else {}
+        return self.session_class(data, sid, False)
+
+    def list(self):
+        with self._lock:
+            return list(self._entries)
+
+    def vacuum(self, threshold, limit=None):
+        with self._lock:
+            expired = [sid for sid, (mtime, _) in self._entries.iteritems()
+                       if mtime < threshold]
+            expired.sort(key=lambda sid: self._entries[sid][0])
+            for sid in expired[:limit]:
+                del self._entries[sid]
+        return len(expired[:limit])
+
+class SQLiteSessionStore(werkzeug.contrib.sessions.SessionStore):
+    """ Stores sessions in a single SQLite database file, which can be shared
+    by all the workers of a prefork server running on the same host.
+
+    The database uses write-ahead logging so readers never block on the
+    (short) writes, each thread of each process gets its own connection, as
+    SQLite connections can not be used across ``fork()``.
+    """
+    shared = True
+
+    def __init__(self, path, session_class=None, timeout=30):
+        super(SQLiteSessionStore, self).__init__(session_class)
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+        # the store is created before prefork workers are, its connection is
+        # not kept for them to inherit
+        conn = self._connect()
+        try:
+            with _SQLiteCursor(conn) as cr:
+                cr.execute("CREATE TABLE IF NOT EXISTS sessions ("
+                           " sid TEXT PRIMARY KEY,"
+                           " data BLOB NOT NULL,"
+                           " mtime REAL NOT NULL)")
+                cr.execute("CREATE INDEX IF NOT EXISTS sessions_mtime_index"
+                           " ON sessions (mtime)")
+        finally:
+            conn.close()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=self.timeout)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _connection(self):
+        pid, conn = getattr(self._local, 'conn', (None, None))
+        if pid != os.getpid():
+            # none yet, or inherited from the parent process
+            conn = self._connect()
+            self._local.conn = (os.getpid(), conn)
+        return conn
+
+    def _cursor(self):
+        return _SQLiteCursor(self._connection())
+
+    def save(self, session):
+        with self._cursor() as cr:
+            cr.execute("INSERT OR REPLACE INTO sessions (sid, data, mtime)"
+                       " VALUES (?, ?, ?)",
+                       (session.sid, sqlite3.Binary(dumps(session)), time.time()))
+
+    def delete(self, session):
+        with self._cursor() as cr:
+            cr.execute("DELETE FROM sessions WHERE sid = ?", (session.sid,))
+
+    def touch(self, session, min_age=0):
+        now = time.time()
+        with self._cursor() as cr:
+            cr.execute("UPDATE sessions SET mtime = ? WHERE sid = ? AND mtime <= ?",
+                       (now, session.sid, now - min_age))
+            return cr.rowcount > 0
+
+    def get(self, sid):
+        if not self.is_valid_key(sid):
+            return self.new()
+        with self._cursor() as cr:
+            cr.execute("SELECT data FROM sessions WHERE sid = ?", (sid,))
+            row = cr.fetchone()
+        data = {}
+        if row is not None:
+            try:
+                data = loads(str(row[0]))
+            except Exception:
+                _logger.warning("Could not load session %s", sid, exc_info=True)
+        return self.session_class(data, sid, False)
+
+    def list(self):
+        with self._cursor() as cr:
+            cr.execute("SELECT sid FROM sessions")
+            return [row[0] for row in cr.fetchall()]
+
+    def vacuum(self, threshold, limit=None):
+        with self._cursor() as cr:
+            cr.execute("DELETE FROM sessions WHERE sid IN ("
+                       " SELECT sid FROM sessions WHERE mtime < ?"
+                       " ORDER BY mtime LIMIT ?)",
+                       (threshold, -1 if limit is None else limit))
+            return cr.rowcount
+
+class _SQLiteCursor(object):
+    """ Cursor context manager, commits on success and rolls back on errors
+    """
+    def __init__(self, conn):
+        self.conn = conn
+    def __enter__(self):
+        self.cr = self.conn.cursor()
+        return self.cr
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            if exc_type is None:
+                self.conn.commit()
+            else:
+                self.conn.rollback()
+        finally:
+            self.cr.close()
+
+class SessionSweeper(object):
+    """ Removes the sessions of ``store`` not saved for ``lifetime`` seconds,
+    at most ``batch`` of them every ``interval`` seconds, from a background
+    thread so requests never pay for it.
+
+    The thread is started by :meth:`ensure_started`, to be called from each
+    request so each worker of a prefork server gets its own thread. When
+    ``lock_path`` is given, only the thread holding a lock of that file
+    sweeps, the threads of other processes taking over when its process
+    exits: the workers of a prefork server then don't all scan the store
+    and race to remove the same sessions.
+
+    .. attribute:: stats
+
+        sweeping statistics: number of ``sweeps``, sessions ``expired``,
+        ``total_duration``, ``last_duration`` and ``max_duration`` of the
+        sweeps in seconds
+    """
+    def __init__(self, store, lifetime=60*60*24*7, interval=60, batch=1000, lock_path=None):
+        self.store = store
+        self.lifetime = lifetime
+        self.interval = interval
+        self.batch = batch
+        self.lock_path = lock_path
+        self._lock_file = None
+        self._lock_pid = None
+        self.stats = dict.fromkeys(
+            ['sweeps', 'expired', 'total_duration', 'last_duration', 'max_duration'], 0)
+        self._lock = threading.Lock()
+        self._pid = None
+
+    def sweep(self):
+        """ Runs a single bounded sweep, returns the number of removed sessions
+        """
+        start = time.time()
+        expired = self.store.vacuum(start - self.lifetime, self.batch)
+        duration = time.time() - start
+        with self._lock:
+            self.stats['sweeps'] += 1
+            self.stats['expired'] += expired
+            self.stats['total_duration'] += duration
+            self.stats['last_duration'] = duration
+            self.stats['max_duration'] = max(self.stats['max_duration'], duration)
+        _logger.log(logging.INFO if expired else logging.DEBUG,
+                    "Session sweep: %d expired sessions removed in %.3fs (%d since start)",
+                    expired, duration, self.stats['expired'])
+        return expired
+
+    def ensure_started(self):
+        if not self.interval or self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+        t = threading.Thread(target=self._run, name="openerp.web.session_sweeper")
+        t.daemon = True
+        t.start()
+
+    def elected(self):
+        """ Whether this process sweeps the store, holding the lock of
+        ``lock_path`` if given
+        """
+        if self.lock_path is None or fcntl is None:
+            return True
+        if self._lock_file is not None and self._lock_pid == os.getpid():
+            return True
+        # a lock file inherited from the parent process is not ours
+        f = open(self.lock_path, 'a')
+        try:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except IOError:
+            f.close()
+            return False
+        self._lock_file = f
+        self._lock_pid = os.getpid()
+        return True
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                if not self.elected():
+                    continue
+                # a full batch likely means more are waiting, carry on
+                while self.sweep() >= self.batch:
+                    pass
+            except Exception:
+                _logger.exception("Session sweep failed")
+
+def filesystem_store(path, session_class):
+    return FilesystemSessionStore(path, session_class=session_class,
+                                  shard_depth=int(config.get('session_shard_depth', 1)))
+
+def memory_store(path, session_class):
+    return MemorySessionStore(session_class=session_class,
+                              max_entries=int(config.get('session_store_size', 10000)))
+
+def sqlite_store(path, session_class):
+    return SQLiteSessionStore(os.path.join(path, 'sessions.sqlite'), session_class=session_class)
+
+backends = {
+    "filesystem": filesystem_store,
+    "memory": memory_store,
+    "sqlite": sqlite_store,
+}
+""" Session store factories by name, called with the sessions directory and
+the session class. Addons may register additional backends here.
+"""
+
+# vim:et:ts=4:sw=4:
@@ -230,20 +230,56 @@ instance.web.Session.include( /** @lends instance.web.Session# */{
      */
     session_init: function () {
         var self = this;
-        return this.session_reload().then(function(result) {
-            var modules = instance._modules.join(',');
-            var deferred = self.rpc('/web/webclient/qweblist', {mods: modules}).then(self.load_qweb.bind(self));
-            if(self.session_is_valid()) {
-                return deferred.then(function() { return self.load_modules(); });
+        var cached = this.get_cached_translations();
+        return this.rpc('/web/webclient/bootstrap', {
+            mods: instance._modules,
+            db: $.deparam.querystring().db || null,
+            translations: cached ? cached.digest : null
+        }).then(function(result) {
+            delete result.session.session_id;
+            _.extend(self, result.session);
+            var translations = result.translations;
+            if (translations.modules) {
+                self.set_cached_translations(translations);
+            } else {
+                translations = cached;
             }
-            return $.when(
-                    deferred,
-                    self.rpc('/web/webclient/bootstrap_translations', {mods: instance._modules}).then(function(trans) {
-                        instance.web._t.database.set_bundle(trans);
-                    })
-            );
+            instance.web._t.database.set_bundle(translations);
+            var deferred = self.load_qweb(result.qweb);
+            if (!result.modules) {
+                return deferred;
+            }
+            return deferred.then(function() {
+                return self.init_modules(result.modules, $.when(), function(type) {
+                    return $.when(result.assets[type]);
+                });
+            });
         });
     },
+    /**
+     * The translations kept by the browser, whose digest is given to the
+     * bootstrap so they are only sent if they changed
+     */
+    get_cached_translations: function() {
+        if (typeof(localStorage) == 'undefined') {
+            return null;
+        }
+        try {
+            return JSON.parse(localStorage.getItem('openerp.web.translations'));
+        } catch (e) {
+            return null;
+        }
+    },
+    set_cached_translations: function(translations) {
+        if (typeof(localStorage) == 'undefined') {
+            return;
+        }
+        try {
+            localStorage.setItem('openerp.web.translations', JSON.stringify(translations));
+        } catch (e) {
+            // quota exceeded, they are just not kept
+        }
+    },
     session_is_valid: function() {
         var db = $.deparam.querystring().db;
         if (db && this.db !== db) {
@@ -301,39 +337,53 @@ instance.web.Session.include( /** @lends instance.web.Session# */{
     load_modules: function() {
         var self = this;
         return this.rpc('/web/session/modules', {}).then(function(result) {
-            var all_modules = _.uniq(self.module_list.concat(result));
-            var to_load = _.difference(result, self.module_list).join(',');
-            self.module_list = all_modules;
-
-            var loaded = self.load_translations();
-            var datejs_locale = "/web/static/lib/datejs/globalization/" + self.user_context.lang.replace("_", "-") + ".js";
-
-            var file_list = [ datejs_locale ];
-            if(to_load.length) {
-                loaded = $.when(
-                    loaded,
-                    self.rpc('/web/webclient/csslist', {mods: to_load}).done(self.load_css.bind(self)),
-                    self.rpc('/web/webclient/qweblist', {mods: to_load}).then(self.load_qweb.bind(self)),
-                    self.rpc('/web/webclient/jslist', {mods: to_load}).done(function(files) {
-                        file_list = file_list.concat(files);
-                    })
-                );
-            }
-            return loaded.then(function () {
-                return self.load_js(file_list);
-            }).done(function() {
-                self.on_modules_loaded();
-                self.trigger('module_loaded');
-                if (!Date.CultureInfo.pmDesignator) {
-                    // If no am/pm designator is specified but the openerp
-                    // datetime format uses %i, date.js won't be able to
-                    // correctly format a date. See bug#938497.
-                    Date.CultureInfo.amDesignator = 'AM';
-                    Date.CultureInfo.pmDesignator = 'PM';
-                }
+            return self.init_modules(result, self.load_translations(), function(type, mods) {
+                return self.rpc('/web/webclient/' + type + 'list', {mods: mods});
             });
         });
     },
+    /**
+     * Loads the installed modules which are not loaded yet and init them
+     *
+     * @param {Array} modules installed modules
+     * @param {$.Deferred} translated loading of the translations
+     * @param {Function} assets returns a deferred of the ``css``, ``qweb``
+     *                          or ``js`` files of modules
+     */
+    init_modules: function(modules, translated, assets) {
+        var self = this;
+        var all_modules = _.uniq(self.module_list.concat(modules));
+        var to_load = _.difference(modules, self.module_list).join(',');
+        self.module_list = all_modules;
+
+        var loaded = translated;
+        var datejs_locale = "/web/static/lib/datejs/globalization/" + self.user_context.lang.replace("_", "-") + ".js";
+
+        var file_list = [ datejs_locale ];
+        if(to_load.length) {
+            loaded = $.when(
+                loaded,
+                assets('css', to_load).done(self.load_css.bind(self)),
+                assets('qweb', to_load).then(self.load_qweb.bind(self)),
+                assets('js', to_load).done(function(files) {
+                    file_list = file_list.concat(files);
+                })
+            );
+        }
+        return loaded.then(function () {
+            return self.load_js(file_list);
+        }).done(function() {
+            self.on_modules_loaded();
+            self.trigger('module_loaded');
+            if (!Date.CultureInfo.pmDesignator) {
+                // If no am/pm designator is specified but the openerp
+                // datetime format uses %i, date.js won't be able to
+                // correctly format a date. See bug#938497.
+                Date.CultureInfo.amDesignator = 'AM';
+                Date.CultureInfo.pmDesignator = 'PM';
+            }
+        });
+    },
     load_translations: function() {
         return instance.web._t.database.load_translations(this, this.module_list, this.user_context.lang);
     },
@@ -374,6 +424,10 @@ instance.web.Session.include( /** @lends instance.web.Session# */{
         var self = this;
         _.each(files, function(file) {
             self.qweb_mutex.exec(function() {
+                // templates compiled by the server, adding themselves
+                if (/^\/web\/webclient\/qwebjs\//.test(file)) {
+                    return self.load_js([file]);
+                }
                 return self.rpc('/web/proxy/load', {path: file}).then(function(xml) {
                     if (!xml) { return; }
                     instance.web.qweb.add_template(_.str.trim(xml));
@@ -672,6 +726,27 @@ instance.web.qweb.preprocess_node = function() {
     }
 };
 
+/**
+ * Translates the templates compiled by the server when rendering them, as
+ * preprocess_node does when compiling the others
+ */
+instance.web.qweb.translate = instance.web._t;
+/**
+ * Registers the functions of templates compiled by the server, unless
+ * extensions of the templates are pending: the engine then compiles them
+ * along with their extensions.
+ *
+ * @param {Object} templates compiled templates by name
+ */
+instance.web.qweb.add_compiled_templates = function (templates) {
+    for (var name in templates) {
+        var extensions = this.extend_templates[name];
+        if (templates.hasOwnProperty(name) && !(extensions && extensions.length)) {
+            this.compiled_templates[name] = templates[name];
+        }
+    }
+};
+
 /** Setup jQuery timeago */
 var _t = instance.web._t;
 /*
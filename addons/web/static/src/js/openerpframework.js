@@ -823,17 +823,87 @@ var genericJsonRpc = function(fct_name, params, fct) {
     });
 };
 
+var postJson = function(url, data, settings) {
+    return $.ajax(url, _.extend({}, settings, {
+        url: url,
+        dataType: 'json',
+        type: 'POST',
+        data: JSON.stringify(data),
+        contentType: 'application/json'
+    }));
+};
+
+/**
+ * Calls issued during the same tick are sent together as a single JSON-RPC2
+ * batch, the method of each call being its route. Only calls to a route of
+ * the origin server without specific ajax settings (but headers) are batched.
+ */
+var rpcBatch = null;
+var flushRpcBatch = function() {
+    var calls = rpcBatch;
+    rpcBatch = null;
+    _.each(_.groupBy(calls, function(call) { return call.key; }), function(calls) {
+        if (calls.length === 1) {
+            var call = calls[0];
+            postJson(call.url, call.data, call.settings).done(function() {
+                call.deferred.resolve.apply(call.deferred, arguments);
+            }).fail(function() {
+                call.deferred.reject.apply(call.deferred, arguments);
+            });
+            return;
+        }
+        // the calls' own ids may collide, those of the batch are their
+        // indexes and are replaced back in the responses
+        postJson(openerp.jsonRpc.batchUrl, _.map(calls, function(call, index) {
+            return _.extend({}, call.data, {method: call.url, id: index});
+        }), calls[0].settings).done(function(responses) {
+            var by_id = {};
+            _.each(responses, function(response) {
+                by_id[response.id] = response;
+            });
+            _.each(calls, function(call, index) {
+                var response = by_id[index];
+                if (response) {
+                    call.deferred.resolve(_.extend({}, response, {id: call.data.id}));
+                } else {
+                    call.deferred.resolve({error: {
+                        code: -32603, message: "Missing response in batch"}});
+                }
+            });
+        }).fail(function() {
+            var args = arguments;
+            _.each(calls, function(call) {
+                call.deferred.reject.apply(call.deferred, args);
+            });
+        });
+    });
+};
+
 openerp.jsonRpc = function(url, fct_name, params, settings) {
     return genericJsonRpc(fct_name, params, function(data) {
-        return $.ajax(url, _.extend({}, settings, {
+        var batchable = openerp.jsonRpc.batch && url.charAt(0) === '/' &&
+            url.charAt(1) !== '/' && url.indexOf('?') === -1 &&
+            _.isEmpty(_.without(_.keys(settings || {}), 'headers'));
+        if (! batchable) {
+            return postJson(url, data, settings);
+        }
+        if (rpcBatch === null) {
+            rpcBatch = [];
+            setTimeout(flushRpcBatch, 0);
+        }
+        var deferred = $.Deferred();
+        rpcBatch.push({
             url: url,
-            dataType: 'json',
-            type: 'POST',
-            data: JSON.stringify(data),
-            contentType: 'application/json'
-        }));
+            data: data,
+            settings: settings,
+            key: JSON.stringify((settings || {}).headers || {}),
+            deferred: deferred
+        });
+        return deferred;
     });
 };
+openerp.jsonRpc.batch = true;
+openerp.jsonRpc.batchUrl = '/web/batch';
 
 openerp.jsonpRpc = function(url, fct_name, params, settings) {
     settings = settings || {};
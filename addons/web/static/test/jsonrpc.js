@@ -27,6 +27,36 @@ function (test) {
             ok(result.length > 0, "Result returned by /gen_session_id");
         });
     });*/
+    test('batch-jsonrpc', {asserts: 2}, function () {
+        var session = new openerp.Session();
+        var tmp = _.uniqueId("something");
+        return session.rpc("/web/tests/set_session_value", {value: tmp}).then(function() {
+            // issued in the same tick, sent as one batch
+            return $.when(session.rpc("/gen_session_id", {}),
+                          session.rpc("/web/tests/get_session_value", {}));
+        }).then(function(sid, result) {
+            ok(sid.length > 0, "Result returned by /gen_session_id");
+            equal(result, tmp, "Got the same value from the session");
+        });
+    });
+    test('batch-jsonrpc-same-ids', {asserts: 2}, function () {
+        var session = new openerp.Session();
+        var tmp = _.uniqueId("something");
+        return session.rpc("/web/tests/set_session_value", {value: tmp}).then(function() {
+            var random = Math.random;
+            // both calls of the batch get the same id
+            Math.random = function() { return 0.5; };
+            try {
+                return $.when(session.rpc("/gen_session_id", {}),
+                              session.rpc("/web/tests/get_session_value", {}));
+            } finally {
+                Math.random = random;
+            }
+        }).then(function(sid, result) {
+            notEqual(sid, result, "Each call got its own response");
+            equal(result, tmp, "Got the same value from the session");
+        });
+    });
     test('session-jsonrpc', {asserts: 2}, function () {
         var session = new openerp.Session();
         var tmp = _.uniqueId("something");
@@ -1,9 +1,15 @@
 # -*- coding: utf-8 -*-
-from . import test_dataset, test_menu, test_serving_base, test_js
+from . import test_dataset, test_menu, test_serving_base, test_js, test_http, \
+    test_session_stores, test_json_codecs, test_bundles, test_qweb_compiler
 
 fast_suite = []
 checks = [
     test_dataset,
     test_menu,
     test_serving_base,
+    test_http,
+    test_session_stores,
+    test_json_codecs,
+    test_bundles,
+    test_qweb_compiler,
 ]
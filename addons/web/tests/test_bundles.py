@@ -0,0 +1,448 @@
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import tempfile
+import threading
+import time
+import zlib
+
+import mock
+import simplejson
+import unittest2
+
+from openerp.addons.web import http
+from ..controllers import main
+from . import test_http
+
+class BundleTestCase(unittest2.TestCase):
+    """ Provides a ``test_assets`` addon with js, css and qweb files """
+    def setUp(self):
+        super(BundleTestCase, self).setUp()
+        self.path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.path)
+        os.makedirs(os.path.join(self.path, 'test_assets', 'static', 'src'))
+        patcher = mock.patch.dict(http.addons_manifest, {'test_assets': {
+            'addons_path': self.path,
+            'js': ['static/src/*.js'],
+            'css': ['static/src/*.css'],
+            'qweb': ['static/src/*.xml'],
+        }})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.write('a.js', 'var a = 1;\n')
+        self.write('b.js', 'var b = 2;\n')
+        self.write('base.css', '@charset "utf-8";\n.a { background: url(img/a.png); }\n')
+        self.write('base.xml', '<templates><t t-name="a">A</t></templates>')
+
+    def write(self, name, content, mtime=None):
+        path = os.path.join(self.path, 'test_assets', 'static', 'src', name)
+        with open(path, 'wb') as f:
+            f.write(content)
+        if mtime is not None:
+            os.utime(path, (mtime, mtime))
+        return path
+
+class TestBundleManager(BundleTestCase):
+    def setUp(self):
+        super(TestBundleManager, self).setUp()
+        self.bundles = main.BundleManager(check_interval=60)
+
+    def test_build(self):
+        bundle = self.bundles.get('js', 'test_assets')
+        self.assertEqual(bundle.content, 'var a=1;;var b=2;')
+        self.assertEqual([wp for _, wp in bundle.files],
+                         ['/test_assets/static/src/a.js', '/test_assets/static/src/b.js'])
+        css = self.bundles.get('css', 'test_assets,unknown')
+        self.assertTrue(css.content.startswith('@charset "utf-8";\n'))
+        self.assertIn('url(/test_assets/static/src/img/a.png)', css.content)
+        qweb = self.bundles.get('qweb', 'test_assets')
+        self.assertIn('t-name="a"', qweb.content)
+
+    def test_cached(self):
+        bundle = self.bundles.get('js', 'test_assets')
+        with mock.patch('os.path.getmtime') as getmtime, \
+                mock.patch.object(main, 'manifest_glob') as manifest_glob:
+            self.assertIs(self.bundles.get('js', 'test_assets'), bundle)
+            self.assertFalse(getmtime.called)
+            self.assertFalse(manifest_glob.called)
+        self.assertEqual(self.bundles.stats, {'hits': 1, 'checks': 0, 'builds': 1})
+
+    def test_modified(self):
+        bundle = self.bundles.get('js', 'test_assets')
+        self.write('a.js', 'var a = 3;\n', mtime=time.time() + 10)
+        self.assertIs(self.bundles.get('js', 'test_assets'), bundle)
+        self.bundles.check_interval = 0
+        self.assertEqual(self.bundles.get('js', 'test_assets').content, 'var a=3;;var b=2;')
+        # checked but unchanged
+        self.assertEqual(self.bundles.get('js', 'test_assets').content, 'var a=3;;var b=2;')
+        self.assertEqual(self.bundles.stats['builds'], 2)
+        self.assertEqual(self.bundles.stats['checks'], 2)
+
+    def test_added_removed(self):
+        self.bundles.check_interval = 0
+        self.bundles.get('js', 'test_assets')
+        self.write('c.js', 'var c = 3;\n')
+        self.assertEqual(self.bundles.get('js', 'test_assets').content,
+                         'var a=1;;var b=2;;var c=3;')
+        os.unlink(os.path.join(self.path, 'test_assets', 'static', 'src', 'a.js'))
+        self.assertEqual(self.bundles.get('js', 'test_assets').content,
+                         'var b=2;;var c=3;')
+
+    def test_max_entries(self):
+        self.bundles.max_entries = 2
+        for type in ['js', 'css', 'qweb']:
+            self.bundles.get(type, 'test_assets')
+        self.assertEqual(self.bundles._bundles.keys(),
+                         [('css', ('test_assets',)), ('qweb', ('test_assets',))])
+
+    def test_normalized_addons(self):
+        bundle = self.bundles.get('js', 'test_assets')
+        self.assertIs(self.bundles.get('js', 'unknown,test_assets,test_assets'), bundle)
+
+    def test_concurrent_builds(self):
+        # a bundle being built does not keep others from being served or built
+        building = threading.Event()
+        release = threading.Event()
+        build = self.bundles.build
+        def slow_build(type, addons):
+            if type == 'css':
+                building.set()
+                release.wait(5)
+            return build(type, addons)
+        self.bundles.build = slow_build
+        thread = threading.Thread(target=self.bundles.get, args=('css', 'test_assets'))
+        thread.start()
+        self.addCleanup(thread.join)
+        self.addCleanup(release.set)
+        building.wait(5)
+        self.assertEqual(self.bundles.get('js', 'test_assets').content, 'var a=1;;var b=2;')
+        release.set()
+        thread.join()
+        self.assertEqual(self.bundles.stats['builds'], 2)
+        self.assertEqual(self.bundles._key_locks, {})
+
+    def test_warmup(self):
+        self.assertIn(main.warmup_bundles, http.warmup_tasks)
+        with mock.patch.object(main, 'bundles', self.bundles), \
+                mock.patch.object(main, 'module_boot', return_value=['test_assets']):
+            main.warmup_bundles('db')
+        self.assertEqual(self.bundles.stats['builds'], 3)
+        self.assertIn('"a": function (dict) {', self.bundles.get('qwebjs', 'test_assets').content)
+        self.assertEqual(self.bundles.stats['builds'], 3)
+
+class TestPrebuiltBundles(BundleTestCase):
+    def setUp(self):
+        super(TestPrebuiltBundles, self).setUp()
+        self.output = os.path.join(self.path, 'assets')
+        self.built = main.build_bundles(self.output, ['test_assets', 'unknown'])
+
+    def test_build(self):
+        self.assertEqual([b.type for b in self.built], ['js', 'css', 'qweb', 'qwebjs'])
+        for bundle in self.built:
+            path = main.prebuilt_bundle_path(self.output, bundle.type, bundle.checksum)
+            with open(path, 'rb') as f:
+                self.assertEqual(f.read(), bundle.content)
+            with open(path + '.gz', 'rb') as f:
+                self.assertEqual(zlib.decompress(f.read(), 16 + zlib.MAX_WBITS), bundle.content)
+        # rebuilt bundles replace the previous ones in the index
+        main.build_bundles(self.output, ['test_assets'], types=['js'])
+        manager = main.BundleManager(prebuilt_path=self.output)
+        self.assertEqual(len(manager.prebuilt), 4)
+
+    def test_load(self):
+        manager = main.BundleManager(check_interval=0, prebuilt_path=self.output)
+        with mock.patch.object(main, 'manifest_glob') as manifest_glob:
+            bundle = manager.get('js', 'test_assets')
+            self.assertIs(manager.get('js', 'test_assets'), bundle)
+        self.assertFalse(manifest_glob.called)
+        self.assertTrue(bundle.prebuilt)
+        self.assertEqual(bundle.content, 'var a=1;;var b=2;')
+        self.assertIn('gzip', bundle.precompressed)
+        self.assertEqual(manager.stats['builds'], 0)
+
+    def test_order(self):
+        with mock.patch.dict(http.addons_manifest, {'test_other': {
+                'addons_path': self.path, 'depends': ['test_assets']}}):
+            self.assertEqual(main.module_boot_sort(['test_other', 'test_assets', 'web']),
+                             ['web', 'test_assets', 'test_other'])
+            main.build_bundles(self.output, ['test_other', 'test_assets'], types=['js'])
+            manager = main.BundleManager(prebuilt_path=self.output)
+            with mock.patch.object(main, '_logger') as logger:
+                self.assertTrue(manager.get('js', 'test_assets,test_other').prebuilt)
+                self.assertFalse(logger.warning.called)
+                # not prebuilt, built
+                self.assertFalse(manager.get('js', 'test_other').prebuilt)
+                self.assertTrue(logger.warning.called)
+
+class TestBundleUrls(BundleTestCase, test_http.RootTestCase):
+    def setUp(self):
+        super(TestBundleUrls, self).setUp()
+        patcher = mock.patch.object(main, 'bundles', main.BundleManager(check_interval=-1))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.checksum = main.bundles.get('js', 'test_assets').checksum
+
+    def endpoints(self):
+        webclient = main.WebClient()
+        return [webclient.js, webclient.css, webclient.qweb, webclient.qwebjs]
+
+    def test_manifest_list(self):
+        self.assertEqual(main.manifest_list('js', mods='test_assets'),
+                         ['/web/webclient/js/%s?mods=test_assets' % self.checksum])
+        self.assertEqual(main.manifest_list('js', mods='test_assets', debug=True),
+                         ['/test_assets/static/src/a.js', '/test_assets/static/src/b.js'])
+
+    def test_compiled_templates(self):
+        bundle = main.bundles.get('qwebjs', 'test_assets')
+        self.assertEqual(main.manifest_list('qwebjs', mods='test_assets'),
+                         ['/web/webclient/qwebjs/%s?mods=test_assets' % bundle.checksum])
+        self.assertEqual(main.manifest_list('qwebjs', mods='test_assets', debug=True),
+                         ['/test_assets/static/src/base.xml'])
+        response = self.client.get('/web/webclient/qwebjs/%s?mods=test_assets' % bundle.checksum)
+        self.assertTrue(response.headers['Content-Type'].startswith('application/javascript'))
+        self.assertIn('"a": function (dict) {', response.data)
+
+    def test_fingerprinted(self):
+        response = self.client.get('/web/webclient/js/%s?mods=test_assets' % self.checksum)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, 'var a=1;;var b=2;')
+        self.assertEqual(response.headers['Cache-Control'], 'public, max-age=31536000, immutable')
+
+    def test_compressed_once(self):
+        bundle = main.bundles.get('js', 'test_assets')
+        for _ in range(2):
+            response = self.client.get('/web/webclient/js/%s?mods=test_assets' % self.checksum,
+                                       headers=[('Accept-Encoding', 'gzip')])
+            self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+            self.assertEqual(response.data, bundle.precompressed['gzip'])
+        # not compressed, nor even hashed, when served
+        self.assertEqual(self.root.compressor.stats, {'hits': 0, 'misses': 0})
+
+    def test_redirect(self):
+        for url in ['/web/webclient/js?mods=test_assets',
+                    '/web/webclient/js/outdated?mods=test_assets']:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 302)
+            self.assertEqual(response.headers['Location'],
+                             'http://localhost/web/webclient/js/%s?mods=test_assets' % self.checksum)
+
+    def test_precompressed(self):
+        output = os.path.join(self.path, 'assets')
+        main.build_bundles(output, ['test_assets'])
+        with mock.patch.object(main, 'bundles', main.BundleManager(prebuilt_path=output)):
+            bundle = main.bundles.get('js', 'test_assets')
+            response = self.client.get('/web/webclient/js/%s?mods=test_assets' % self.checksum,
+                                       headers=[('Accept-Encoding', 'gzip')])
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(response.data, bundle.precompressed['gzip'])
+
+class TestBootstrap(BundleTestCase, test_http.RootTestCase):
+    def setUp(self):
+        super(TestBootstrap, self).setUp()
+        self.session = {'session_id': 'x', 'uid': None, 'user_context': {},
+                        'db': None, 'username': None}
+        for patcher in [
+                mock.patch.object(main, 'bundles', main.BundleManager(check_interval=-1)),
+                mock.patch.object(main, 'module_installed',
+                                  return_value=['test_assets', 'test_other']),
+                mock.patch.object(main.Session, 'get_session_info',
+                                  side_effect=lambda: dict(self.session)),
+                mock.patch.object(main.WebClient, 'translations',
+                                  return_value={'modules': {'test_other': {}}}),
+                mock.patch.object(main.WebClient, 'bootstrap_translations',
+                                  return_value={'modules': {}})]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def endpoints(self):
+        return [main.WebClient().bootstrap]
+
+    def bootstrap(self, **params):
+        params.setdefault('mods', ['test_assets'])
+        response = self.client.post('/web/webclient/bootstrap', data=simplejson.dumps(
+            {'jsonrpc': '2.0', 'method': 'call', 'params': params, 'id': 1}),
+            content_type='application/json')
+        return simplejson.loads(response.data)['result']
+
+    def test_anonymous(self):
+        result = self.bootstrap()
+        self.assertEqual(result['session']['uid'], None)
+        self.assertEqual(result['qweb'], main.manifest_list('qwebjs', mods='test_assets'))
+        self.assertIsNone(result['modules'])
+        self.assertEqual(result['assets'], {})
+        self.assertEqual(result['translations']['modules'], {})
+
+    def test_logged(self):
+        self.session.update(uid=1, db='db', user_context={'lang': 'fr_FR'})
+        result = self.bootstrap()
+        self.assertEqual(result['modules'], ['test_assets', 'test_other'])
+        self.assertEqual(result['assets'], {
+            'css': main.manifest_list('css', mods='test_other'),
+            'qweb': main.manifest_list('qwebjs', mods='test_other'),
+            'js': main.manifest_list('js', mods='test_other'),
+        })
+        self.assertEqual(sorted(main.WebClient.translations.call_args[1]['mods']),
+                         ['test_assets', 'test_other'])
+        self.assertEqual(main.WebClient.translations.call_args[1]['lang'], 'fr_FR')
+        self.assertIn('test_other', result['translations']['modules'])
+        # an other database is requested
+        self.assertIsNone(self.bootstrap(db='other')['modules'])
+
+    def test_translations_kept(self):
+        digest = self.bootstrap()['translations']['digest']
+        self.assertEqual(self.bootstrap(translations=digest)['translations'], {'digest': digest})
+        self.assertIn('modules', self.bootstrap(translations='outdated')['translations'])
+
+class TestMinifyCache(BundleTestCase):
+    def setUp(self):
+        super(TestMinifyCache, self).setUp()
+        self.cache = main.MinifyCache(main.rjsmin)
+        patcher = mock.patch.object(main, 'js_minify_cache', self.cache)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_per_file(self):
+        a, b = [os.path.join(self.path, 'test_assets', 'static', 'src', name)
+                for name in ['a.js', 'b.js']]
+        content, checksum = main.concat_js([a, b])
+        self.assertEqual(content, 'var a=1;;var b=2;')
+        # the checksum of the sources, as for the other bundles
+        self.assertEqual(checksum, main.concat_files([a, b])[1])
+        self.write('b.js', 'var b = 3;\n')
+        with mock.patch.object(self.cache, 'minifier', wraps=main.rjsmin) as minifier:
+            self.assertEqual(main.concat_js([a, b])[0], 'var a=1;;var b=3;')
+        minifier.assert_called_once_with('var b = 3;\n')
+        self.assertEqual(self.cache.stats, {'hits': 1, 'misses': 3})
+
+    def test_bounded(self):
+        self.cache.max_size = 20
+        for i in range(5):
+            self.cache.minify('var a = %d;' % i)
+        self.assertLessEqual(self.cache._size, 20)
+        self.assertEqual(len(self.cache._cache), 2)
+        self.assertEqual(self.cache._cache.values(), ['var a=3;', 'var a=4;'])
+
+class TestCssBundle(BundleTestCase):
+    def setUp(self):
+        super(TestCssBundle, self).setUp()
+        self.cache = main.MinifyCache(main.css_rewrite, sizeof=lambda r: len(r[2]))
+        patcher = mock.patch.object(main, 'css_rewrite_cache', self.cache)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.files = [
+            (self.write(name, content), '/test_assets/static/src/' + name)
+            for name, content in [
+                ('base.css', '@charset "utf-8";\n.a { background: url(img/a.png); }\n'),
+                ('more.css', '@import "print.css";\n/* b */\n.b  > p :hover,\n.c {\n  content: "a  ;  b";\n  color: red;\n}\n'),
+            ]]
+
+    def test_concat(self):
+        content, _ = main.concat_css(self.files)
+        self.assertEqual(content, '\n'.join([
+            '@charset "utf-8";',
+            '@import "/test_assets/static/src/print.css";',
+            '.a{background:url(/test_assets/static/src/img/a.png)}'
+            '.b>p :hover,.c{content:"a  ;  b";color:red}',
+        ]))
+
+    def test_not_minified(self):
+        with mock.patch.object(main, 'css_minify', False):
+            content, _ = main.concat_css(self.files)
+        self.assertIn('.b  > p :hover,\n.c {\n  content: "a  ;  b";', content)
+        self.assertNotIn('@import', content.split('\n', 2)[2])
+
+    def test_per_file(self):
+        _, checksum = main.concat_css(self.files)
+        self.write('more.css', '.b { color: blue; }')
+        with mock.patch.object(self.cache, 'minifier', wraps=main.css_rewrite) as rewrite:
+            content, new_checksum = main.concat_css(self.files)
+        rewrite.assert_called_once_with('.b { color: blue; }', '/test_assets/static/src', True)
+        self.assertNotEqual(checksum, new_checksum)
+        self.assertTrue(content.endswith('.b{color:blue}'))
+
+    def test_import_changed(self):
+        content, checksum = main.concat_css(self.files)
+        self.write('more.css', '@import "screen.css";\n/* b */\n.b  > p :hover,\n.c {\n  content: "a  ;  b";\n  color: red;\n}\n')
+        new_content, new_checksum = main.concat_css(self.files)
+        self.assertNotEqual(new_content, content)
+        self.assertNotEqual(new_checksum, checksum)
+
+    def test_same_file_elsewhere(self):
+        self.files.append((self.files[0][0], '/other/static/src/base.css'))
+        content, _ = main.concat_css(self.files)
+        self.assertIn('url(/other/static/src/img/a.png)', content)
+        self.assertEqual(self.cache.stats['misses'], 3)
+
+    def test_comments_in_strings(self):
+        self.assertEqual(main.cssmin('.a{content:"/*"} .b{color:red} /* c */ .d{color:blue}'),
+                         '.a{content:"/*"}.b{color:red}.d{color:blue}')
+        self.assertEqual(main.cssmin('.a { content: "a  /* b */  c"; } /* it\'s */ .b { }'),
+                         '.a{content:"a  /* b */  c"}.b{}')
+
+class TestQwebBundle(BundleTestCase):
+    def setUp(self):
+        super(TestQwebBundle, self).setUp()
+        self.cache = main.MinifyCache(main.qweb_templates, sizeof=lambda r: len(r[1]))
+        patcher = mock.patch.object(main, 'qweb_templates_cache', self.cache)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.files = [self.write('base.xml', """<templates>
+    <t t-name="a">
+        <div class="a">
+            <span>A</span>  <span>B</span>
+            <div>   </div>
+        </div>
+    </t>
+
+    <t t-name="b">
+        <pre>  1
+  2</pre>
+        <t t-set="sep">  |  </t>
+        <t t-js="ctx">
+            // comment
+            ctx.a = 1;
+        </t>
+    </t>
+</templates>"""), self.write('more.xml', """<templates>
+    <t t-extend="a">
+        <t t-jquery="div.a" t-operation="append">
+            <p>C</p>
+        </t>
+        <t t-jquery="span">
+            this.addClass('b');
+            // done
+        </t>
+    </t>
+</templates>""")]
+
+    def test_minified(self):
+        content, _ = main.concat_xml(self.files)
+        self.assertEqual(content, ''.join([
+            '<templates>',
+            '<t t-name="a"> <div class="a"> <span>A</span> <span>B</span> <div> </div> </div> </t>',
+            '<t t-name="b"> <pre>  1\n  2</pre> <t t-set="sep">  |  </t> ',
+            '<t t-js="ctx">\n            // comment\n            ctx.a = 1;\n        </t> </t>',
+            '<t t-extend="a"> <t t-jquery="div.a" t-operation="append"> <p>C</p> </t> ',
+            '<t t-jquery="span">\n            this.addClass(\'b\');\n            // done\n        </t> </t>',
+            '</templates>',
+        ]))
+
+    def test_preserved_root(self):
+        source = '<templates xml:space="preserve">\n  <t t-name="c">\n    <p>  C  </p>\n  </t>\n</templates>'
+        self.assertEqual(main.qweb_templates(source, minify=True),
+                         main.qweb_templates(source, minify=False))
+        self.assertIn('<p>  C  </p>', main.qweb_templates(source, minify=True)[1])
+
+    def test_not_minified(self):
+        with mock.patch.object(main, 'qweb_minify', False):
+            content, checksum = main.concat_xml(self.files)
+        self.assertIn('<span>A</span>  <span>B</span>\n', content)
+        self.assertNotEqual(checksum, main.concat_xml(self.files)[1])
+
+    def test_per_file(self):
+        main.concat_xml(self.files)
+        self.write('more.xml', '<templates><t t-name="c">C</t></templates>')
+        with mock.patch.object(self.cache, 'minifier', wraps=main.qweb_templates) as parse:
+            content, _ = main.concat_xml(self.files)
+        parse.assert_called_once_with('<templates><t t-name="c">C</t></templates>', True)
+        self.assertTrue(content.endswith('<t t-name="c">C</t></templates>'))
@@ -1,7 +1,10 @@
 # -*- coding: utf-8 -*-
+import mock
+
 from . import common
 
 import openerp.addons.web.controllers.main
+from openerp.addons.web import http
 from openerp.addons.web.http import request as req
 
 class TestDataSetController(common.MockRequestCase):
@@ -40,3 +43,12 @@ class TestDataSetController(common.MockRequestCase):
             self.dataset.do_search_read('fake.model', ['id']),
             {'records': [{'id': 1}, {'id': 2}, {'id': 3}], 'length': 3})
         self.assertFalse(self.read.called)
+
+    def test_users_write(self):
+        req.session.db = 'db'
+        with mock.patch.object(http, 'auth_cache') as auth_cache:
+            self.dataset._call_kw('res.users', 'write', [[2, 3], {'name': 'foo'}], {})
+            self.assertFalse(auth_cache.invalidate.called)
+            self.dataset._call_kw('res.users', 'write', [[2, 3], {'active': False}], {})
+            self.assertEqual(auth_cache.invalidate.call_args_list,
+                             [mock.call(db='db', uid=2), mock.call(db='db', uid=3)])
@@ -0,0 +1,709 @@
+# -*- coding: utf-8 -*-
+import collections
+import os
+import shutil
+import tempfile
+import threading
+import time
+import zlib
+
+import mock
+import simplejson
+import unittest2
+import werkzeug.routing
+import werkzeug.test
+import werkzeug.wrappers
+
+from openerp.addons.web import http
+
+class TestDbListCache(unittest2.TestCase):
+    def setUp(self):
+        self.cache = http.DbListCache(ttl=60)
+        self.httprequest = mock.Mock()
+        self.httprequest.environ = {'HTTP_HOST': 'foo.example.com:8069'}
+        patcher = mock.patch('openerp.netsvc.dispatch_rpc')
+        self.dispatch_rpc = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.dispatch_rpc.return_value = ['foo', 'foo_test', 'bar']
+        config_patcher = mock.patch.dict(http.config.options, {'dbfilter': '%d.*'})
+        config_patcher.start()
+        self.addCleanup(config_patcher.stop)
+
+    def test_filter(self):
+        self.assertEqual(self.cache.get(True, self.httprequest), ['foo', 'foo_test'])
+
+    def test_cached(self):
+        self.cache.get(True, self.httprequest)
+        self.cache.get(True, self.httprequest)
+        self.assertEqual(self.dispatch_rpc.call_count, 1)
+
+    def test_keyed_by_host(self):
+        self.cache.get(True, self.httprequest)
+        other = mock.Mock()
+        other.environ = {'HTTP_HOST': 'bar.example.com'}
+        self.assertEqual(self.cache.get(True, other), ['bar'])
+        self.assertEqual(self.dispatch_rpc.call_count, 2)
+
+    def test_clear(self):
+        self.cache.get(True, self.httprequest)
+        self.dispatch_rpc.return_value = ['foo', 'foo_test', 'foo_new']
+        self.cache.clear()
+        self.assertEqual(self.cache.get(True, self.httprequest),
+                         ['foo', 'foo_test', 'foo_new'])
+
+    def test_disabled(self):
+        self.cache.ttl = 0
+        self.cache.get(True, self.httprequest)
+        self.cache.get(True, self.httprequest)
+        self.assertEqual(self.dispatch_rpc.call_count, 2)
+
+    def test_bounded(self):
+        self.cache.max_entries = 10
+        for i in range(100):
+            other = mock.Mock()
+            other.environ = {'HTTP_HOST': 'host%d.example.com' % i}
+            self.cache.get(True, other)
+        self.assertLessEqual(len(self.cache._entries), 10)
+        self.assertFalse(hasattr(self.cache, '_regexes'))
+
+class TestAuthCache(unittest2.TestCase):
+    def setUp(self):
+        self.cache = http.AuthCache(ttl=60)
+        patcher = mock.patch.object(http, 'auth_cache', self.cache)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch('openerp.service.security.check')
+        self.check = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.session = http.OpenERPSession({}, 'sid', False)
+        self.session.update(db='db', uid=1, password='pass')
+
+    def test_cached(self):
+        self.session.check_security()
+        self.session.check_security()
+        self.assertEqual(self.check.call_count, 1)
+
+    def test_failure_not_cached(self):
+        self.check.side_effect = Exception('AccessDenied')
+        with self.assertRaises(Exception):
+            self.session.check_security()
+        self.assertFalse(self.cache.is_valid(self.session))
+
+    def test_key(self):
+        self.session.check_security()
+        self.session.password = 'other'
+        self.session.check_security()
+        self.assertEqual(self.check.call_count, 2)
+
+    def test_logout(self):
+        self.session.check_security()
+        self.session.logout()
+        self.session.update(db='db', uid=1, password='pass')
+        self.assertFalse(self.cache.is_valid(self.session))
+
+    def test_invalidate_user(self):
+        other = http.OpenERPSession({}, 'other', False)
+        other.update(db='db', uid=2, password='pass')
+        self.session.check_security()
+        other.check_security()
+        self.cache.invalidate(db='db', uid=1)
+        self.assertFalse(self.cache.is_valid(self.session))
+        self.assertTrue(self.cache.is_valid(other))
+        self.cache.invalidate(db='db')
+        self.assertFalse(self.cache.is_valid(other))
+
+    def test_expiration(self):
+        self.cache.ttl = 0
+        self.session.check_security()
+        self.session.check_security()
+        self.assertEqual(self.check.call_count, 2)
+
+class Handlers(object):
+    @http.route('/test/static', type='http', auth='none')
+    def static(self):
+        return 'static'
+
+    @http.route('/test/read', type='http', auth='none')
+    def read(self):
+        return http.request.session.get('value') or 'nothing'
+
+    @http.route('/test/write', type='http', auth='none')
+    def write(self, value):
+        http.request.session.value = value
+        return 'written'
+
+    @http.route('/test/bundle', type='http', auth='none')
+    def bundle(self, type='text/css'):
+        response = http.request.make_response('body { color: red; }\n' * 100,
+                                              [('Content-Type', type)])
+        response.set_etag('checksum')
+        return response
+
+    @http.route('/test/dated', type='http', auth='none')
+    def dated(self, color):
+        # an ETag which is not a digest of the body
+        response = http.request.make_response('body { color: %s; }\n' % color * 100,
+                                              [('Content-Type', 'text/css')])
+        response.set_etag('write_date')
+        return response
+
+    @http.route('/test/echo', type='json', auth='none')
+    def echo(self, value):
+        return value
+
+    @http.route('/test/records', type='json', auth='none')
+    def records(self, count):
+        return {'length': count, 'records': [
+            {'id': i, 'name': u'Record %d' % i} for i in range(count)]}
+
+    @http.route('/test/get', type='json', auth='none')
+    def get(self):
+        return http.request.session.get('value')
+
+    @http.route('/test/fail', type='json', auth='none')
+    def fail(self):
+        raise ValueError('fail')
+
+    @http.route('/test/execute', type='json', auth='none')
+    def execute(self, query):
+        http.request.cr.execute(query)
+        return query
+
+class RootTestCase(unittest2.TestCase):
+    def endpoints(self):
+        handlers = Handlers()
+        return [handlers.static, handlers.read, handlers.write, handlers.bundle,
+                handlers.echo, handlers.get, handlers.fail, handlers.records,
+                handlers.execute, handlers.dated]
+
+    def setUp(self):
+        for target, kw in [('openerp.addons.web.http.Root.load_addons', {}),
+                           ('openerp.addons.web.http.db_monodb', {'return_value': None})]:
+            patcher = mock.patch(target, **kw)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        config_patcher = mock.patch.dict(http.config.options, {
+            'session_store': 'memory', 'session_gc_interval': 0})
+        config_patcher.start()
+        self.addCleanup(config_patcher.stop)
+
+        self.root = http.Root()
+        self.root.no_db_router = werkzeug.routing.Map([
+            werkzeug.routing.Rule(route, endpoint=f)
+            for f in self.endpoints() for route in f.routes])
+        self.store = self.root.session_store
+        self.client = werkzeug.test.Client(self.root, werkzeug.wrappers.BaseResponse)
+
+class TestLazySession(RootTestCase):
+    def test_untouched(self):
+        with mock.patch.object(self.store, 'get') as get:
+            response = self.client.get('/test/static')
+        self.assertEqual(response.data, 'static')
+        self.assertFalse(get.called)
+        self.assertNotIn('Set-Cookie', response.headers)
+
+    def test_write_avoidance(self):
+        with mock.patch.object(self.store, 'save', wraps=self.store.save) as save:
+            response = self.client.get('/test/write?value=foo')
+            self.assertEqual(save.call_count, 1)
+            self.assertIn('Set-Cookie', response.headers)
+
+            # the cookie is kept by the client
+            response = self.client.get('/test/read')
+            self.assertEqual(response.data, 'foo')
+            self.assertEqual(save.call_count, 1)
+            self.assertNotIn('Set-Cookie', response.headers)
+
+            self.client.get('/test/write?value=foo')
+            self.assertEqual(save.call_count, 1)
+            self.client.get('/test/write?value=bar')
+            self.assertEqual(save.call_count, 2)
+
+    def test_new_session_not_stored(self):
+        response = self.client.get('/test/read')
+        self.assertEqual(response.data, 'nothing')
+        self.assertEqual(self.store.list(), [])
+
+class TestJsonBatch(RootTestCase):
+    def call(self, method, id, **params):
+        return {'jsonrpc': '2.0', 'method': method, 'params': params, 'id': id}
+
+    def post(self, calls, url='/web/batch'):
+        response = self.client.post(url, data=simplejson.dumps(calls),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        return simplejson.loads(response.data)
+
+    def test_batch(self):
+        responses = self.post([
+            self.call('/test/echo', 1, value='foo'),
+            self.call('/test/fail', 2),
+            self.call('/test/missing', 3),
+            self.call('/test/echo', 4, value='bar'),
+        ])
+        self.assertEqual([r['id'] for r in responses], [1, 2, 3, 4])
+        self.assertEqual(responses[0]['result'], 'foo')
+        self.assertEqual(responses[1]['error']['code'], 200)
+        self.assertEqual(responses[2]['error']['code'], 404)
+        self.assertEqual(responses[3]['result'], 'bar')
+
+    def test_single_session_load(self):
+        with mock.patch.object(self.root, 'load_session',
+                               wraps=self.root.load_session) as load_session:
+            self.post([self.call('/test/get', i) for i in range(3)])
+        self.assertEqual(load_session.call_count, 1)
+
+    def test_invalid(self):
+        call = self.call('/test/echo', 2, value='foo')
+        del call['id']
+        responses = self.post([42, call])
+        self.assertEqual(responses, [
+            {'jsonrpc': '2.0', 'id': None, 'error': http.INVALID_REQUEST}])
+        self.assertEqual(self.post([])['error'], http.INVALID_REQUEST)
+
+    def test_invalid_params(self):
+        call = self.call('/test/echo', 1, value='foo')
+        call['params'] = ['foo']
+        responses = self.post([call, self.call('/test/echo', 2, value='bar')])
+        self.assertEqual(responses[0], {'jsonrpc': '2.0', 'id': 1, 'error': http.INVALID_PARAMS})
+        self.assertEqual(responses[1]['result'], 'bar')
+
+    def test_transactional(self):
+        with mock.patch.object(http.JsonBatchRequest, 'registry',
+                               new_callable=mock.PropertyMock) as registry:
+            cr = registry.return_value.cursor.return_value.__enter__.return_value
+            responses = self.post([
+                self.call('/test/execute', 1, query='a'),
+                self.call('/test/execute', 2, query='b'),
+            ], url='/web/batch?transactional=1')
+            self.assertEqual([r['result'] for r in responses], ['a', 'b'])
+            self.assertEqual(registry.return_value.cursor.call_count, 1)
+            self.assertEqual(cr.execute.call_count, 2)
+            self.assertEqual(cr.commit.call_count, 1)
+
+            cr.reset_mock()
+            responses = self.post([
+                self.call('/test/execute', 1, query='a'),
+                self.call('/test/fail', 2),
+                self.call('/test/execute', 3, query='c'),
+            ], url='/web/batch?transactional=1')
+            self.assertEqual([r['error']['data']['name'] for r in responses], [
+                'openerp.addons.web.http.BatchRollback', 'exceptions.ValueError',
+                'openerp.addons.web.http.BatchRollback'])
+            self.assertEqual(cr.execute.call_count, 1)
+            self.assertFalse(cr.commit.called)
+            self.assertTrue(cr.rollback.called)
+
+class TestJsonStreaming(RootTestCase):
+    def post(self, count):
+        return self.client.post('/test/records', data=simplejson.dumps({
+            'jsonrpc': '2.0', 'method': 'call', 'params': {'count': count}, 'id': 1,
+        }), content_type='application/json')
+
+    def test_small(self):
+        response = self.post(10)
+        self.assertEqual(int(response.headers['Content-Length']), len(response.data))
+        self.assertEqual(simplejson.loads(response.data)['result']['length'], 10)
+
+    def test_streamed(self):
+        self.root.json_stream_threshold = 1024
+        with mock.patch.object(http.json_codecs, 'dumps',
+                               wraps=http.json_codecs.dumps) as dumps:
+            response = self.post(1000)
+        self.assertNotIn('Content-Length', response.headers)
+        result = simplejson.loads(response.data)['result']
+        self.assertEqual(result, {'length': 1000, 'records': [
+            {'id': i, 'name': u'Record %d' % i} for i in range(1000)]})
+        self.assertGreater(dumps.call_count, 1)
+
+class TestCompression(RootTestCase):
+    def get(self, url, encoding):
+        return self.client.get(url, headers=[('Accept-Encoding', encoding)])
+
+    def test_gzip(self):
+        response = self.get('/test/bundle', 'gzip, deflate')
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(response.headers['Vary'], 'Accept-Encoding')
+        self.assertEqual(int(response.headers['Content-Length']), len(response.data))
+        self.assertEqual(zlib.decompress(response.data, 16 + zlib.MAX_WBITS),
+                         'body { color: red; }\n' * 100)
+
+    @unittest2.skipIf(http.brotli is None, "brotli is not installed")
+    def test_brotli(self):
+        response = self.get('/test/bundle', 'gzip, deflate, br')
+        self.assertEqual(response.headers['Content-Encoding'], 'br')
+        self.assertEqual(http.brotli.decompress(response.data), 'body { color: red; }\n' * 100)
+        # explicitly less preferred
+        response = self.get('/test/bundle', 'gzip, br;q=0.5')
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+
+    def test_not_compressed(self):
+        response = self.get('/test/bundle', 'identity')
+        self.assertNotIn('Content-Encoding', response.headers)
+        self.assertEqual(response.headers['Vary'], 'Accept-Encoding')
+        # too small
+        response = self.get('/test/static', 'gzip')
+        self.assertEqual(response.data, 'static')
+        # not in the allowlist
+        response = self.get('/test/bundle?type=image/png', 'gzip')
+        self.assertNotIn('Content-Encoding', response.headers)
+
+    def test_cached(self):
+        with mock.patch.object(self.root.compressor, '_compress',
+                               wraps=self.root.compressor._compress) as compress:
+            first = self.get('/test/bundle', 'gzip')
+            second = self.get('/test/bundle', 'gzip')
+        self.assertEqual(compress.call_count, 1)
+        self.assertEqual(first.data, second.data)
+        self.assertEqual(self.root.compressor.stats, {'hits': 1, 'misses': 1})
+
+    def test_cached_by_body(self):
+        red = self.get('/test/dated?color=red', 'gzip')
+        blue = self.get('/test/dated?color=blue', 'gzip')
+        self.assertIn('blue', zlib.decompress(blue.data, 16 + zlib.MAX_WBITS))
+        self.assertIn('red', zlib.decompress(red.data, 16 + zlib.MAX_WBITS))
+        self.assertEqual(self.root.compressor.stats, {'hits': 0, 'misses': 2})
+
+    def test_streamed(self):
+        self.root.json_stream_threshold = 1024
+        response = self.client.post('/test/records', headers=[('Accept-Encoding', 'gzip')],
+            data=simplejson.dumps({'jsonrpc': '2.0', 'method': 'call',
+                                   'params': {'count': 1000}, 'id': 1}),
+            content_type='application/json')
+        self.assertNotIn('Content-Length', response.headers)
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        result = simplejson.loads(zlib.decompress(response.data, 16 + zlib.MAX_WBITS))['result']
+        self.assertEqual(result['length'], 1000)
+
+class TestRouters(RootTestCase):
+    def setUp(self):
+        super(TestRouters, self).setUp()
+        registries = collections.defaultdict(FakeRegistry)
+        modules = {'db1': frozenset(['web', 'mail']), 'db2': frozenset(['web', 'mail']),
+                   'db3': frozenset(['web'])}
+        for target, kw in [
+                ('openerp.modules.registry.RegistryManager.get', {'new': staticmethod(lambda db: registries[db])}),
+                ('openerp.addons.web.http.Root._router_modules', {'side_effect': lambda db: modules[db]}),
+                ('openerp.addons.web.http.Root._build_router', {'side_effect': lambda modules=None: werkzeug.routing.Map()})]:
+            patcher = mock.patch(target, **kw)
+            self.addCleanup(patcher.stop)
+            setattr(self, target.rsplit('.', 1)[1], patcher.start())
+
+    def test_shared(self):
+        router = self.root.get_db_router('db1')
+        self.assertIs(self.root.get_db_router('db2'), router)
+        self.assertIsNot(self.root.get_db_router('db3'), router)
+        self.assertEqual(self._build_router.call_count, 2)
+
+    def test_kept_on_registry(self):
+        router = self.root.get_db_router('db1')
+        self.assertIs(self.root.get_db_router('db1'), router)
+        self.assertEqual(self._router_modules.call_count, 1)
+
+    def test_no_db(self):
+        self.root.no_db_router = None
+        router = self.root.get_db_router(None)
+        self.assertIs(self.root.get_db_router(None), router)
+        self._build_router.assert_called_once_with()
+        self.assertFalse(self._router_modules.called)
+
+class FakeRegistry(object):
+    pass
+
+class TestWarmup(RootTestCase):
+    def setUp(self):
+        super(TestWarmup, self).setUp()
+        self.warmed = []
+        def get_db_router(db):
+            if db == 'broken':
+                raise ValueError(db)
+            self.warmed.append(db)
+        self.root.get_db_router = get_db_router
+        patcher = mock.patch.object(http, 'warmup_tasks', [lambda db: self.warmed.append(('task', db))])
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_run(self):
+        warmup = http.Warmup(self.root, ['db1', 'broken', 'db2'], threads=2)
+        warmup.run()
+        self.assertEqual(self.warmed[0], None)
+        self.assertItemsEqual(self.warmed[1:], ['db1', ('task', 'db1'), 'db2', ('task', 'db2')])
+        self.assertItemsEqual(warmup.stats['databases'], [None, 'db1', 'db2'])
+        self.assertEqual(warmup.stats['failed'], ['broken'])
+        self.assertIsNotNone(warmup.stats['duration'])
+
+    def test_all_databases(self):
+        with mock.patch('openerp.netsvc.dispatch_rpc', return_value=['db1', 'db2']):
+            warmup = http.Warmup(self.root, ['*', 'db3'])
+            self.assertEqual(warmup.databases(), ['db1', 'db2', 'db3'])
+            with mock.patch.dict(http.config.options, {'dbfilter': '%d_.*|db1'}):
+                self.assertEqual(warmup.databases(), ['db1', 'db3'])
+
+    def test_elected(self):
+        warmup = http.Warmup(self.root, ['db1'])
+        for elected in (False, True):
+            warmup._pid = None
+            with mock.patch('openerp.multi_process', True, create=True), \
+                    mock.patch.object(self.root.session_sweeper, 'elected', return_value=elected), \
+                    mock.patch('threading.Thread') as thread:
+                warmup.ensure_started()
+                warmup.ensure_started()
+            # the other workers don't warm up, nor try again
+            self.assertEqual(thread.call_count, int(elected))
+
+    def test_postload(self):
+        for multi_process, started in [(False, True), (True, False)]:
+            with mock.patch.object(http, 'Root') as Root, \
+                    mock.patch.object(http, 'root', None), \
+                    mock.patch('openerp.wsgi', create=True), \
+                    mock.patch('openerp.multi_process', multi_process, create=True):
+                http.wsgi_postload()
+            # not in a prefork master, its workers would inherit it
+            self.assertEqual(Root.return_value.warmup.ensure_started.called, started)
+
+    def test_disabled(self):
+        self.assertEqual(self.root.warmup.dbs, [])
+        with mock.patch('threading.Thread') as thread:
+            self.root.warmup.ensure_started()
+        self.assertFalse(thread.called)
+
+class TestManifestIndex(unittest2.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.path)
+        self.addons_path = os.path.join(self.path, 'addons')
+        self.index_path = os.path.join(self.path, 'index.json')
+        self.write_addon('addon_a', {'name': 'A', 'js': ['static/src/js/*.js']})
+        self.write_addon('addon_b', {'name': 'B'}, static=False)
+        with open(os.path.join(self.addons_path, 'README'), 'wb') as f:
+            f.write('not an addon')
+
+    def write_addon(self, name, manifest, static=True, mtime=None):
+        path = os.path.join(self.addons_path, name)
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        if static and not os.path.isdir(os.path.join(path, 'static')):
+            os.mkdir(os.path.join(path, 'static'))
+        with open(os.path.join(path, '__openerp__.py'), 'wb') as f:
+            f.write(repr(manifest))
+        if mtime is not None:
+            os.utime(os.path.join(path, '__openerp__.py'), (mtime, mtime))
+
+    def test_persisted(self):
+        index = http.ManifestIndex(self.index_path)
+        addons = index.addons(self.addons_path)
+        self.assertEqual(addons, [('addon_a', {'name': 'A', 'js': ['static/src/js/*.js']})])
+        self.assertEqual(index.stats['reads'], 1)
+        index.save()
+
+        index = http.ManifestIndex(self.index_path)
+        with mock.patch('os.listdir') as listdir:
+            self.assertEqual(index.addons(self.addons_path), addons)
+        self.assertFalse(listdir.called)
+        self.assertEqual(index.stats['reads'], 0)
+        self.assertIsInstance(index.addons(self.addons_path)[0][1]['name'], str)
+        self.assertFalse(index.changed)
+
+    def test_saved(self):
+        index = http.ManifestIndex(self.index_path)
+        index.addons(self.addons_path)
+        index.save()
+        self.assertEqual(sorted(os.listdir(self.path)), ['addons', 'index.json'])
+
+    def test_default_path(self):
+        sessions_path = os.path.join(self.path, 'sessions')
+        os.mkdir(sessions_path, 0700)
+        root = http.Root.__new__(http.Root)
+        root.statics = {}
+        root.import_addons = lambda modules: None
+        with mock.patch.object(http, 'manifest_index', None), \
+                mock.patch.object(http, 'session_path', return_value=sessions_path), \
+                mock.patch('openerp.modules.module.ad_paths', [self.addons_path]), \
+                mock.patch.dict(http.addons_manifest, clear=True):
+            root.load_addons()
+            self.assertEqual(http.manifest_index.path, os.path.join(sessions_path, 'addons_index.json'))
+        self.assertTrue(os.path.isfile(os.path.join(sessions_path, 'addons_index.json')))
+
+    def test_modified(self):
+        index = http.ManifestIndex(self.index_path)
+        index.addons(self.addons_path)
+        self.write_addon('addon_a', {'name': 'A2'}, mtime=time.time() + 10)
+        self.assertEqual(index.addons(self.addons_path), [('addon_a', {'name': 'A2'})])
+        self.assertEqual(index.stats['reads'], 2)
+
+    def test_added(self):
+        index = http.ManifestIndex(self.index_path)
+        index.addons(self.addons_path)
+        self.write_addon('addon_c', {'name': 'C'})
+        mtime = time.time() + 10
+        os.utime(self.addons_path, (mtime, mtime))
+        self.assertEqual([module for module, _ in index.addons(self.addons_path)],
+                         ['addon_a', 'addon_c'])
+
+    def test_load_addons(self):
+        for patcher in [
+                mock.patch('openerp.modules.module.ad_paths', [self.addons_path]),
+                mock.patch('openerp.conf.server_wide_modules', ['addon_a']),
+                mock.patch.object(http, 'manifest_index', http.ManifestIndex()),
+                mock.patch.dict(http.addons_manifest, clear=True),
+                mock.patch.dict(http.addons_module, clear=True)]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.write_addon('addon_c', {'name': 'C'})
+        imported = []
+        def fake_import(name, *args):
+            imported.append(name)
+            return name
+        root = http.Root.__new__(http.Root)
+        root.statics = {}
+        root.addons_lock = threading.Lock()
+        with mock.patch('__builtin__.__import__', side_effect=fake_import):
+            root.load_addons()
+        self.assertItemsEqual(http.addons_manifest, ['addon_a', 'addon_c'])
+        self.assertEqual(root.statics['/addon_c/static'],
+                         os.path.join(self.addons_path, 'addon_c', 'static'))
+        self.assertEqual(imported, ['openerp.addons.addon_a'])
+
+        root.no_db_router = object()
+        with mock.patch('__builtin__.__import__', side_effect=fake_import):
+            root.import_addons(['addon_a', 'addon_b', 'addon_c'])
+        self.assertEqual(imported, ['openerp.addons.addon_a', 'openerp.addons.addon_c'])
+        self.assertIsNone(root.no_db_router)
+
+class SignalingRegistry(object):
+    """ Tracks the clearing of its caches as the registry does """
+    def __init__(self):
+        self._any_cache_cleared = False
+        self.base_cache_signaling_sequence = 1
+
+    def any_cache_cleared(self):
+        return self._any_cache_cleared
+
+    def reset_any_cache_cleared(self):
+        self._any_cache_cleared = False
+
+class TestRegistrySignaling(unittest2.TestCase):
+    def setUp(self):
+        self.signaling = http.RegistrySignaling(interval=10)
+        self.registry = SignalingRegistry()
+        def signal_caches_change(db):
+            # only signals the caches changes the registry knows of
+            registry = registries[db]
+            if registry.any_cache_cleared():
+                registry.base_cache_signaling_sequence += 1
+                registry.reset_any_cache_cleared()
+        registries = {'db': self.registry}
+        for name, kw in [('check_registry_signaling', {}),
+                         ('signal_caches_change', {'side_effect': signal_caches_change}),
+                         ('registries', {'new': registries, 'create': True})]:
+            patcher = mock.patch('openerp.modules.registry.RegistryManager.' + name, **kw)
+            setattr(self, name, patcher.start())
+            self.addCleanup(patcher.stop)
+        patcher = mock.patch('openerp.multi_process', True, create=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_unthrottled(self):
+        self.signaling.interval = 0
+        self.signaling.check('db')
+        self.signaling.check('db')
+        self.signaling.signal('db')
+        self.assertEqual(self.check_registry_signaling.call_count, 2)
+        self.signal_caches_change.assert_called_once_with('db')
+        self.assertEqual(self.signaling.stats, {'checks': 2, 'signals': 1, 'saved': 0})
+
+    def test_throttled_check(self):
+        with mock.patch('time.time', return_value=1000):
+            self.signaling.check('db')
+            self.signaling.check('db')
+            self.signaling.check('other')
+        with mock.patch('time.time', return_value=1010):
+            self.signaling.check('db')
+        self.assertEqual([c[0][0] for c in self.check_registry_signaling.call_args_list],
+                         ['db', 'other', 'db'])
+        self.assertEqual(self.signaling.stats['saved'], 1)
+
+    def test_throttled_signal(self):
+        self.signaling.signal('db')
+        self.signaling.signal('unknown', force=True)
+        self.assertFalse(self.signal_caches_change.called)
+        self.registry._any_cache_cleared = True
+        self.signaling.signal('db')
+        self.signal_caches_change.assert_called_once_with('db')
+        self.assertEqual(self.registry.base_cache_signaling_sequence, 2)
+        self.assertEqual(self.signaling.stats['signals'], 1)
+
+    def test_forced(self):
+        for interval in (10, 0):
+            self.signaling.interval = interval
+            self.signaling.signal('db', force=True)
+        # signaled although the registry did not clear its caches itself
+        self.assertEqual(self.registry.base_cache_signaling_sequence, 3)
+        self.assertFalse(self.registry.any_cache_cleared())
+
+    def test_deactivated_user(self):
+        session = http.OpenERPSession({}, 'sid', False)
+        session.update(db='db', uid=2, password='pass')
+        for multi_process in (True, False):
+            with mock.patch.object(http, 'auth_cache', http.AuthCache(ttl=60)), \
+                    mock.patch('openerp.multi_process', multi_process), \
+                    mock.patch('openerp.service.security.check') as check:
+                session.check_security()
+                # the admin deactivates the user, which clears the caches of
+                # the registry
+                self.registry._any_cache_cleared = True
+                self.signaling.signal('db')
+                check.side_effect = Exception('AccessDenied')
+                with self.assertRaises(Exception):
+                    session.check_security()
+                self.assertFalse(self.registry.any_cache_cleared())
+
+    def test_forced_by_request(self):
+        httprequest = http.Request(werkzeug.test.EnvironBuilder().get_environ())
+        self.assertFalse(httprequest.force_signaling)
+        http.WebRequest(httprequest).signal_caches_change()
+        self.assertTrue(httprequest.force_signaling)
+
+class TestServerTiming(RootTestCase):
+    def setUp(self):
+        super(TestServerTiming, self).setUp()
+        self.root.server_timing = True
+
+    def post_json(self, path, params):
+        return self.client.post(path, data=simplejson.dumps(
+            {'jsonrpc': '2.0', 'method': 'call', 'params': params, 'id': 1}),
+            content_type='application/json')
+
+    def phases(self, response):
+        return [metric.split(';')[0] for metric in response.headers['Server-Timing'].split(', ')]
+
+    def test_header(self):
+        self.assertEqual(self.phases(self.client.get('/test/static')),
+                         ['route', 'auth', 'handler', 'total'])
+        self.assertEqual(self.phases(self.post_json('/test/get', {})),
+                         ['json', 'route', 'auth', 'handler', 'session', 'db', 'total'])
+        self.assertEqual(self.phases(self.client.get('/test/missing')),
+                         ['route', 'session', 'db', 'total'])
+
+    def test_disabled(self):
+        self.assertFalse(http.Root().server_timing)
+        self.root.server_timing = False
+        self.assertNotIn('Server-Timing', self.client.get('/test/static').headers)
+
+    def test_log(self):
+        self.root.timing_log = True
+        with mock.patch.object(http, '_timing_logger') as logger:
+            self.post_json('/test/echo', {'value': 1})
+            self.client.get('/test/missing')
+        entries = [simplejson.loads(c[0][0]) for c in logger.info.call_args_list]
+        self.assertEqual([(e['route'], e['status'], e['db'], e['uid']) for e in entries],
+                         [('/test/echo', 200, None, None), ('/test/missing', 404, None, None)])
+        self.assertItemsEqual(entries[0]['phases'], ['json', 'route', 'auth', 'handler'])
+
+    def test_exclusive_phases(self):
+        timer = http.RequestTimer()
+        with mock.patch('time.time', side_effect=[0, 1, 3, 6]):
+            with timer.phase('auth'):
+                with timer.phase('session'):
+                    pass
+        self.assertEqual(timer.phases, {'auth': 4, 'session': 2})
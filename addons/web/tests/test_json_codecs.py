@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+import decimal
+
+import mock
+import unittest2
+
+from openerp.addons.web import json_codecs
+
+class TestJsonCodecs(unittest2.TestCase):
+    def codecs(self):
+        return [codec() for codec in json_codecs.backends.itervalues() if codec.available]
+
+    def test_roundtrip(self):
+        data = {u'jsonrpc': u'2.0', u'id': 3, u'params': {
+            u'args': [[1, 2], {u'name': u'été', u'active': False, u'parent_id': None}],
+            u'credit': 12.5}}
+        for codec in self.codecs():
+            self.assertEqual(json_codecs.loads(json_codecs.dumps(data, codec), codec), data,
+                             codec.name)
+
+    def test_nonliteral(self):
+        for codec in self.codecs():
+            for payload in ['{"params": {"context": [{"__ref": "compound_context"}]}}',
+                            '[{"\\u005f_ref": 1}]',
+                            '[{"_\\u005Fr\\u0065f": 1}]']:
+                with self.assertRaises(ValueError):
+                    json_codecs.loads(payload, codec)
+            self.assertEqual(json_codecs.loads('{"ref": "__\\u00e9"}', codec),
+                             {'ref': u'__é'})
+
+    def test_scan_avoided(self):
+        with mock.patch.object(json_codecs, 'check_literal') as check_literal:
+            json_codecs.loads('{"params": {"name": "Stéphane"}}')
+            self.assertFalse(check_literal.called)
+            json_codecs.loads('{"params": {"name": "\\u00e9"}}')
+            self.assertFalse(check_literal.called)
+
+    def test_fallback(self):
+        for codec in self.codecs():
+            self.assertEqual(json_codecs.loads(json_codecs.dumps(
+                {'a': decimal.Decimal('1.5'), 2: 'b'}, codec)), {'a': 1.5, '2': 'b'})
+
+    def test_select(self):
+        self.assertEqual(json_codecs.select('simplejson').name, 'simplejson')
+        with self.assertRaises(ValueError):
+            json_codecs.select('yaml')
+
+    def test_default(self):
+        # ujson changes some values instead of failing, it has to be chosen
+        with mock.patch.object(json_codecs.UltraJsonCodec, 'available', True):
+            self.assertNotEqual(json_codecs.select().name, 'ujson')
+
+    def test_iterencode(self):
+        data = {'result': {'records': [{'id': i, 'tags': range(i % 3)} for i in range(250)],
+                           'length': 250, 2: 'b'}, 'id': 1}
+        for codec in self.codecs():
+            chunks = list(json_codecs.iterencode(data, codec, chunk_size=512, batch=100))
+            self.assertGreater(len(chunks), 1)
+            self.assertTrue(all(len(chunk) >= 512 for chunk in chunks[:-1]))
+            self.assertEqual(json_codecs.loads(''.join(chunks)),
+                             json_codecs.loads(json_codecs.dumps(data, codec)))
+            self.assertEqual(list(json_codecs.iterencode([], codec)), ['[]'])
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+from xml.etree import ElementTree
+
+import simplejson
+import unittest2
+
+from .. import qweb_compiler
+
+def compile_body(template):
+    """ Returns the lines of the compiled ``template`` between the try/catch
+    of the generated function
+    """
+    code = qweb_compiler.compile_template(ElementTree.fromstring(template))
+    body = code.split('/* START TEMPLATE */ try {\n', 1)[1].split('   /* END OF TEMPLATE */')[0]
+    return [line for line in body.split('\n') if line]
+
+class TestQwebCompiler(unittest2.TestCase):
+    def test_as_qweb2(self):
+        # as compiled by qweb2.js
+        self.assertEqual(compile_body(
+            '<t t-name="list"><ul t-if="items"><li t-foreach="items" t-as="item"'
+            ' t-att-class="item_parity"><t t-esc="item"/></li></ul></t>'), [
+            "\tif (dict['items']) {",
+            "\t\tr.push('<ul>');",
+            "\t\tcontext.engine.tools.foreach(context, dict['items'], 'item', dict, function(context, dict) {",
+            "\t\t\tr.push('<li');",
+            "\t\t\tr.push(context.engine.tools.gen_attribute(['class', (dict['item_parity'])]));",
+            "\t\t\tr.push('>');",
+            "\t\t\tr.push(context.engine.tools.html_escape(dict['item']));",
+            "\t\t\tr.push('</li>');",
+            "\t\t});",
+            "\t\tr.push('</ul>');",
+            "\t}",
+        ])
+
+    def test_expressions(self):
+        self.assertEqual(qweb_compiler.format_expression("a.b gt 1 and 'c d' or window.x"),
+                         "dict['a'].b > 1 && 'c d' || window.x")
+        self.assertEqual(qweb_compiler.string_interpolation("a #{b} c#d"),
+                         "'a ' + (dict['b']) + ' c' + '#d'")
+
+    def test_translation(self):
+        self.assertEqual(compile_body(
+            '<t t-name="a"><p title="Help">  Hello\n</p>'
+            '<p t-translation="off">Code</p><t t-set="label">Name</t></t>'), [
+            "\tr.push('<p');",
+            "\tr.push(context.engine.tools.gen_attribute(['title', context.engine.translate('Help')]));",
+            "\tr.push('>');",
+            "\tr.push('  ' + context.engine.translate('Hello') + '\\n');",
+            "\tr.push('</p><p>Code</p>');",
+            "\tdict['label'] = context.engine.translate('Name');",
+        ])
+
+    def test_templates(self):
+        source = ('<templates><t t-name="a">A</t><t t-name="b">B</t><t t-name="c">C</t>'
+                  '<t t-extend="b"><t t-jquery="p" t-operation="append">D</t></t>'
+                  '<t t-name="c" t-extend="a"/></templates>')
+        added, compiled = qweb_compiler.compile_templates(source).split('\n', 1)
+        self.assertEqual(added, 'openerp.web.qweb.add_template(%s);' % simplejson.dumps(source))
+        self.assertIn('"a": function (dict) {', compiled)
+        # extended and overridden by a copy of an other template
+        self.assertNotIn('"b"', compiled)
+        self.assertNotIn('"c"', compiled)
+        self.assertEqual(qweb_compiler.compile_templates(''), '')
@@ -3,6 +3,10 @@
 import random
 import unittest2
 
+import mock
+
+from .. import http
+from ..controllers import main
 from ..controllers.main import module_topological_sort as sort
 
 def sample(population):
@@ -32,3 +36,49 @@ class TestModulesLoading(unittest2.TestCase):
                     module, sorted_modules.index(module), deps, seen
                 ))
             seen.add(module)
+
+class Registry(object):
+    def __init__(self, rows):
+        self.cr = mock.MagicMock()
+        self.cr.fetchall.return_value = rows
+    def cursor(self):
+        cursor = mock.MagicMock()
+        cursor.__enter__.return_value = self.cr
+        return cursor
+
+class TestInstalledModules(unittest2.TestCase):
+    def setUp(self):
+        self.cache = main.InstalledModulesCache()
+        self.registry = Registry([
+            ('web_kanban', 'web'), ('web_graph', 'web'), ('web_graph', 'web_kanban'),
+            ('web', None)])
+        patcher = mock.patch.object(
+            main.openerp.modules.registry.RegistryManager, 'get',
+            staticmethod(lambda db: self.registry))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch.object(http, 'addons_manifest', dict.fromkeys(
+            ['web', 'web_kanban', 'web_graph', 'web_tests']))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_single_query(self):
+        self.assertEqual(self.cache.get('db'), ['web', 'web_kanban', 'web_graph'])
+        self.assertEqual(self.registry.cr.execute.call_count, 1)
+
+    def test_cached(self):
+        modules = self.cache.get('db')
+        modules.append('web_tests')
+        self.assertEqual(self.cache.get('db'), ['web', 'web_kanban', 'web_graph'])
+        self.assertEqual(self.registry.cr.execute.call_count, 1)
+
+    def test_registry_reloaded(self):
+        self.cache.get('db')
+        self.registry = Registry([('web', None)])
+        self.assertEqual(self.cache.get('db'), ['web'])
+
+    def test_invalidate(self):
+        self.cache.get('db')
+        self.cache.invalidate('db')
+        self.cache.get('db')
+        self.assertEqual(self.registry.cr.execute.call_count, 2)
@@ -0,0 +1,306 @@
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import tempfile
+import time
+
+import mock
+import unittest2
+
+from openerp.addons.web import http, session_stores
+
+class SessionStoreConformance(object):
+    """ Behaviour shared by all session stores, mixed into a test case per
+    backend implementing ``make_store()``
+    """
+    def setUp(self):
+        super(SessionStoreConformance, self).setUp()
+        self.path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.path)
+        self.store = self.make_store()
+
+    def make_store(self):
+        raise NotImplementedError()
+
+    def test_new(self):
+        session = self.store.new()
+        self.assertIsInstance(session, http.OpenERPSession)
+        self.assertTrue(session.new)
+        self.assertTrue(self.store.is_valid_key(session.sid))
+        self.assertIsNone(session.uid)
+        self.assertEqual(session.jsonp_requests, {})
+        self.assertNotEqual(session.sid, self.store.new().sid)
+
+    def test_roundtrip(self):
+        session = self.store.new()
+        session.db = 'db'
+        session.uid = 42
+        session.context['lang'] = 'fr_FR'
+        self.store.save(session)
+
+        loaded = self.store.get(session.sid)
+        self.assertIsInstance(loaded, http.OpenERPSession)
+        self.assertFalse(loaded.new)
+        self.assertFalse(loaded.modified)
+        self.assertEqual(loaded.sid, session.sid)
+        self.assertEqual(loaded.db, 'db')
+        self.assertEqual(loaded.uid, 42)
+        self.assertEqual(loaded.context, {'tz': 'UTC', 'uid': None, 'lang': 'fr_FR'})
+        self.assertEqual(dict(loaded), dict(session))
+
+    def test_unsaved_changes(self):
+        session = self.store.new()
+        session.db = 'db'
+        self.store.save(session)
+
+        loaded = self.store.get(session.sid)
+        loaded.db = 'other'
+        loaded.context['lang'] = 'fr_FR'
+        self.assertTrue(loaded.modified)
+
+        reloaded = self.store.get(session.sid)
+        self.assertEqual(reloaded.db, 'db')
+        self.assertNotIn('lang', reloaded.context)
+
+    def test_missing(self):
+        sid = self.store.generate_key()
+        session = self.store.get(sid)
+        self.assertEqual(session.sid, sid)
+        self.assertIsNone(session.db)
+
+    def test_invalid_key(self):
+        session = self.store.get('../../etc/passwd')
+        self.assertTrue(session.new)
+        self.assertNotEqual(session.sid, '../../etc/passwd')
+
+    def test_delete(self):
+        session = self.store.new()
+        session.db = 'db'
+        self.store.save(session)
+        self.store.delete(session)
+        self.assertIsNone(self.store.get(session.sid).db)
+        self.assertNotIn(session.sid, self.store.list())
+
+    def test_list(self):
+        sessions = [self.store.new() for _ in range(3)]
+        for session in sessions:
+            self.store.save(session)
+        self.assertItemsEqual(self.store.list(), [s.sid for s in sessions])
+
+    def test_vacuum(self):
+        old = self.store.new()
+        old.db = 'old'
+        self.store.save(old)
+        threshold = time.time() + 1
+        self.store.vacuum(threshold - 3600)
+        self.assertEqual(self.store.get(old.sid).db, 'old')
+        self.assertEqual(self.store.vacuum(threshold), 1)
+        self.assertIsNone(self.store.get(old.sid).db)
+
+    def test_touch(self):
+        session = self.store.new()
+        self.assertFalse(self.store.touch(session))
+        self.store.save(session)
+        self.assertFalse(self.store.touch(session, 60))
+        self.assertTrue(self.store.touch(session))
+        # a refreshed session does not expire
+        self.store.vacuum(time.time() - 1)
+        self.assertIn(session.sid, self.store.list())
+
+    def test_vacuum_limit(self):
+        sessions = [self.store.new() for _ in range(3)]
+        for session in sessions:
+            session.db = 'db'
+            self.store.save(session)
+            time.sleep(0.01)
+        self.assertEqual(self.store.vacuum(time.time() + 1, 2), 2)
+        # the oldest sessions go first
+        self.assertItemsEqual(self.store.list(), [sessions[2].sid])
+        self.assertEqual(self.store.vacuum(time.time() + 1, 2), 1)
+        self.assertEqual(self.store.vacuum(time.time() + 1, 2), 0)
+
+class TestFilesystemSessionStore(SessionStoreConformance, unittest2.TestCase):
+    def make_store(self):
+        return session_stores.backends['filesystem'](self.path, http.OpenERPSession)
+
+    def test_vacuum_other_process(self):
+        session = self.store.new()
+        session.db = 'db'
+        self.store.save(session)
+        # saved by an other process after being indexed here
+        other = self.make_store()
+        other.save(other.get(session.sid))
+        path = self.store.get_session_filename(session.sid)
+        os.utime(path, (time.time() + 60, time.time() + 60))
+        self.assertEqual(self.store.vacuum(time.time() + 1), 0)
+        self.assertEqual(self.store.get(session.sid).db, 'db')
+
+    def test_indexed_once_vacuumed(self):
+        # only the sweeping process indexes the sessions
+        self.store.save(self.store.new())
+        self.assertEqual(self.store._mtimes, {})
+        self.store.vacuum(0)
+        session = self.store.new()
+        self.store.save(session)
+        self.assertIn(session.sid, self.store._mtimes)
+
+class TestMemorySessionStore(SessionStoreConformance, unittest2.TestCase):
+    def make_store(self):
+        return session_stores.backends['memory'](self.path, http.OpenERPSession)
+
+    def test_lru(self):
+        self.store.max_entries = 2
+        a, b, c = [self.store.new() for _ in range(3)]
+        for session in (a, b):
+            session.db = 'db'
+            self.store.save(session)
+        # touch a so b is the least recently used
+        self.store.get(a.sid)
+        c.db = 'db'
+        self.store.save(c)
+        self.assertItemsEqual(self.store.list(), [a.sid, c.sid])
+
+class TestSQLiteSessionStore(SessionStoreConformance, unittest2.TestCase):
+    def make_store(self):
+        return session_stores.backends['sqlite'](self.path, http.OpenERPSession)
+
+    def test_shared(self):
+        session = self.store.new()
+        session.db = 'db'
+        self.store.save(session)
+        # e.g. another worker of a prefork server
+        other = self.make_store()
+        self.assertEqual(other.get(session.sid).db, 'db')
+        self.assertTrue(os.path.isfile(os.path.join(self.path, 'sessions.sqlite')))
+
+    def test_forked(self):
+        store = self.make_store()
+        # the connection creating the database is not kept for workers
+        self.assertFalse(hasattr(store._local, 'conn'))
+        conn = store._connection()
+        self.assertIs(store._connection(), conn)
+        with mock.patch('os.getpid', return_value=os.getpid() + 1):
+            self.assertIsNot(store._connection(), conn)
+
+class TestShardedSessionStore(unittest2.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.path)
+        self.flat = session_stores.FilesystemSessionStore(
+            self.path, session_class=http.OpenERPSession)
+        self.store = session_stores.FilesystemSessionStore(
+            self.path, session_class=http.OpenERPSession, shard_depth=2)
+
+    def test_layout(self):
+        session = self.store.new()
+        self.store.save(session)
+        self.assertEqual(
+            os.path.relpath(self.store.get_session_filename(session.sid), self.path),
+            os.path.join(session.sid[:2], session.sid[2:4], 'werkzeug_%s.sess' % session.sid))
+        self.assertTrue(os.path.isfile(self.store.get_session_filename(session.sid)))
+
+    def test_migrate_on_access(self):
+        session = self.flat.new()
+        session.db = 'db'
+        self.flat.save(session)
+
+        self.assertEqual(self.store.get(session.sid).db, 'db')
+        self.assertFalse(os.path.exists(self.flat.get_session_filename(session.sid)))
+        self.assertTrue(os.path.exists(self.store.get_session_filename(session.sid)))
+
+    def test_gc(self):
+        session = self.flat.new()
+        self.flat.save(session)
+        self.assertEqual(self.store.list(), [session.sid])
+        self.assertEqual(self.store.vacuum(time.time() + 1), 1)
+        self.assertEqual(self.store.list(), [])
+
+class TestSessionSweeper(unittest2.TestCase):
+    def setUp(self):
+        self.store = session_stores.MemorySessionStore(http.OpenERPSession)
+        self.sweeper = session_stores.SessionSweeper(
+            self.store, lifetime=60, interval=0, batch=2)
+
+    def test_sweep(self):
+        for _ in range(3):
+            self.store.save(self.store.new())
+        self.assertEqual(self.sweeper.sweep(), 0)
+        self.sweeper.lifetime = -1
+        self.assertEqual(self.sweeper.sweep(), 2)
+        self.assertEqual(self.sweeper.sweep(), 1)
+        self.assertEqual(self.sweeper.stats['sweeps'], 3)
+        self.assertEqual(self.sweeper.stats['expired'], 3)
+        self.assertGreaterEqual(self.sweeper.stats['max_duration'],
+                                self.sweeper.stats['last_duration'])
+
+    def test_disabled(self):
+        self.sweeper.ensure_started()
+        self.assertIsNone(self.sweeper._pid)
+
+    @unittest2.skipIf(session_stores.fcntl is None, "no file locks")
+    def test_elected(self):
+        path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, path)
+        lock_path = os.path.join(path, 'sweeper.lock')
+        # e.g. the sweepers of two workers
+        first, second = [session_stores.SessionSweeper(self.store, lock_path=lock_path)
+                         for _ in range(2)]
+        self.assertTrue(self.sweeper.elected())
+        self.assertTrue(first.elected())
+        self.assertTrue(first.elected())
+        self.assertFalse(second.elected())
+        # the process of the first one exits
+        first._lock_file.close()
+        self.assertTrue(second.elected())
+
+class TestSessionCodec(unittest2.TestCase):
+    def setUp(self):
+        self.codec = session_stores.SessionCodec(max_size=1024, jsonp_ttl=60)
+        self.session = http.OpenERPSession({}, 'sid', False)
+
+    def test_roundtrip(self):
+        self.session.saved_actions = {'next': 3, 'actions': {1: {'type': 'foo'}, 2: [1, 2]}}
+        self.session.context['lang'] = u'fr_FR'
+        payload = self.codec.dumps(self.session)
+        self.assertTrue(payload.startswith('OES1:'))
+        self.assertEqual(self.codec.loads(payload), dict(self.session))
+
+    def test_legacy(self):
+        import cPickle
+        self.session.db = 'db'
+        self.assertEqual(self.codec.loads(cPickle.dumps(dict(self.session), 2)),
+                         dict(self.session))
+        with self.assertRaises(ValueError):
+            self.codec.loads('OES42:{}')
+
+    def test_jsonp_ttl(self):
+        self.session.jsonp_requests = {
+            'fresh': [time.time(), 'r1'],
+            'stale': [time.time() - 120, 'r2'],
+            'legacy': 'r3',
+        }
+        data = self.codec.loads(self.codec.dumps(self.session))
+        self.assertEqual(data['jsonp_requests'].keys(), ['fresh'])
+
+    def test_budget(self):
+        self.session.jsonp_requests = {'1': [time.time(), 'x' * 600]}
+        self.session.saved_actions = {'next': 4, 'actions': dict(
+            (i, 'a' * 300) for i in range(1, 4))}
+        payload = self.codec.dumps(self.session)
+        self.assertLessEqual(len(payload), 1024)
+        data = self.codec.loads(payload)
+        self.assertEqual(data['jsonp_requests'], {})
+        self.assertEqual(data['saved_actions']['actions'].keys(), [2, 3])
+        # the session itself is left untouched
+        self.assertEqual(len(self.session.saved_actions['actions']), 3)
+
+    def test_stats(self):
+        self.codec.dumps(self.session)
+        self.session.context['lang'] = 'fr_FR'
+        self.codec.dumps(self.session)
+        stats = self.codec.stats
+        self.assertEqual(stats['saves'], 2)
+        self.assertGreater(stats['keys']['context'][1], stats['keys']['db'][1])
+        self.assertEqual(stats['max'], len(self.codec.dumps(self.session)))
+        self.assertEqual(sorted(self.codec.sizes(self.session)),
+                         ['context', 'db', 'jsonp_requests', 'login', 'password', 'uid'])